@@ -1,23 +1,149 @@
 from django.contrib import admin
+from django.contrib.admin.views.main import ChangeList
+from django.contrib.contenttypes.models import ContentType
+from django.utils.translation import ugettext_lazy as _
 
-from ratings import models
+from ratings import models, managers
+from ratings.handlers import ratings
 
-class ScoreAdmin(admin.ModelAdmin):
-    list_display = ('content_object', 'key', 'average', 'total', 'num_votes')
-    list_filter = ('content_type',)
+
+class ContentsChangeList(ChangeList):
+    """
+    Changelist retreiving in bulk the content objects of the scores
+    or votes in the current page (one query for each content type).
+    """
+    def get_results(self, request):
+        super(ContentsChangeList, self).get_results(request)
+        if not self.list_editable:
+            self.result_list = managers.resolve_contents(self.result_list,
+                keep_orphans=True)
+
+
+class RatedContentTypeFilter(admin.SimpleListFilter):
+    """
+    Filter scores or votes by content type, listing only the models
+    registered for ratings (filtering uses the content type index).
+    """
+    title = _('content type')
+    parameter_name = 'content_type__id__exact'
+
+    def lookups(self, request, model_admin):
+        content_types = [managers.get_content_type_for_model(i)
+            for i in ratings._registry]
+        return sorted((i.id, unicode(i)) for i in content_types)
+
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(content_type=self.value())
+        return queryset
+
+
+class RatingKeyFilter(admin.SimpleListFilter):
+    """
+    Filter scores or votes by rating key, listing the registered keys.
+    """
+    title = _('key')
+    parameter_name = 'key'
+
+    def lookups(self, request, model_admin):
+        return [(i, i) for i in models.RatingKey.objects.order_by(
+            'name').values_list('name', flat=True)]
+
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(key=self.value())
+        return queryset
+
+
+class RatingsAdmin(admin.ModelAdmin):
+    """
+    Base admin for scores and votes.
+    """
+    list_select_related_fields = ('content_type',)
+
+    def queryset(self, request):
+        queryset = super(RatingsAdmin, self).queryset(request)
+        return queryset.select_related(*self.list_select_related_fields)
+
+    def get_changelist(self, request, **kwargs):
+        return ContentsChangeList
+
+    def update_scores(self, targets):
+        """
+        Recalculate once the scores of the given *targets*, a sequence
+        of *(content_type_id, object_id, key)* tuples.
+        """
+        targets = set(targets)
+        for content_type_id, object_id, key in targets:
+            content_type = ContentType.objects.get_for_id(content_type_id)
+            ratings.update_score((content_type, object_id), key)
+        return len(targets)
+
+
+class ScoreAdmin(RatingsAdmin):
+    list_display = ('content_object', 'key', 'average', 'total', 'num_votes',
+        'ranking')
+    list_filter = (RatedContentTypeFilter, RatingKeyFilter)
     ordering = ('-average', '-num_votes')
-    search_fields = ('key',)
-    readonly_fields = ('average', 'total', 'num_votes')
-    
+    readonly_fields = ('average', 'total', 'num_votes', 'ranking')
+    actions = ['recalculate_scores', 'purge_scores']
+
+    def recalculate_scores(self, request, queryset):
+        targets = queryset.values_list('content_type', 'object_id', 'key')
+        count = self.update_scores(targets)
+        self.message_user(request, _('%d scores were recalculated.') % count)
+    recalculate_scores.short_description = _('Recalculate selected scores')
+
+    def purge_scores(self, request, queryset):
+        """
+        Delete the selected scores and their votes, with one query for each
+        content type and key.
+        """
+        groups = {}
+        for content_type_id, object_id, key in queryset.values_list(
+            'content_type', 'object_id', 'key'):
+            groups.setdefault((content_type_id, key), set()).add(object_id)
+        for (content_type_id, key), object_ids in groups.items():
+            lookups = {
+                'content_type': content_type_id,
+                'key': key,
+                'object_id__in': list(object_ids),
+            }
+            models.Vote.objects.filter(**lookups).delete()
+            models.delete_scores(models.Score.objects.filter(**lookups))
+        count = sum(len(i) for i in groups.values())
+        self.message_user(request,
+            _('%d scores and their votes were deleted.') % count)
+    purge_scores.short_description = _('Delete selected scores and their votes')
+
 admin.site.register(models.Score, ScoreAdmin)
 
 
-class VoteAdmin(admin.ModelAdmin):
-    list_display = ('content_object', 'key', 'user', 'score', 
+class VoteAdmin(RatingsAdmin):
+    list_display = ('content_object', 'key', 'user', 'score',
         'created_at', 'modified_at')
-    list_filter = ('content_type', 'created_at', 'modified_at')
+    list_filter = (RatedContentTypeFilter, RatingKeyFilter, 'modified_at')
+    list_select_related_fields = ('content_type', 'user')
     ordering = ('-modified_at',)
-    search_fields = ('user', 'key')
+    search_fields = ('user__username',)
     readonly_fields = ('user',)
+    actions = ['recalculate_scores', 'purge_votes']
+
+    def recalculate_scores(self, request, queryset):
+        targets = queryset.values_list('content_type', 'object_id', 'key')
+        count = self.update_scores(targets)
+        self.message_user(request, _('%d scores were recalculated.') % count)
+    recalculate_scores.short_description = _(
+        'Recalculate scores of selected votes')
+
+    def purge_votes(self, request, queryset):
+        """
+        Delete the selected votes, and recalculate once each related score.
+        """
+        targets = list(queryset.values_list('content_type', 'object_id', 'key'))
+        queryset.delete()
+        self.update_scores(targets)
+        self.message_user(request, _('%d votes were deleted.') % len(targets))
+    purge_votes.short_description = _('Delete selected votes and update scores')
 
 admin.site.register(models.Vote, VoteAdmin)
@@ -0,0 +1,122 @@
+"""
+Vote archival.
+
+Old votes only matter for the scores of their target objects: moving
+them out of the *Vote* table keeps the table and its indexes small.
+Archived votes are stored in the compact *ArchivedVote* table (ip
+addresses are not archived), and keep contributing to scores and score
+statistics as long as the *GENERIC_RATINGS_ARCHIVE_VOTES* setting is True.
+
+Handlers having *archive_fallback* set to True look for archived votes
+in *has_voted* and *get_vote*. A voter voting again an object replaces
+the archived vote, and archiving a vote replaces the older archived vote
+given by the same voter to the same object, if any.
+
+Votes are archived in chunks, each one in its own transaction, by
+*archive_votes*, usually called by the *archive_votes* management command.
+"""
+from __future__ import with_statement
+
+import time
+
+from django.db import transaction
+from django.db.models import Q
+from django.contrib.contenttypes.models import ContentType
+
+from ratings import settings, models, triggers, exceptions
+from ratings.handlers import ratings
+from ratings.buffer import _get_identity
+
+# the number of votes archived in a transaction
+CHUNK_SIZE = 1000
+
+def _delete_replaced(votes):
+    """
+    Delete the archived votes given by the voters of *votes* to the same
+    target objects using the same keys.
+    Return the set of *(content_type_id, object_id, key)* targets whose
+    archived votes were deleted.
+    """
+    groups = {}
+    for vote in votes:
+        group = groups.setdefault((vote.content_type_id, vote.key),
+            (set(), set(), set()))
+        group[0].add(vote.object_id)
+        if vote.user_id:
+            group[1].add(vote.user_id)
+        else:
+            group[2].add(vote.cookie)
+    identities = set(_get_identity(i) for i in votes)
+    ids, targets = [], set()
+    for (content_type_id, key), (object_ids, user_ids, cookies) in groups.items():
+        voters = Q()
+        if user_ids:
+            voters |= Q(user__in=user_ids)
+        if cookies:
+            voters |= Q(user__isnull=True, cookie__in=cookies)
+        queryset = models.ArchivedVote.objects.filter(voters,
+            content_type=content_type_id, key=key, object_id__in=object_ids)
+        # the query can match other voter/target pairs: filter them out
+        for archived in queryset:
+            identity = _get_identity(archived)
+            if identity in identities:
+                ids.append(archived.id)
+                targets.add(identity[:3])
+    if ids:
+        models.ArchivedVote.objects.filter(id__in=ids).delete()
+    return targets
+
+def _archive_chunk(cutoff, chunk_size):
+    """
+    Move at most *chunk_size* votes not modified since *cutoff* to the
+    archive. Return the number of archived votes.
+    """
+    with transaction.commit_on_success():
+        votes = list(models.Vote.objects.filter(modified_at__lt=cutoff
+            ).order_by('modified_at', 'id')[:chunk_size])
+        if not votes:
+            return 0
+        # archived votes are unique for each voter, target object and key
+        targets = _delete_replaced(votes)
+        models.ArchivedVote.objects.bulk_create([models.ArchivedVote(
+            content_type_id=i.content_type_id, object_id=i.object_id,
+            key=i.key, score=i.score, user_id=i.user_id, cookie=i.cookie,
+            created_at=i.created_at, modified_at=i.modified_at)
+            for i in votes])
+        models.Vote.objects.filter(id__in=[i.id for i in votes]).delete()
+        # scores still count the replaced archived votes
+        if triggers.is_installed(models.Vote.objects.db):
+            # triggers removed archived votes from scores: put them back
+            targets.update((i.content_type_id, i.object_id, i.key)
+                for i in votes)
+        for content_type_id, object_id, key in targets:
+            content_type = ContentType.objects.get_for_id(content_type_id)
+            handler = ratings.get_handler(content_type.model_class())
+            weight = getattr(handler, 'weight', 0)
+            counter = key in getattr(handler, 'counter_keys', ())
+            models.upsert_score((content_type, object_id), key,
+                weight=weight, counter=counter, 
+                ranking=getattr(handler, 'get_ranking', None))
+    return len(votes)
+
+def archive_votes(cutoff, chunk_size=CHUNK_SIZE, pause=0):
+    """
+    Move to the archive all the votes not modified since the datetime
+    *cutoff*, *chunk_size* votes at a time, waiting *pause* seconds after
+    each chunk. Return the number of archived votes.
+
+    Raise *ArchiveDisabled* if the *GENERIC_RATINGS_ARCHIVE_VOTES* setting
+    is False: in this case scores would lose archived votes as soon as
+    they are recalculated.
+    """
+    if not settings.ARCHIVE_VOTES:
+        raise exceptions.ArchiveDisabled(
+            'Set GENERIC_RATINGS_ARCHIVE_VOTES to True to archive votes.')
+    archived = 0
+    while True:
+        count = _archive_chunk(cutoff, chunk_size)
+        if not count:
+            return archived
+        archived += count
+        if pause:
+            time.sleep(pause)
@@ -0,0 +1,170 @@
+"""
+Write-behind voting.
+
+Handlers having *buffer_votes* set to True do not write votes directly:
+each vote is appended to the *BufferedVote* table and the voting view
+returns at once, using an optimistic score. The functions in this module
+move buffered votes to the *Vote* table in batches, and are usually called
+by the *flush_votes* management command.
+
+Guarantees:
+
+    - buffered votes are applied in the order they were received, and
+      only the latest entry given by a voter to a target object using a
+      key is taken into account: double submissions collapse into one vote
+    - flushed votes keep the time they were buffered, used by rollups 
+      and trending values
+    - each batch is applied and removed from the buffer in a single
+      transaction: if the flusher crashes the batch is rolled back and
+      processed again by the next run; scores are recalculated from
+      the votes table, so applying a batch again is harmless
+    - only one flusher should run at a time; where the database supports
+      it, buffered rows are locked using *SELECT ... FOR UPDATE*
+"""
+from __future__ import with_statement
+
+from django.db import connections, transaction
+from django.db.models import Q, AutoField
+from django.contrib.contenttypes.models import ContentType
+from django.utils.datastructures import SortedDict
+
+from ratings import models, rollups
+from ratings.handlers import ratings
+
+def _get_identity(vote):
+    """
+    Return a tuple identifying the voter, target object and key of
+    the given (buffered or not) *vote*.
+    """
+    if vote.user_id:
+        voter = (vote.user_id, None)
+    else:
+        voter = (None, vote.cookie)
+    return (vote.content_type_id, vote.object_id, vote.key) + voter
+
+def _get_handler(content_type_id):
+    content_type = ContentType.objects.get_for_id(content_type_id)
+    return ratings.get_handler(content_type.model_class())
+
+def _update_score(content_type_id, object_id, key):
+    """
+    Recalculate the score of the given target, using its handler if any.
+    """
+    content_type = ContentType.objects.get_for_id(content_type_id)
+    handler = ratings.get_handler(content_type.model_class())
+    if handler is None:
+        models.upsert_score((content_type, object_id), key)
+    else:
+        handler.update_score((content_type, object_id), key)
+
+def _get_existing_votes(entries):
+    """
+    Return a dict mapping identities to the existing votes matching
+    buffered *entries*.
+    """
+    groups = {}
+    for entry in entries:
+        group = groups.setdefault((entry.content_type_id, entry.key),
+            (set(), set(), set()))
+        group[0].add(entry.object_id)
+        if entry.user_id:
+            group[1].add(entry.user_id)
+        else:
+            group[2].add(entry.cookie)
+    existing = {}
+    for (content_type_id, key), (object_ids, user_ids, cookies) in groups.items():
+        voters = Q()
+        if user_ids:
+            voters |= Q(user__in=user_ids)
+        if cookies:
+            voters |= Q(user__isnull=True, cookie__in=cookies)
+        queryset = models.Vote.objects.filter(voters,
+            content_type=content_type_id, key=key, object_id__in=object_ids)
+        for vote in queryset:
+            existing[_get_identity(vote)] = vote
+    return existing
+
+def _insert_votes(votes):
+    """
+    Insert the new *votes* in bulk, keeping their creation and
+    modification times (*bulk_create* would set them to the current time).
+    """
+    manager = models.Vote._base_manager
+    using = manager.db
+    fields = [i for i in models.Vote._meta.local_fields
+        if not isinstance(i, AutoField)]
+    batch_size = max(connections[using].ops.bulk_batch_size(fields, votes), 1)
+    for start in range(0, len(votes), batch_size):
+        manager._insert(votes[start:start + batch_size], fields=fields,
+            using=using, raw=True)
+
+def flush_batch(batch_size=500):
+    """
+    Move at most *batch_size* buffered votes to the votes table, and
+    recalculate once each related score.
+    Return the number of processed buffered votes.
+    """
+    with transaction.commit_on_success():
+        entries = list(models.BufferedVote.objects.select_for_update(
+            ).order_by('id')[:batch_size])
+        if not entries:
+            return 0
+        # only the latest entry for each voter/target/key is applied
+        latest = SortedDict()
+        for entry in entries:
+            latest[_get_identity(entry)] = entry
+        existing = _get_existing_votes(latest.values())
+        new_votes, deleted_ids = [], []
+        # tuples (vote, old score, deleted) used to update rollups and
+        # trending values
+        changes = []
+        for identity, entry in latest.items():
+            vote = existing.get(identity)
+            if not entry.score:
+                # a buffered deletion
+                if vote is not None:
+                    deleted_ids.append(vote.id)
+                    changes.append((vote, None, True))
+            elif vote is None:
+                vote = models.Vote(
+                    content_type_id=entry.content_type_id,
+                    object_id=entry.object_id, key=entry.key,
+                    score=entry.score, user_id=entry.user_id,
+                    ip_address=entry.ip_address, cookie=entry.cookie,
+                    created_at=entry.created_at, modified_at=entry.created_at)
+                new_votes.append(vote)
+                changes.append((vote, None, False))
+            elif vote.score != entry.score:
+                models.Vote.objects.filter(pk=vote.pk).update(
+                    score=entry.score, ip_address=entry.ip_address,
+                    modified_at=entry.created_at)
+                changes.append((vote, vote.score, False))
+                vote.score = entry.score
+        if deleted_ids:
+            models.Vote.objects.filter(id__in=deleted_ids).delete()
+        if new_votes:
+            _insert_votes(new_votes)
+        # one score recalculation per target object and key
+        for target in set(i[:3] for i in latest):
+            _update_score(*target)
+        for vote, old_score, deleted in changes:
+            handler = _get_handler(vote.content_type_id)
+            if getattr(handler, 'rollup_votes', False):
+                rollups.record_vote(vote, old_score=old_score, deleted=deleted)
+            if old_score is None and hasattr(handler, 'update_trending'):
+                handler.update_trending(vote, deleted=deleted)
+        models.BufferedVote.objects.filter(
+            id__in=[i.id for i in entries]).delete()
+    return len(entries)
+
+def flush(batch_size=500):
+    """
+    Move all buffered votes to the votes table, *batch_size* votes at a time.
+    Return the number of processed buffered votes.
+    """
+    flushed = 0
+    while True:
+        count = flush_batch(batch_size)
+        if not count:
+            return flushed
+        flushed += count
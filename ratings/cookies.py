@@ -24,4 +24,26 @@ def get_value(ip_address):
     Return a cookie value for an anonymous vote.
     """
     now = datetime.datetime.now().strftime('%Y%m%d%H%M%S%f')
-    return salted_hmac("gr.cookie", "%s-%s" % (now, ip_address)).hexdigest()
\ No newline at end of file
+    return salted_hmac("gr.cookie", "%s-%s" % (now, ip_address)).hexdigest()
+
+def get_voter_value(voter):
+    """
+    Return the signed value of the voter cookie for the given *voter*,
+    i.e. the cookie value stored in the votes of an anonymous voter.
+    """
+    signature = salted_hmac("gr.voter", voter).hexdigest()
+    return '%s:%s' % (voter, signature)
+
+def get_voter(cookies, name):
+    """
+    Return the voter stored in the signed voter cookie *name* of the
+    *cookies* dict. Return None if the cookie is missing or tampered.
+    """
+    value = cookies.get(name)
+    if not value or ':' not in value:
+        return None
+    voter, signature = value.rsplit(':', 1)
+    expected = salted_hmac("gr.voter", voter).hexdigest()
+    if constant_time_compare(signature, expected):
+        return voter
+    return None
@@ -22,4 +22,17 @@ class DataError(RatingsError):
     """
     Something went really wrong...
     """
-    pass
\ No newline at end of file
+    pass
+
+class UnsupportedDatabase(RatingsError):
+    """
+    Raised when a feature is not available for the database in use.
+    """
+    pass
+
+class ArchiveDisabled(RatingsError):
+    """
+    Raised when votes are archived but archived votes are not taken into
+    account by scores (see the *GENERIC_RATINGS_ARCHIVE_VOTES* setting).
+    """
+    pass
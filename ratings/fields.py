@@ -0,0 +1,205 @@
+import socket
+import threading
+
+from django import forms
+from django.db import models, transaction
+from django.core import exceptions
+from django.utils.importlib import import_module
+
+# IPv4 addresses are stored as IPv4-mapped IPv6 addresses (::ffff:0:0/96)
+IPV4_PREFIX = '\x00' * 10 + '\xff\xff'
+
+def pack_ip_address(address):
+    """
+    Return the 16 bytes representing the given IPv4 or IPv6 *address*.
+    Raise a *ValueError* if the address is not valid.
+    """
+    try:
+        if ':' in address:
+            return socket.inet_pton(socket.AF_INET6, address)
+        return IPV4_PREFIX + socket.inet_pton(socket.AF_INET, address)
+    except (socket.error, TypeError):
+        raise ValueError('Invalid ip address: %r' % address)
+
+def unpack_ip_address(packed):
+    """
+    Return the textual representation of the *packed* ip address
+    (see *pack_ip_address*).
+    """
+    if packed.startswith(IPV4_PREFIX):
+        return socket.inet_ntop(socket.AF_INET, packed[12:])
+    return socket.inet_ntop(socket.AF_INET6, packed)
+
+
+class PackedIPAddressField(models.Field):
+    """
+    An IPv4 or IPv6 address stored in the database as 16 bytes
+    (IPv4 addresses are mapped to IPv6), and available in Python as
+    a string, e.g. *'10.0.0.1'* or *'2001:db8::1'*.
+
+    Packed addresses take less than half the space of their textual
+    representation, and can be compared, so that all the addresses in
+    a network can be selected using a range lookup, e.g.::
+
+        Vote.objects.filter(ip_address__range=('10.0.0.0', '10.255.255.255'))
+    """
+    __metaclass__ = models.SubfieldBase
+    description = 'IP address (packed)'
+
+    def db_type(self, connection):
+        return {
+            'postgresql': 'bytea',
+            'mysql': 'varbinary(16)',
+            'oracle': 'RAW(16)',
+        }.get(connection.vendor, 'blob')
+
+    def to_python(self, value):
+        if value is None or value == '':
+            return None
+        if isinstance(value, buffer):
+            return unpack_ip_address(str(value))
+        try:
+            pack_ip_address(value)
+        except ValueError:
+            if len(value) == 16:
+                # a packed address, retreived from the database
+                return unpack_ip_address(value)
+            raise exceptions.ValidationError('Enter a valid IP address.')
+        return value
+
+    def get_prep_value(self, value):
+        value = self.to_python(value)
+        if value is None:
+            return None
+        return pack_ip_address(value)
+
+    def get_db_prep_value(self, value, connection, prepared=False):
+        if not prepared:
+            value = self.get_prep_value(value)
+        if value is None:
+            return None
+        # each database backend module exposes its DB-API driver
+        database = import_module(connection.__module__).Database
+        return database.Binary(value)
+
+    def value_to_string(self, obj):
+        return self._get_val_from_obj(obj) or ''
+
+    def formfield(self, **kwargs):
+        defaults = {'form_class': forms.GenericIPAddressField}
+        defaults.update(kwargs)
+        return super(PackedIPAddressField, self).formfield(**defaults)
+
+
+# rating keys cache: key names mapped to ids and vice versa
+_key_ids = {}
+_key_names = {}
+
+# names of the keys registered by the current thread inside a pending
+# transaction: they are not cached, since the transaction can still be 
+# rolled back, until a load following the end of the transaction
+_local = threading.local()
+
+def _get_uncommitted():
+    from ratings.models import RatingKey
+    using = RatingKey.objects.db
+    if (not hasattr(_local, 'names') or not transaction.is_managed(using) 
+        or not transaction.is_dirty(using)):
+        _local.names = set()
+    return _local.names
+
+def _load_keys():
+    """
+    Cache all the committed keys, and return a dict mapping the names of
+    all the keys visible to the current transaction to their ids.
+    """
+    from ratings.models import RatingKey
+    uncommitted = _get_uncommitted()
+    keys = dict(RatingKey.objects.values_list('name', 'id'))
+    for name, pk in keys.items():
+        if name not in uncommitted:
+            _key_ids[name] = pk
+            _key_names[pk] = name
+    return keys
+
+def get_key_id(name, create=True):
+    """
+    Return the id of the rating key *name*, using the in-process cache.
+    The key is registered if it does not exist, unless *create* is False:
+    in this case None is returned.
+    """
+    if name in _key_ids:
+        return _key_ids[name]
+    pk = _load_keys().get(name)
+    if pk is None and create:
+        from ratings.models import RatingKey
+        key, created = RatingKey.objects.get_or_create(name=name)
+        pk = key.pk
+        if created and transaction.is_managed(using=RatingKey.objects.db):
+            _get_uncommitted().add(name)
+        else:
+            _key_ids[name] = pk
+            _key_names[pk] = name
+    return pk
+
+def get_key_name(pk):
+    """
+    Return the name of the rating key having the given id *pk*.
+    Names are returned unchanged.
+    """
+    if not isinstance(pk, (int, long)) or pk in _key_names:
+        return _key_names.get(pk, pk)
+    for name, key_id in _load_keys().items():
+        if key_id == pk:
+            return name
+    return pk
+
+
+class RatingKeyField(models.Field):
+    """
+    A rating key, e.g. *'main'*, available in Python as a string and stored
+    in the database as the small integer id of the key in the *RatingKey*
+    registry table. Keys are registered when first saved, and the mapping
+    between names and ids is cached in-process once committed.
+
+    Only *exact*, *in* and *isnull* lookups are supported.
+    """
+    __metaclass__ = models.SubfieldBase
+    description = 'Rating key (normalized)'
+
+    def get_internal_type(self):
+        return 'PositiveSmallIntegerField'
+
+    def to_python(self, value):
+        return get_key_name(value)
+
+    def get_prep_value(self, value):
+        if value is None or isinstance(value, (int, long)):
+            return value
+        return get_key_id(value)
+
+    def _get_lookup_id(self, value):
+        if isinstance(value, (int, long)):
+            return value
+        # unknown keys do not match any row (ids start from 1)
+        return get_key_id(value, create=False) or 0
+
+    def get_prep_lookup(self, lookup_type, value):
+        if hasattr(value, 'prepare') or hasattr(value, '_prepare'):
+            return super(RatingKeyField, self).get_prep_lookup(lookup_type,
+                value)
+        if lookup_type == 'exact':
+            return self._get_lookup_id(value)
+        if lookup_type == 'in':
+            return [self._get_lookup_id(i) for i in value]
+        if lookup_type == 'isnull':
+            return value
+        raise TypeError('Lookup type %r not supported.' % lookup_type)
+
+    def value_to_string(self, obj):
+        return self._get_val_from_obj(obj)
+
+    def formfield(self, **kwargs):
+        defaults = {'form_class': forms.CharField, 'max_length': 16}
+        defaults.update(kwargs)
+        return super(RatingKeyField, self).formfield(**defaults)
@@ -40,12 +40,13 @@ class VoteForm(forms.Form):
     honeypot = forms.CharField(required=False, widget=forms.HiddenInput)
 
     def __init__(self, target_object, key, score_range=None, score_step=None,
-        can_delete_vote=None, data=None, initial=None):
+        can_delete_vote=None, data=None, initial=None, voter_cookie_name=None):
         self.target_object = target_object
         self.key = key
         self.score_range = score_range
         self.score_step = score_step
         self.can_delete_vote = can_delete_vote
+        self.voter_cookie_name = voter_cookie_name
         if initial is None:
             initial = {}
         initial.update(self.generate_security_data())
@@ -224,6 +225,10 @@ class VoteForm(forms.Form):
                 raise exceptions.DataError('Invalid ip address')
             cookie_name = cookies.get_name(self.target_object, self.key)
             cookie_value = request.COOKIES.get(cookie_name)
+            if not cookie_value and self.voter_cookie_name:
+                # all the votes of the voter share the signed voter cookie
+                cookie_value = cookies.get_voter(request.COOKIES, 
+                    self.voter_cookie_name)
             if cookie_value:
                 # the user maybe voted this object (it has a cookie)
                 lookups.update({'cookie': cookie_value, 'user__isnull':True})
@@ -332,7 +337,13 @@ class StarVoteForm(VoteForm):
 
 
 class LikeVoteForm(VoteForm):
+    """
+    Handle voting using a like widget.
     
+    Like ratings have only one meaningful value: the number of votes.
+    Add the rating key to the handler's *counter_keys* to store them 
+    as simple counters.
+    """
     def get_score_widget(self, score_range, score_step, can_delete_vote):
         return LikeWidget(score_range[0], score_range[1], 
             instance=self.target_object, can_delete_vote=can_delete_vote)
\ No newline at end of file
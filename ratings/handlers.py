@@ -1,8 +1,32 @@
+from __future__ import with_statement
+
+import copy
+import array
+import time
+import datetime
+import bisect
+import threading
+from contextlib import contextmanager
+
+from django.core.cache import cache
+from django.http import SimpleCookie
+from django.contrib.contenttypes.models import ContentType
 from django.db import IntegrityError
+from django.db.models import F
+from django.db.models.query import EmptyQuerySet
+from django.db.models.sql.datastructures import EmptyResultSet
+from django.utils.hashcompat import md5_constructor
+from django.utils.encoding import smart_str
 from django.db.models.base import ModelBase
 from django.db.models.signals import pre_delete as pre_delete_signal
 
-from ratings import settings, models, forms, exceptions, signals, cookies
+from ratings import settings, models, managers, forms, exceptions, signals
+from ratings import cookies, triggers, fields, rollups, snapshots
+from ratings import ranking as rankings
+
+# the score fields leaderboards can be ordered by
+LEADERBOARD_ORDERS = ('average', 'total', 'num_votes', 'ranking', 
+    'trending_rank')
 
 class RatingHandler(object):
     """
@@ -83,6 +107,13 @@ class RatingHandler(object):
         if anonymous rating is allowed, you can define here the cookie max age
         as a number of seconds (default: one year)
         
+    .. py:attribute:: voter_cookie_name
+    
+        if anonymous rating is allowed, set this to a cookie name to identify
+        anonymous voters using a single signed cookie, shared by all their
+        votes, instead of a cookie for each voted object; cookies set 
+        before are still honoured (default: *None*)
+        
     .. py:attribute:: success_messages
     
         this should be a sequence of (vote created, vote changed, vote deleted)
@@ -90,6 +121,142 @@ class RatingHandler(object):
         user after a successful vote creation, change, deletion 
         (scored without using AJAX)
         if this is None, then no message is sent (default: *None*)
+        
+    .. py:attribute:: buffer_votes
+    
+        set to True to enable write-behind voting: votes and vote deletions
+        are appended to a buffer table and the user gets an optimistic 
+        response at once; buffered votes are written to the votes table
+        later, in batches, by the *flush_votes* management command
+        (see *ratings.buffer*); votes still in the buffer are taken into
+        account by *get_vote*, *pre_vote* (see *can_change_vote*) and 
+        the *votes_per_ip_address* check (default: *False*)
+        
+    .. py:attribute:: rollup_votes
+    
+        set to True to count votes in time buckets as they are given, in 
+        order to calculate trends and averages over time windows (see 
+        *ratings.rollups*); old buckets are compacted by the *rollup_votes*
+        management command (default: *False*)
+        
+    .. py:attribute:: counter_keys
+    
+        a sequence of rating keys handled as simple counters, e.g. like
+        ratings using *LikeVoteForm*: only the number of votes is stored 
+        and it is atomically incremented or decremented, while average and
+        total scores are not calculated (default: *()*)
+        
+    .. py:attribute:: signal_unchanged_votes
+    
+        a vote submitted again with the same score (e.g. after a double 
+        click) is not saved and the score is not recalculated; set this to
+        True if you still want the vote signals to be sent in this case
+        (default: *False*)
+        
+    .. py:attribute:: idempotency_timeout
+    
+        the number of seconds the response to a vote is cached: requests 
+        retried using the same idempotency token (sent by the client in 
+        the *idempotency_token* POST parameter or in the *X-Idempotency-Key*
+        header) are answered using the cached response without voting again;
+        tokens are bound to the voter, the target object and the key, and
+        cookies are not replayed (default: 10 minutes, 0 means idempotency 
+        tokens are ignored)
+        
+    .. py:attribute:: voted_cache_timeout
+    
+        the number of seconds the set of the target objects voted by a user
+        using a key is cached (see *get_voted_ids*): if set, *has_voted*
+        and *has_voted_many* do not query the database for authenticated 
+        users; the cached sets are updated by the voting process, while 
+        votes deleted in bulk (e.g. purged) are taken into account only
+        when the sets expire (default: *0*, means no cache)
+        
+    .. py:attribute:: ranking
+    
+        the ranking stored in scores, used to sort target objects taking 
+        into account the number of votes too (see *ratings.ranking*): 
+        *'bayesian'* for the Bayesian average (see *ranking_prior_votes*),
+        *'wilson'* for the lower bound of the Wilson score interval, or
+        a callable taking the score and returning its ranking (use 
+        *staticmethod* in class definitions); rankings of counter keys are
+        always the number of votes (default: *None*, means the average 
+        score)
+        
+    .. py:attribute:: ranking_prior_votes
+    
+        the number of votes equal to the average of all the votes (given 
+        to the same model using the same key) added to each score by 
+        the *'bayesian'* ranking (default: *10*)
+        
+    .. py:attribute:: trending_half_life
+    
+        the number of seconds after which the contribution of a vote to the 
+        trending value of its score is halved: if set, each vote given or 
+        deleted updates the trending value of the score, and leaderboards
+        can be sorted by *trending_rank* (see *get_trending*) 
+        (default: *None*, means trending values are not maintained)
+        
+    .. py:attribute:: score_fields
+    
+        a dict mapping the names of fields of the rated model to tuples
+        *(key, score field)*, e.g. ``{'rating_average': ('main', 'average'),
+        'rating_count': ('main', 'num_votes')}``: the fields are kept in 
+        sync with the scores by the voting process, so that the rated model
+        can be sorted and filtered without querying the scores table (add 
+        indexes to the fields as needed); fields drifted because scores 
+        were changed by other means are repaired by the 
+        *rebuild_score_fields* management command (default: *None*)
+        
+    .. py:attribute:: facet_counts_timeout
+    
+        the number of seconds the results of *facet_counts* are cached;
+        cached results are invalidated each time a score of the same key 
+        is updated by the voting process (default: *300*, 0 means no 
+        cache)
+        
+    .. py:attribute:: snapshot_refresh_interval
+    
+        the minimum number of seconds between the refreshes of the score
+        snapshots returned by *get_snapshot*: each refresh only reads the 
+        scores changed since the previous one (default: *10*)
+        
+    .. py:attribute:: snapshot_rebuild_interval
+    
+        the number of seconds after which score snapshots are fully 
+        reloaded, dropping the scores deleted in the meantime 
+        (default: one hour)
+        
+    .. py:attribute:: key_stats_timeout
+    
+        the number of seconds the statistics of each key (see 
+        *get_key_stats*) are cached (default: *60*, 0 means no cache)
+        
+    .. py:attribute:: leaderboard_size
+    
+        the number of scores stored in each leaderboard served by *get_top*
+        (default: *100*)
+        
+    .. py:attribute:: leaderboard_timeout
+    
+        the number of seconds leaderboards are cached; leaderboards are
+        updated by the voting process, and can be periodically rebuilt 
+        using the *rebuild_leaderboards* management command 
+        (default: one day)
+        
+    .. py:attribute:: defer_cleanup
+    
+        set to True to leave the votes and scores of deleted target objects
+        in place, and hand their removal to *schedule_cleanup*, e.g. to run 
+        it in a background job (default: *False*)
+        
+    .. py:attribute:: archive_fallback
+    
+        set to True to look for archived votes (see *ratings.archive*) when
+        a vote is not found by *has_voted* and *get_vote* 
+        (default: *False*); voting again an object always replaces the 
+        archived vote if this is True or *GENERIC_RATINGS_ARCHIVE_VOTES* 
+        is True
     
         
     For situations where the built-in options listed above are not sufficient, 
@@ -107,14 +274,35 @@ class RatingHandler(object):
     next_querystring_key = settings.NEXT_QUERYSTRING_KEY
     votes_per_ip_address = settings.VOTES_PER_IP_ADDRESS
     cookie_max_age = settings.COOKIE_MAX_AGE
+    voter_cookie_name = settings.VOTER_COOKIE_NAME
+    idempotency_timeout = settings.IDEMPOTENCY_TIMEOUT
+    voted_cache_timeout = settings.VOTED_CACHE_TIMEOUT
     
     success_messages = None
     can_delete_vote = True
     can_change_vote = True
+    buffer_votes = False
+    rollup_votes = False
+    counter_keys = ()
+    signal_unchanged_votes = False
+    defer_cleanup = False
+    archive_fallback = False
+    ranking = None
+    ranking_prior_votes = 10
+    trending_half_life = None
+    score_fields = None
+    facet_counts_timeout = 60 * 5
+    snapshot_refresh_interval = 10
+    snapshot_rebuild_interval = 60 * 60
+    key_stats_timeout = 60
+    leaderboard_size = 100
+    leaderboard_timeout = 60 * 60 * 24
     form_class = forms.VoteForm
     
     def __init__(self, model):
         self.model = model
+        self._snapshots = {}
+        self._snapshots_lock = threading.Lock()
             
     def get_key(self, request, instance):
         """
@@ -178,9 +366,23 @@ class RatingHandler(object):
             if self.votes_per_ip_address:
                 # in case of vote-per-ip cap, check if this ip
                 # can continue voting this object
-                count = models.Vote.objects.filter_for(instance,
-                    user__isnull=True, ip_address=ip_address).count()
-                return count < self.votes_per_ip_address
+                votes = models.Vote.objects.filter_for(instance,
+                    user__isnull=True, ip_address=ip_address)
+                if not self.buffer_votes:
+                    return votes.count() < self.votes_per_ip_address
+                # buffered votes count too, buffered deletions do not
+                voters = set(votes.values_list('key', 'cookie'))
+                buffered = models.BufferedVote.objects.filter(
+                    content_type=ContentType.objects.get_for_model(instance),
+                    object_id=instance.pk, user__isnull=True, 
+                    ip_address=ip_address).order_by('id')
+                for key_id, cookie, score in buffered.values_list('key', 
+                    'cookie', 'score'):
+                    if score:
+                        voters.add((key_id, cookie))
+                    else:
+                        voters.discard((key_id, cookie))
+                return len(voters) < self.votes_per_ip_address
             return True
         else:
             # for normal user voting the user must be authenticated
@@ -205,6 +407,8 @@ class RatingHandler(object):
             'score_step': self.score_step,
             'can_delete_vote': self.can_delete_vote,
         }
+        if self.allow_anonymous and self.voter_cookie_name:
+            kwargs['voter_cookie_name'] = self.voter_cookie_name
         # initial vote (if present)
         if self.allow_anonymous:
             vote = self.get_vote(instance, key, request.COOKIES)
@@ -234,26 +438,106 @@ class RatingHandler(object):
         It's up to the developer if override this method or just connect
         another listener to the signal: the voting process is killed if 
         just one receiver returns False.
+        
+        By default, changing a vote is allowed only if *can_change_vote*
+        is True: for buffering handlers, votes still in the buffer are
+        taken into account.
+        """
+        return self.can_change_vote if self._has_vote(vote) else True
+        
+    def has_changed(self, vote):
+        """
+        Return True if saving the *vote* changes the score given by its 
+        voter: a vote submitted again with the same score is not saved.
+        For buffering handlers, the score is compared with the latest 
+        buffered vote or deletion given by the voter.
         """
-        return self.can_change_vote if vote.id else True
+        if self.buffer_votes:
+            buffered = self._get_buffered_vote(vote.content_type_id,
+                vote.object_id, vote.key, **_get_voter_lookups(vote))
+            if buffered is not None:
+                return vote.score != buffered.score
+        return vote.has_changed()
+        
+    def _has_vote(self, vote):
+        """
+        Return True if the voter of *vote* already voted its target object
+        using its key: for buffering handlers, the latest buffered vote or
+        deletion given by the voter prevails over the votes table.
+        """
+        if self.buffer_votes:
+            buffered = self._get_buffered_vote(vote.content_type_id,
+                vote.object_id, vote.key, **_get_voter_lookups(vote))
+            if buffered is not None:
+                return bool(buffered.score)
+        return bool(vote.id)
         
     def vote(self, request, vote):
         """
         Save the vote to the database.
         Must return True if the *vote* was created, False otherwise.
         
-        By default this method just does *vote.save()* and recalculates
-        the related score (average, total, number of votes).
+        By default this method just does *vote.save()* and updates
+        the related score (average, total, number of votes) applying
+        the vote changes (see *apply_vote*).
+        If the handler buffers votes, the vote is just added to the buffer.
+        Nothing is done if the vote is not changed (see *has_changed*).
         """
-        created = not vote.id
+        if not self.has_changed(vote):
+            return False
+        created = not self._has_vote(vote)
+        archived = False
+        if created and (settings.ARCHIVE_VOTES or self.archive_fallback):
+            # the vote replaces an archived one, if any
+            archived = self._delete_archived_vote(vote)
+            created = not archived
+        if created:
+            self._update_voted_ids(vote)
+        if self.buffer_votes:
+            self.buffer_vote(request, vote, created=created)
+            return created
         try:
             vote.save()
         except IntegrityError: # assume another thread created the vote
             created = False
         else:
-            models.upsert_score(vote.content_object, vote.key, weight=self.weight)
+            old_score, vote._stored_score = vote._stored_score, vote.score
+            if self.rollup_votes:
+                rollups.record_vote(vote, old_score=old_score)
+            content = (vote.content_type, vote.object_id)
+            if vote.key in self.counter_keys:
+                if created:
+                    self.increment_score(content, vote.key, 1)
+            elif archived:
+                # the score still contains the replaced archived vote
+                self.update_score(content, vote.key)
+            else:
+                self.apply_vote(vote, old_score=old_score)
+            if old_score is None:
+                self.update_trending(vote)
         return created
         
+    def _delete_archived_vote(self, vote):
+        """
+        Delete the archived vote given by the voter of *vote* to the same
+        target object using the same key.
+        Return True if an archived vote was found.
+        """
+        ids = list(models.ArchivedVote.objects.filter(
+            content_type=vote.content_type_id, object_id=vote.object_id,
+            key=vote.key, **_get_voter_lookups(vote)).values_list('id', 
+            flat=True))
+        if ids:
+            models.ArchivedVote.objects.filter(id__in=ids).delete()
+            if triggers.is_installed(models.Score.objects.db):
+                # triggers only see the votes table: remove the archived
+                # vote from the score before the new vote is added
+                models.upsert_score((vote.content_type, vote.object_id),
+                    vote.key, weight=self.weight, 
+                    counter=vote.key in self.counter_keys,
+                    ranking=self.get_ranking)
+        return bool(ids)
+        
     def post_vote(self, request, vote, created):
         """
         Called just after the vote is saved to the db.
@@ -285,16 +569,28 @@ class RatingHandler(object):
         """
         Delete the vote from the database.
         
-        By default this method just do *vote.delete()* and recalculates
-        the related score (average, total, number of votes).
-        """
-        # thread safe delete
-        try:
-            vote.delete()
-        except AssertionError: # maybe the object was already deleted
-            pass
-        else:
-            models.upsert_score(vote.content_object, vote.key, weight=self.weight)
+        By default this method deletes the vote (see 
+        *ratings.models.delete_vote*) and updates the related score 
+        (average, total, number of votes, see *apply_vote*): nothing is 
+        updated if the vote was already deleted, e.g. by a concurrent 
+        request.
+        If the handler buffers votes, the deletion is just added to the buffer.
+        """
+        self._update_voted_ids(vote, deleted=True)
+        if self.buffer_votes:
+            self.buffer_vote(request, vote, deleted=True)
+            return
+        # concurrent requests can delete the same vote: only the one 
+        # actually deleting it updates scores and counters
+        if models.delete_vote(vote):
+            if self.rollup_votes:
+                rollups.record_vote(vote, deleted=True)
+            content = (vote.content_type, vote.object_id)
+            if vote.key in self.counter_keys:
+                self.increment_score(content, vote.key, -1)
+            else:
+                self.apply_vote(vote, deleted=True)
+            self.update_trending(vote, deleted=True)
         
     def post_delete(self, request, vote):
         """
@@ -305,6 +601,213 @@ class RatingHandler(object):
         """
         pass
         
+    # scores
+    
+    def update_score(self, instance_or_content, key):
+        """
+        Recalculate the score (average, total, number of votes) of the 
+        target object *instance_or_content* for the given *key*.
+        Return the score instance.
+        
+        The argument *instance_or_content* can be a model instance or 
+        a sequence *(content_type, object_id)*.
+        
+        This method is called each time the votes given to a target object
+        change, by the voting process and by the buffered votes flusher.
+        If scores are maintained by database triggers (see *ratings.triggers*)
+        then the score is not recalculated.
+        """
+        if triggers.is_installed(models.Score.objects.db):
+            content_type, object_id = models._get_content(instance_or_content)
+            try:
+                score = models.Score.objects.get(content_type=content_type,
+                    object_id=object_id, key=key)
+            except models.Score.DoesNotExist:
+                score = None
+            if score is not None and key not in self.counter_keys:
+                # triggers store the average score as ranking
+                value = self.get_ranking(score)
+                if value != score.ranking:
+                    score.ranking = value
+                    models.Score.objects.filter(pk=score.pk).update(
+                        ranking=value, modified_at=datetime.datetime.now())
+        else:
+            score, created = models.upsert_score(instance_or_content, key, 
+                weight=self.weight, counter=key in self.counter_keys,
+                ranking=self.get_ranking)
+        self._score_changed(instance_or_content, key, score)
+        return score
+        
+    def apply_vote(self, vote, old_score=None, deleted=False):
+        """
+        Update the score of the target object of *vote*, just saved 
+        (*old_score* being its previous value, None if the vote was created)
+        or *deleted*, applying the vote changes without reading all the 
+        votes (see *ratings.models.apply_vote*).
+        Return the score instance.
+        
+        This method is called by *vote* and *delete*.
+        If scores are maintained by database triggers (see *ratings.triggers*)
+        then *update_score* is called instead.
+        """
+        content = (vote.content_type, vote.object_id)
+        if triggers.is_installed(models.Score.objects.db):
+            return self.update_score(content, vote.key)
+        score = vote.score
+        if deleted:
+            # the score of a vote deleted by a form is changed to 0
+            if vote._stored_score is not None:
+                score = vote._stored_score
+            score, old_score = None, score
+        instance = models.apply_vote(content, vote.key, score=score,
+            old_score=old_score, weight=self.weight, ranking=self.get_ranking)
+        self._score_changed(content, vote.key, instance)
+        return instance
+        
+    def _score_changed(self, instance_or_content, key, score):
+        """
+        Refresh leaderboards, score fields and score version after 
+        the *score* of *instance_or_content* for the given *key* changed.
+        """
+        self.update_leaderboards(instance_or_content, key, score)
+        self.update_score_fields(instance_or_content, key, score)
+        self._update_score_version(key)
+        
+    def get_key_stats(self, key):
+        """
+        Return the statistics of all the scores of the handled model for 
+        the given *key* (see *ratings.models.KeyStats*), e.g. to display
+        the site average::
+        
+            stats = handler.get_key_stats('main')
+            print stats.average, stats.average_votes, stats.num_scores
+        
+        Statistics are cached for *key_stats_timeout* seconds.
+        An unsaved instance is returned if there are no scores.
+        """
+        content_type = ContentType.objects.get_for_model(self.model)
+        cache_key = 'ratings_key_stats:%s:%s' % (content_type.pk, key)
+        stats = cache.get(cache_key) if self.key_stats_timeout else None
+        if stats is None:
+            try:
+                stats = models.KeyStats.objects.get(content_type=content_type,
+                    key=key)
+            except models.KeyStats.DoesNotExist:
+                return models.KeyStats(content_type=content_type, key=key)
+            if self.key_stats_timeout:
+                cache.set(cache_key, stats, self.key_stats_timeout)
+        return stats
+        
+    def get_ranking(self, score):
+        """
+        Return the ranking of the given *score*, as configured by the
+        *ranking* attribute. This is called each time a score is 
+        recalculated, and subclasses can override it to implement 
+        custom rankings.
+        """
+        if self.ranking is None:
+            return score.average
+        if self.ranking == 'bayesian':
+            stats = self.get_key_stats(score.key)
+            # without votes, the prior is the middle of the score range
+            if stats.num_votes:
+                prior_average = stats.average
+            else:
+                prior_average = sum(self.score_range) / 2.0
+            return rankings.bayesian_average(score.total, score.num_votes,
+                prior_average, self.ranking_prior_votes)
+        if self.ranking == 'wilson':
+            return rankings.wilson_lower_bound(score.total, score.num_votes,
+                self.score_range)
+        if callable(self.ranking):
+            return self.ranking(score)
+        raise ValueError('Invalid ranking: %r' % self.ranking)
+        
+    def update_trending(self, vote, deleted=False):
+        """
+        Update the trending value of the score of the *vote* just created
+        or *deleted*, if *trending_half_life* is set: each vote adds 1
+        to the trending value, decaying with its age. 
+        
+        The update takes constant time (see 
+        *ratings.models.update_trending*). Changing a vote does not change
+        the trending value.
+        """
+        if not self.trending_half_life:
+            return
+        content = (vote.content_type, vote.object_id)
+        # votes flushed from the buffer were given before being saved
+        models.update_trending(content, vote.key, self.trending_half_life,
+            delta=-1 if deleted else 1, when=vote.created_at)
+        self.update_leaderboards(content, vote.key)
+        self.update_score_fields(content, vote.key)
+        self._update_score_version(vote.key)
+        
+    def get_trending(self, score):
+        """
+        Return the current trending value of the given *score*, e.g.::
+        
+            for score in handler.get_top('main', order='trending_rank'):
+                print score.content_object, handler.get_trending(score)
+        
+        Stored values decay lazily, when read: the ordering of the scores
+        by *trending_rank* does not change over time.
+        """
+        if not self.trending_half_life:
+            return 0
+        return score.get_trending(self.trending_half_life)
+        
+    def increment_score(self, instance_or_content, key, delta):
+        """
+        Atomically add *delta* to the number of votes of the target object
+        *instance_or_content* for the given counter *key* (see *counter_keys*).
+        
+        This method is called by the voting process in place of 
+        *update_score* when a vote is added or deleted using a counter key.
+        Nothing is done if scores are maintained by database triggers.
+        """
+        if not triggers.is_installed(models.Score.objects.db):
+            models.increment_score(instance_or_content, key, delta)
+        else:
+            # triggers store the average score as ranking
+            content_type, object_id = models._get_content(instance_or_content)
+            models.Score.objects.filter(content_type=content_type, 
+                object_id=object_id, key=key).update(
+                ranking=F('num_votes'), modified_at=datetime.datetime.now())
+        self.update_leaderboards(instance_or_content, key)
+        self.update_score_fields(instance_or_content, key)
+        self._update_score_version(key)
+        
+    def buffer_vote(self, request, vote, created=False, deleted=False):
+        """
+        Append the *vote* (or its deletion if *deleted* is True) to the
+        write-behind buffer, used if *buffer_votes* is True.
+        
+        The score cached in the vote is optimistically updated, so that
+        responses reflect the new, changed or deleted vote before it is 
+        actually flushed.
+        """
+        models.BufferedVote.objects.create(content_type=vote.content_type,
+            object_id=vote.object_id, key=vote.key, 
+            score=0 if deleted else vote.score, user_id=vote.user_id,
+            ip_address=vote.ip_address, cookie=vote.cookie)
+        score = vote.get_score()
+        if score is None:
+            score = models.Score(content_type=vote.content_type,
+                object_id=vote.object_id, key=vote.key)
+            vote._score_cache = score
+        # the stored score counts the vote in the votes table, if any
+        if vote.id and score.num_votes:
+            score.total -= vote._stored_score
+            score.num_votes -= 1
+        if not deleted:
+            score.total += vote.score
+            score.num_votes += 1
+        if score.num_votes:
+            score.average = float(score.total) / (score.num_votes + self.weight)
+        else:
+            score.average = 0
+        
     # view callbacks
     
     def ajax_response(self, request, vote, created, deleted):
@@ -347,9 +850,16 @@ class RatingHandler(object):
         """
         Called by *success_response* when the vote is by an nonymous user.
         Set the cookie to the response.
+        
+        If *voter_cookie_name* is set, the voter cookie is refreshed,
+        unless the vote was given using its own cookie.
         """
         cookie_name = str(cookies.get_name(vote.content_object, vote.key))
-        if deleted:
+        if self.voter_cookie_name and cookie_name not in request.COOKIES:
+            if not deleted:
+                response.set_cookie(self.voter_cookie_name, 
+                    cookies.get_voter_value(vote.cookie), self.cookie_max_age)
+        elif deleted:
             response.delete_cookie(cookie_name)
         else:
             response.set_cookie(cookie_name, vote.cookie, self.cookie_max_age)
@@ -386,6 +896,65 @@ class RatingHandler(object):
             self.set_message(request, response, vote, created, deleted)
         return response
         
+    def get_idempotency_key(self, request, instance, key):
+        """
+        Return the cache key used to store the response to a vote request
+        for the target object *instance* using *key*, or None if the client
+        did not send an idempotency token.
+        
+        The token is sent by the client in the *idempotency_token* 
+        POST parameter or in the *X-Idempotency-Key* header, and it is 
+        bound to the target object, the key and the current voter: the 
+        user, or the vote cookie for anonymous users (the ip address is 
+        used only if the anonymous user has no cookie yet).
+        """
+        if not self.idempotency_timeout:
+            return None
+        token = request.POST.get('idempotency_token') or request.META.get(
+            'HTTP_X_IDEMPOTENCY_KEY')
+        if not token:
+            return None
+        if request.user.is_authenticated():
+            voter = 'user:%s' % request.user.pk
+        elif self.allow_anonymous:
+            cookie = self._get_user_lookups(instance, key, 
+                request.COOKIES).get('cookie')
+            if cookie:
+                voter = 'cookie:%s' % cookie
+            else:
+                voter = 'ip:%s' % request.META.get('REMOTE_ADDR')
+        else:
+            return None
+        content_type = ContentType.objects.get_for_model(instance)
+        digest = md5_constructor(smart_str(u'%s-%s-%s-%s-%s' % (
+            content_type.pk, instance.pk, key, voter, token))).hexdigest()
+        return 'ratings-idempotency-%s' % digest
+        
+    def get_cached_response(self, request, instance, key):
+        """
+        Callback used by the voting views before processing a vote.
+        Return the response previously given to a request sent using the
+        same idempotency token, or None.
+        """
+        cache_key = self.get_idempotency_key(request, instance, key)
+        if cache_key is not None:
+            return cache.get(cache_key)
+            
+    def cache_response(self, request, instance, key, response):
+        """
+        Callback used by the voting views after a successful vote.
+        Store the *response*, so that it can be given again to requests
+        retried using the same idempotency token.
+        
+        The cookies set by the response are not stored: a retried 
+        request never receives the vote cookies of the original one.
+        """
+        cache_key = self.get_idempotency_key(request, instance, key)
+        if cache_key is not None:
+            cached = copy.copy(response)
+            cached.cookies = SimpleCookie()
+            cache.set(cache_key, cached, self.idempotency_timeout)
+        
     def failure_response(self, request, errors):
         """
         Callback used by the voting views, called when vote form did not 
@@ -413,6 +982,11 @@ class RatingHandler(object):
             cookie_name = cookies.get_name(instance, key)
             if cookie_name in user_or_cookies:
                 return {'cookie': user_or_cookies[cookie_name]}
+            if self.voter_cookie_name:
+                voter = cookies.get_voter(user_or_cookies, 
+                    self.voter_cookie_name)
+                if voter:
+                    return {'cookie': voter}
             return {}
         raise ValueError('Anonymous vote not allowed')
     
@@ -424,14 +998,138 @@ class RatingHandler(object):
         The argument *user_or_cookies* can be a Django User instance
         or a cookie dict (for anonymous votes).
         
+        For buffering handlers, the latest buffered vote or deletion
+        given by the user is taken into account.
+        
         A *ValueError* is raised if you give cookies but anonymous votes 
         are not allowed by the handler.
         """
+        if self.voted_cache_timeout and hasattr(user_or_cookies, 'pk'):
+            voted = self.get_voted_ids(key, user_or_cookies)
+            return _contains(voted, instance.pk)
         user_lookup = self._get_user_lookups(instance, key, user_or_cookies)
         if not user_lookup:
             return False
-        return models.Vote.objects.filter_for(instance, key=key, 
-            **user_lookup).exists()
+        if self.buffer_votes:
+            content_type = ContentType.objects.get_for_model(instance)
+            buffered = self._get_buffered_vote(content_type.pk, instance.pk,
+                key, **user_lookup)
+            if buffered is not None:
+                return bool(buffered.score)
+        if models.Vote.objects.filter_for(instance, key=key, 
+            **user_lookup).exists():
+            return True
+        return self.archive_fallback and models.ArchivedVote.objects.filter_for(
+            instance, key=key, **user_lookup).exists()
+        
+    def has_voted_many(self, instances, key, user_or_cookies):
+        """
+        Return a set containing the ids of the target objects, in the
+        sequence *instances*, voted by the user related to given 
+        *user_or_cookies* using the given *key*.
+        
+        This is a batch version of *has_voted*, performing only one query
+        (two if *archive_fallback* is True), or none if the voted ids of 
+        the user are cached (see *voted_cache_timeout*). It is useful to 
+        display badges or like buttons in lists of objects, e.g.::
+        
+            voted = handler.has_voted_many(films, 'main', request.user)
+            for film in films:
+                print film, film.pk in voted
+        
+        The argument *user_or_cookies* can be a Django User instance
+        or a cookie dict (for anonymous votes).
+        
+        A *ValueError* is raised if you give cookies but anonymous votes 
+        are not allowed by the handler.
+        """
+        instances = list(instances)
+        if not instances:
+            return set()
+        if hasattr(user_or_cookies, 'pk'):
+            if self.voted_cache_timeout:
+                voted = self.get_voted_ids(key, user_or_cookies)
+                return set(i.pk for i in instances if _contains(voted, i.pk))
+            object_ids = set(i.pk for i in instances)
+            lookups = {'user': user_or_cookies}
+            select = lambda queryset: set(
+                queryset.values_list('object_id', flat=True))
+        else:
+            # anonymous votes: each target object may have its own cookie
+            cookie_values = {}
+            for instance in instances:
+                user_lookup = self._get_user_lookups(instance, key, 
+                    user_or_cookies)
+                if user_lookup:
+                    cookie_values[instance.pk] = user_lookup['cookie']
+            if not cookie_values:
+                return set()
+            object_ids = set(cookie_values)
+            lookups = {'cookie__in': set(cookie_values.values())}
+            select = lambda queryset: set(object_id for object_id, cookie in 
+                queryset.values_list('object_id', 'cookie') 
+                if cookie_values[object_id] == cookie)
+        voted = select(models.Vote.objects.filter_for(self.model, key=key,
+            object_id__in=object_ids, **lookups))
+        missing = object_ids - voted
+        if self.archive_fallback and missing:
+            voted |= select(models.ArchivedVote.objects.filter_for(self.model,
+                key=key, object_id__in=missing, **lookups))
+        return voted
+        
+    def has_liked(self, instances, key, user_or_cookies):
+        """
+        Same as *has_voted_many*, usually called for like keys.
+        """
+        return self.has_voted_many(instances, key, user_or_cookies)
+        
+    def _get_voted_cache_key(self, content_type_id, key, user_id):
+        return 'ratings_voted:%s:%s:%s' % (content_type_id, key, user_id)
+        
+    def get_voted_ids(self, key, user):
+        """
+        Return a sorted array containing the ids of all the target objects
+        voted by *user* using the given *key*.
+        
+        The array is cached for *voted_cache_timeout* seconds, and it is
+        updated by the voting process when the user votes or deletes a vote.
+        """
+        content_type = ContentType.objects.get_for_model(self.model)
+        cache_key = self._get_voted_cache_key(content_type.pk, key, user.pk)
+        voted = cache.get(cache_key)
+        if voted is None:
+            lookups = {'content_type': content_type, 'key': key, 'user': user}
+            object_ids = set(models.Vote.objects.filter(**lookups
+                ).values_list('object_id', flat=True))
+            if self.archive_fallback:
+                object_ids.update(models.ArchivedVote.objects.filter(**lookups
+                    ).values_list('object_id', flat=True))
+            voted = array.array('L', sorted(object_ids))
+            cache.set(cache_key, voted, self.voted_cache_timeout)
+        return voted
+        
+    def _update_voted_ids(self, vote, deleted=False):
+        """
+        Add the target object of *vote* to the cached voted ids of its user
+        (see *get_voted_ids*), or remove it if *deleted* is True.
+        Nothing is done if the voted ids are not cached.
+        """
+        if not (self.voted_cache_timeout and vote.user_id):
+            return
+        cache_key = self._get_voted_cache_key(vote.content_type_id, vote.key,
+            vote.user_id)
+        voted = cache.get(cache_key)
+        if voted is None:
+            return
+        index = bisect.bisect_left(voted, vote.object_id)
+        found = index < len(voted) and voted[index] == vote.object_id
+        if deleted and found:
+            voted.pop(index)
+        elif not (deleted or found):
+            voted.insert(index, vote.object_id)
+        else:
+            return
+        cache.set(cache_key, voted, self.voted_cache_timeout)
         
     def get_vote(self, instance, key, user_or_cookies):
         """
@@ -443,6 +1141,13 @@ class RatingHandler(object):
         or a cookie dict (for anonymous votes).
         
         Return None if the vote does not exists.
+        If *archive_fallback* is True and the vote is archived, an 
+        *ArchivedVote* instance is returned.
+        
+        For buffering handlers, the vote reflects the latest buffered vote
+        given by the user: if the vote is not in the votes table yet, an 
+        unsaved instance is returned; None is returned if the deletion
+        of the vote is buffered.
         
         A *ValueError* is raised if you give cookies but anonymous votes 
         are not allowed by the handler.
@@ -450,7 +1155,38 @@ class RatingHandler(object):
         user_lookup = self._get_user_lookups(instance, key, user_or_cookies)
         if not user_lookup:
             return None
-        return models.Vote.objects.get_for(instance, key, **user_lookup)
+        vote = models.Vote.objects.get_for(instance, key, **user_lookup)
+        if self.buffer_votes:
+            content_type = ContentType.objects.get_for_model(instance)
+            buffered = self._get_buffered_vote(content_type.pk, instance.pk,
+                key, **user_lookup)
+            if buffered is not None:
+                if not buffered.score:
+                    return None
+                if vote is None:
+                    vote = models.Vote(content_type=content_type, 
+                        object_id=instance.pk, key=key, 
+                        user_id=buffered.user_id, 
+                        ip_address=buffered.ip_address,
+                        cookie=buffered.cookie)
+                vote.score = buffered.score
+                return vote
+        if vote is None and self.archive_fallback:
+            return models.ArchivedVote.objects.get_for(instance, key, 
+                **user_lookup)
+        return vote
+        
+    def _get_buffered_vote(self, content_type_id, object_id, key, 
+        **user_lookup):
+        """
+        Return the latest buffered vote given to the target object using
+        *key* by the voter selected by *user_lookup*, or None.
+        A buffered vote with a score of 0 is a vote deletion.
+        """
+        buffered = list(models.BufferedVote.objects.filter(
+            content_type=content_type_id, object_id=object_id, key=key,
+            **user_lookup).order_by('-id')[:1])
+        return buffered[0] if buffered else None
         
     def get_votes_for(self, instance, **kwargs):
         """
@@ -485,7 +1221,8 @@ class RatingHandler(object):
         In *kwargs* it is possible to specify the values to retreive mapped 
         to field names (it is up to you to avoid name clashes).
         You can annotate the queryset with the number of votes (*num_votes*), 
-        the average score (*average*) and the total sum of all votes (*total*).
+        the average score (*average*), the total sum of all votes (*total*)
+        and the ranking (*ranking*).
 
         For example, the following call::
 
@@ -526,18 +1263,411 @@ class RatingHandler(object):
         """
         return models.annotate_votes(queryset, key, user, score)
         
+    # leaderboards
+    
+    def _get_leaderboards_cache_key(self, content_type_id, key, *args):
+        return ':'.join(['ratings_top', str(content_type_id), key] + 
+            [str(i) for i in args])
+        
+    def get_top(self, key, n=10, min_votes=1, order='average'):
+        """
+        Return a list of the *n* scores with the highest *order* value 
+        (*average*, *total*, *num_votes*, *ranking* or *trending_rank*) for
+        the given *key*, considering only the scores having at least 
+        *min_votes* votes.
+        The content objects of the scores are retreived in bulk, e.g.::
+        
+            for score in handler.get_top('main', 20, min_votes=10):
+                print score.content_object, score.average
+        
+        Leaderboards of the best *leaderboard_size* scores are cached 
+        (for *leaderboard_timeout* seconds) and incrementally updated by
+        the voting process, so that the scores table is not sorted for 
+        each call; if *n* is greater than *leaderboard_size*, the scores
+        are retreived from the database.
+        
+        A *ValueError* is raised if *order* is not a valid score field.
+        """
+        if order not in LEADERBOARD_ORDERS:
+            raise ValueError('Invalid leaderboard order: %r' % order)
+        if n > self.leaderboard_size:
+            entries = self._get_top_entries(key, n, min_votes, order)
+        else:
+            entries = self.get_leaderboard(key, min_votes, order)
+        content_type = ContentType.objects.get_for_model(self.model)
+        top, start = [], 0
+        # scores of deleted target objects are skipped
+        while len(top) < n and start < len(entries):
+            object_ids = [i[2] for i in entries[start:start + n - len(top)]]
+            start += len(object_ids)
+            scores = dict((i.object_id, i) for i in 
+                models.Score.objects.filter_with_contents(
+                content_type=content_type, key=key, object_id__in=object_ids))
+            top.extend(scores[i] for i in object_ids if i in scores)
+        return top
+    
+    def _get_top_entries(self, key, n, min_votes, order):
+        """
+        Return the leaderboard entries *(value, num_votes, object_id)*
+        of the best *n* scores, retreived from the database.
+        """
+        content_type = ContentType.objects.get_for_model(self.model)
+        scores = models.Score.objects.filter(content_type=content_type,
+            key=key, num_votes__gte=min_votes).order_by(
+            '-%s' % order, '-num_votes', 'object_id')
+        return list(scores.values_list(order, 'num_votes', 'object_id')[:n])
+        
+    def get_leaderboard(self, key, min_votes=1, order='average', 
+        rebuild=False):
+        """
+        Return the cached leaderboard for the given *key*, *min_votes* and
+        *order* (see *get_top*), building it if needed or if *rebuild* is
+        True. A leaderboard is a list of *(value, num_votes, object_id)* 
+        tuples, sorted from the best score.
+        """
+        content_type = ContentType.objects.get_for_model(self.model)
+        cache_key = self._get_leaderboards_cache_key(content_type.pk, key, 
+            order, min_votes)
+        entries = None if rebuild else cache.get(cache_key)
+        if entries is None:
+            entries = self._get_top_entries(key, self.leaderboard_size, 
+                min_votes, order)
+            # the voting process updates only the registered leaderboards
+            registry_key = self._get_leaderboards_cache_key(content_type.pk, 
+                key)
+            registry = cache.get(registry_key) or set()
+            registry.add((order, min_votes))
+            cache.set_many({cache_key: entries, registry_key: registry}, 
+                self.leaderboard_timeout)
+        return entries
+        
+    def update_leaderboards(self, instance_or_content, key, score=None):
+        """
+        Update the cached leaderboards of the given *key* after the score 
+        of the target object *instance_or_content* changed.
+        If *score* is None, it is retreived from the database, but only if 
+        there are leaderboards to update.
+        
+        A leaderboard is invalidated (and rebuilt by the next *get_top* 
+        call) if a score leaves it and a score not stored in the 
+        leaderboard could take its place.
+        """
+        content_type, object_id = models._get_content(instance_or_content)
+        registry = cache.get(self._get_leaderboards_cache_key(content_type.pk, 
+            key))
+        if not registry:
+            return
+        if score is None:
+            try:
+                score = models.Score.objects.get(content_type=content_type,
+                    object_id=object_id, key=key)
+            except models.Score.DoesNotExist:
+                pass
+        cache_keys = dict((self._get_leaderboards_cache_key(content_type.pk, 
+            key, order, min_votes), (order, min_votes)) 
+            for order, min_votes in registry)
+        updated, invalidated = {}, []
+        for cache_key, entries in cache.get_many(cache_keys.keys()).items():
+            order, min_votes = cache_keys[cache_key]
+            full = len(entries) >= self.leaderboard_size
+            others = [i for i in entries if i[2] != object_id]
+            stored = len(others) < len(entries)
+            entry = None
+            if score is not None and score.num_votes >= min_votes:
+                entry = (getattr(score, order), score.num_votes, object_id)
+                others.append(entry)
+                others.sort(key=lambda i: (-i[0], -i[1], i[2]))
+                others = others[:self.leaderboard_size]
+            if full and stored and (entry is None or others[-1] == entry):
+                # the score left the leaderboard or it is the last one: 
+                # scores not in the leaderboard could take its place
+                invalidated.append(cache_key)
+            elif others != entries:
+                updated[cache_key] = others
+        if updated:
+            cache.set_many(updated, self.leaderboard_timeout)
+        for cache_key in invalidated:
+            cache.delete(cache_key)
+        
+    def rebuild_leaderboards(self):
+        """
+        Rebuild all the cached leaderboards of this handler.
+        Return the number of rebuilt leaderboards.
+        """
+        content_type = ContentType.objects.get_for_model(self.model)
+        keys = models.Score.objects.filter(content_type=content_type
+            ).order_by().values_list('key', flat=True).distinct()
+        rebuilt = 0
+        for key in set(fields.get_key_name(i) for i in keys):
+            registry = cache.get(self._get_leaderboards_cache_key(
+                content_type.pk, key)) or ()
+            for order, min_votes in registry:
+                self.get_leaderboard(key, min_votes, order, rebuild=True)
+                rebuilt += 1
+        return rebuilt
+        
+    # facets
+    
+    def _get_score_version_key(self, key):
+        content_type = ContentType.objects.get_for_model(self.model)
+        return 'ratings_score_version:%s:%s' % (content_type.pk, key)
+    
+    def get_score_version(self, key):
+        """
+        Return the version of the scores of the handled model for the 
+        given *key*: the version changes each time one of the scores is 
+        updated by the voting process, and it is part of the cache keys of
+        results depending on the scores (see *facet_counts*).
+        """
+        cache_key = self._get_score_version_key(key)
+        version = cache.get(cache_key)
+        if version is None:
+            # a new version is unlikely to match the one of evicted results
+            version = int(time.time() * 1000)
+            if not cache.add(cache_key, version, self.facet_counts_timeout):
+                version = cache.get(cache_key, version)
+        return version
+        
+    def _update_score_version(self, key):
+        if not self.facet_counts_timeout:
+            return
+        try:
+            cache.incr(self._get_score_version_key(key))
+        except ValueError:
+            # the version is not cached: no results depend on it
+            pass
+    
+    def facet_counts(self, queryset, key, buckets=None, field='average'):
+        """
+        Return a *SortedDict* mapping each threshold in *buckets* (sorted
+        from the highest) to the number of objects in *queryset* whose 
+        score for the given *key* has a *field* value (*average*, *total*,
+        *num_votes*, *ranking* or *trending_rank*) greater than or equal 
+        to the threshold, e.g. to display listing filters like 
+        "4 stars & up (1203)"::
+        
+            for threshold, count in handler.facet_counts(articles, 'main',
+                buckets=(4, 3, 2)).items():
+                print '%s stars & up (%d)' % (threshold, count)
+        
+        By default, buckets are the whole numbers in the score range.
+        Counts are calculated using one grouped query (see 
+        *ratings.models.get_facet_counts*), and cached for 
+        *facet_counts_timeout* seconds using a fingerprint of the 
+        *queryset* query and the version of the scores (see 
+        *get_score_version*). Scores changed by other means than the 
+        voting process are taken into account when the cache expires.
+        
+        A *ValueError* is raised if *field* is not a valid score field.
+        """
+        if field not in LEADERBOARD_ORDERS:
+            raise ValueError('Invalid score field: %r' % field)
+        if buckets is None:
+            low, high = self.score_range
+            buckets = range(int(high), int(low) - 1, -1)
+        if not self.facet_counts_timeout:
+            return models.get_facet_counts(queryset, key, buckets, field)
+        try:
+            if isinstance(queryset, EmptyQuerySet):
+                raise EmptyResultSet
+            sql, params = queryset.query.get_compiler(
+                using=queryset.db).as_sql()
+        except EmptyResultSet:
+            # nothing to count, e.g. *queryset.none()*
+            return models.get_facet_counts(queryset, key, buckets, field)
+        fingerprint = md5_constructor(repr((sql, params, sorted(buckets),
+            field))).hexdigest()
+        content_type = ContentType.objects.get_for_model(self.model)
+        cache_key = 'ratings_facets:%s:%s:%s:%s' % (content_type.pk, key, 
+            self.get_score_version(key), fingerprint)
+        facets = cache.get(cache_key)
+        if facets is None:
+            facets = models.get_facet_counts(queryset, key, buckets, field)
+            cache.set(cache_key, facets, self.facet_counts_timeout)
+        return facets
+        
+    # snapshots
+    
+    def get_snapshot(self, key):
+        """
+        Return an in-process columnar snapshot of the scores of the handled
+        model for the given *key* (see *ratings.snapshots.ScoreSnapshot*),
+        e.g. to rank or filter a large number of objects without querying
+        the scores table each time::
+        
+            snapshot = handler.get_snapshot('main')
+            object_ids = snapshot.filter(num_votes__gte=10).top(100)
+            
+        Snapshots are kept by the handler in each process: they are
+        refreshed with the scores changed in the meantime at most every
+        *snapshot_refresh_interval* seconds, and fully reloaded every 
+        *snapshot_rebuild_interval* seconds. Refreshes replace the kept
+        snapshot with a new one, so that returned snapshots never change.
+        """
+        with self._snapshots_lock:
+            snapshot = self._snapshots.get(key)
+            now = datetime.datetime.now()
+            if snapshot is None or now - snapshot.loaded_at >= (
+                datetime.timedelta(seconds=self.snapshot_rebuild_interval)):
+                content_type = ContentType.objects.get_for_model(self.model)
+                snapshot = snapshots.ScoreSnapshot(content_type, key)
+                snapshot.refresh(full=True)
+            elif now - snapshot.refreshed_at >= datetime.timedelta(
+                seconds=self.snapshot_refresh_interval):
+                snapshot = snapshot.copy()
+                snapshot.refresh()
+            self._snapshots[key] = snapshot
+        return snapshot
+        
+    # denormalized score fields
+    
+    def _get_score_fields(self, key):
+        """
+        Return a dict mapping the names of the model fields storing values
+        of the scores for *key* to the names of the score fields.
+        """
+        return dict((name, field) for name, (field_key, field) in 
+            (self.score_fields or {}).items() if field_key == key)
+        
+    def _get_score_values(self, fields, score):
+        # missing scores are stored as default values
+        if score is None:
+            score = models.Score()
+        return dict((name, getattr(score, field)) 
+            for name, field in fields.items())
+    
+    def update_score_fields(self, instance_or_content, key, score=None):
+        """
+        Copy the values of the score of the target object 
+        *instance_or_content* for the given *key* to the fields of the 
+        target object declared in *score_fields*, using one query.
+        If *score* is None, it is retreived from the database, but only if 
+        there are fields to update.
+        
+        This method is called by the voting process each time a score 
+        changes.
+        """
+        fields = self._get_score_fields(key)
+        if not fields:
+            return
+        content_type, object_id = models._get_content(instance_or_content)
+        if score is None:
+            try:
+                score = models.Score.objects.get(content_type=content_type,
+                    object_id=object_id, key=key)
+            except models.Score.DoesNotExist:
+                pass
+        values = self._get_score_values(fields, score)
+        self.model._default_manager.filter(pk=object_id).update(**values)
+        if isinstance(instance_or_content, self.model):
+            for name, value in values.items():
+                setattr(instance_or_content, name, value)
+                
+    def rebuild_score_fields(self, chunk_size=1000):
+        """
+        Compare the fields declared in *score_fields* of all the rated 
+        objects with the related scores, reading *chunk_size* objects at 
+        a time, and repair the fields which are out of sync.
+        Return the number of repaired objects.
+        """
+        if not self.score_fields:
+            return 0
+        content_type = ContentType.objects.get_for_model(self.model)
+        names = self.score_fields.keys()
+        keys = set(key for key, field in self.score_fields.values())
+        objects = self.model._default_manager.order_by('pk')
+        repaired, last_pk = 0, None
+        while True:
+            chunk = objects
+            if last_pk is not None:
+                chunk = chunk.filter(pk__gt=last_pk)
+            rows = list(chunk.values_list('pk', *names)[:chunk_size])
+            if not rows:
+                return repaired
+            scores = dict(((i.object_id, i.key), i) for i in 
+                models.Score.objects.filter(content_type=content_type,
+                key__in=keys, object_id__in=[i[0] for i in rows]))
+            for row in rows:
+                values = {}
+                for key in keys:
+                    values.update(self._get_score_values(
+                        self._get_score_fields(key), scores.get((row[0], key))))
+                if values != dict(zip(names, row[1:])):
+                    self.model._default_manager.filter(pk=row[0]).update(
+                        **values)
+                    repaired += 1
+            last_pk = rows[-1][0]
+        
     def deleting_target_object(self, sender, instance, **kwargs):
         """
         The target object *instance* of the model *sender*, is being deleted,
         so we must delete all the votes and scores related to that instance.
         
+        If objects are deleted inside a *ratings.bulk_cleanup()* block, 
+        the instance is only collected, and its votes and scores are deleted
+        in bulk at the end of the block.
+        
         This receiver is usually connected by the ratings registry, when 
         a handler is registered.
         """
-        models.delete_scores_for(instance)
-        models.delete_votes_for(instance)
+        content_type = managers.get_content_type_for_model(type(instance))
+        collected = getattr(_cleanup, 'collected', None)
+        if collected is None:
+            self.cleanup(content_type, [instance.pk])
+        else:
+            collected.setdefault(content_type, set()).add(instance.pk)
+            
+    def cleanup(self, content_type, object_ids):
+        """
+        Delete all the votes and scores related to the target objects 
+        of the given *content_type* having the given *object_ids*, that
+        have been deleted.
+        
+        If *defer_cleanup* is True, *schedule_cleanup* is called instead.
+        """
+        if self.defer_cleanup:
+            self.schedule_cleanup(content_type, object_ids)
+        else:
+            models.delete_ratings_for(content_type, object_ids)
+            
+    def schedule_cleanup(self, content_type, object_ids):
+        """
+        Called in place of the cleanup of deleted target objects if
+        *defer_cleanup* is True.
+        
+        By default nothing is done, and related votes and scores are left
+        in place, to be removed later by the *ratings_sweep_orphans* 
+        management command (orphaned votes are skipped by *get_votes_by*);
+        subclasses can override this method to enqueue a background job, 
+        e.g.::
+        
+            def schedule_cleanup(self, content_type, object_ids):
+                tasks.delete_ratings.delay(content_type.id, list(object_ids))
+                
+        where the task just calls 
+        *ratings.models.delete_ratings_for(content_type_id, object_ids)*.
+        """
+        pass
             
      
+def _get_voter_lookups(vote):
+    """
+    Return the lookups selecting the votes given by the voter of *vote*.
+    """
+    if vote.user_id:
+        return {'user': vote.user_id}
+    return {'user__isnull': True, 'cookie': vote.cookie}
+
+def _contains(sorted_ids, pk):
+    """
+    Return True if *pk* is in the sorted sequence *sorted_ids*.
+    """
+    index = bisect.bisect_left(sorted_ids, pk)
+    return index < len(sorted_ids) and sorted_ids[index] == pk
+
+
+_cleanup = threading.local()
+
 class Ratings(object):
     """
     Registry that stores the handlers for each content type rating system.
@@ -564,12 +1694,13 @@ class Ratings(object):
 
     def connect(self):
         """
-        Pre and post (delete) vote signals.
+        Pre and post (delete) vote signals, and deleted scores.
         """
         signals.vote_will_be_saved.connect(self.pre_vote, sender=models.Vote)
         signals.vote_was_saved.connect(self.post_vote, sender=models.Vote)
         signals.vote_will_be_deleted.connect(self.pre_delete, sender=models.Vote)
         signals.vote_was_deleted.connect(self.post_delete, sender=models.Vote)
+        pre_delete_signal.connect(models.deleting_score, sender=models.Score)
         
     def connect_model_signals(self, model, handler):
         """
@@ -683,6 +1814,56 @@ class Ratings(object):
         if model in self._registry:
             return self._registry[model].post_delete(request, vote)
             
+    def update_score(self, instance_or_content, key):
+        """
+        Recalculate the score of the target object *instance_or_content*
+        (a model instance or a sequence *(content_type, object_id)*) for 
+        the given *key*, using the handler of the target model.
+        If the model is not registered, the score is recalculated using the
+        default weight.
+        Return the score instance.
+        """
+        content_type, object_id = models._get_content(instance_or_content)
+        handler = self.get_handler(content_type.model_class())
+        # the key can also be a key id, e.g. retreived using *values_list*
+        key = fields.get_key_name(key)
+        if handler is None:
+            score, created = models.upsert_score((content_type, object_id), 
+                key, weight=settings.WEIGHT)
+            return score
+        return handler.update_score((content_type, object_id), key)
+            
+    @contextmanager
+    def bulk_cleanup(self):
+        """
+        Context manager collecting the rated objects deleted inside the
+        block: at the end of the block, votes and scores related to them
+        are deleted using one query for each content type, instead of two 
+        queries for each deleted object, e.g.::
+        
+            with ratings.bulk_cleanup():
+                Listing.objects.filter(expires_at__lt=now).delete()
+                
+        Use the context manager inside the transaction deleting
+        the objects, so that the cleanup is committed (or rolled back)
+        together with the deletion. Nothing is deleted if the block raises
+        an exception. Nested blocks are merged into the outermost one.
+        """
+        if getattr(_cleanup, 'collected', None) is not None:
+            yield
+            return
+        _cleanup.collected = collected = {}
+        try:
+            yield
+        finally:
+            _cleanup.collected = None
+        for content_type, object_ids in collected.items():
+            handler = self.get_handler(content_type.model_class())
+            if handler is None:
+                models.delete_ratings_for(content_type, object_ids)
+            else:
+                handler.cleanup(content_type, object_ids)
+            
     def get_votes_by(self, user, **kwargs):
         """
         Return all votes assigned by *user* and filtered by any given *kwargs*.
@@ -0,0 +1,42 @@
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError, make_option
+
+from ratings import archive, exceptions
+
+class Command(BaseCommand):
+    """
+    Move to the archive table the votes not modified in the given number
+    of days, e.g.::
+
+        ./manage.py archive_votes -d 365 -p 0.5
+
+    Archived votes keep contributing to scores only if the
+    *GENERIC_RATINGS_ARCHIVE_VOTES* setting is True (see *ratings.archive*).
+    """
+    option_list = BaseCommand.option_list + (
+        make_option('-d', "--days",
+            action='store', dest='days', default=365, type='int',
+            help=('Archive votes not modified in this number of days.')
+        ),
+        make_option('-c', "--chunk-size",
+            action='store', dest='chunk_size', default=archive.CHUNK_SIZE,
+            type='int', help=('The number of votes archived in a transaction.')
+        ),
+        make_option('-p', "--pause",
+            action='store', dest='pause', default=0, type='float',
+            help=('The number of seconds to wait after each chunk.')
+        ),
+    )
+    help = "Move old votes to the archive table."
+
+    def handle(self, **options):
+        cutoff = datetime.datetime.now() - datetime.timedelta(
+            days=options['days'])
+        try:
+            archived = archive.archive_votes(cutoff,
+                chunk_size=options['chunk_size'], pause=options['pause'])
+        except exceptions.ArchiveDisabled, e:
+            raise CommandError(str(e))
+        if int(options.get('verbosity')) > 0:
+            print u'%d votes archived' % archived
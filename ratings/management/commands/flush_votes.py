@@ -0,0 +1,39 @@
+import time
+
+from django.core.management.base import BaseCommand, make_option
+
+from ratings import buffer
+
+class Command(BaseCommand):
+    """
+    Write to the votes table all the votes buffered by handlers using
+    write-behind voting, and update the related scores, e.g.::
+    
+        ./manage.py flush_votes -b 1000
+        
+    Use the *interval* option to keep flushing votes every given seconds::
+    
+        ./manage.py flush_votes -i 5
+    """
+    option_list = BaseCommand.option_list + (
+        make_option('-b', "--batch-size", 
+            action='store', dest='batch_size', default=500, type='int',
+            help=('The number of buffered votes flushed in a transaction.')
+        ),
+        make_option('-i', "--interval", 
+            action='store', dest='interval', default=0, type='int',
+            help=('Keep flushing votes every given seconds.')
+        ),
+    )
+    help = "Write buffered votes to the votes table."
+
+    def handle(self, **options):
+        verbose = int(options.get('verbosity')) > 0
+        interval = options['interval']
+        while True:
+            flushed = buffer.flush(options['batch_size'])
+            if verbose:
+                print u'%d buffered votes flushed' % flushed
+            if not interval:
+                break
+            time.sleep(interval)
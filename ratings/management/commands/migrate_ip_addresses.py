@@ -0,0 +1,91 @@
+from __future__ import with_statement
+
+from django.db import connections, router, transaction
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, make_option
+
+from ratings import models, schema
+
+# the column storing textual ip addresses in previous versions
+LEGACY_COLUMN = 'ip_address'
+
+class Command(BaseCommand):
+    """
+    Convert the textual ip addresses stored by previous versions of this app
+    to packed ip addresses, and create the related indexes, e.g.::
+
+        ./manage.py migrate_ip_addresses -b 5000
+
+    Ip addresses are now stored in the *ip* column of votes and buffered
+    votes: the command adds the column, converts the addresses in batches
+    and removes the old *ip_address* column (in SQLite, the table is
+    recreated).
+    The command can be interrupted and run again.
+    """
+    option_list = BaseCommand.option_list + (
+        make_option('-b', "--batch-size",
+            action='store', dest='batch_size', default=1000, type='int',
+            help=('The number of ip addresses converted in a transaction.')
+        ),
+    )
+    help = "Convert textual ip addresses to packed ones."
+
+    def convert(self, model, batch_size):
+        """
+        Move the addresses in the legacy column of the *model* table to
+        the new one, *batch_size* rows at a time.
+        Return the number of converted addresses.
+        """
+        using = router.db_for_write(model)
+        connection = connections[using]
+        qn = connection.ops.quote_name
+        field = model._meta.get_field('ip_address')
+        select = 'SELECT id, %s FROM %s WHERE %s IS NOT NULL ORDER BY id' % (
+            qn(LEGACY_COLUMN), qn(model._meta.db_table), qn(LEGACY_COLUMN))
+        update = 'UPDATE %s SET %s = %%s, %s = NULL WHERE id = %%s' % (
+            qn(model._meta.db_table), qn(field.column), qn(LEGACY_COLUMN))
+        converted = 0
+        while True:
+            with transaction.commit_on_success(using=using):
+                cursor = connection.cursor()
+                cursor.execute('%s LIMIT %d' % (select, batch_size))
+                rows = cursor.fetchall()
+                if not rows:
+                    return converted
+                params = []
+                for pk, address in rows:
+                    try:
+                        value = field.get_db_prep_value(address, connection)
+                    except (ValueError, ValidationError):
+                        # invalid addresses are discarded
+                        value = None
+                    params.append((value, pk))
+                cursor.executemany(update, params)
+            converted += len(rows)
+
+    def handle(self, **options):
+        verbose = int(options.get('verbosity')) > 0
+        for model in (models.Vote, models.BufferedVote):
+            table = model._meta.db_table
+            columns = schema.get_columns(model)
+            if model._meta.get_field('ip_address').column not in columns:
+                schema.add_column(model, 'ip_address')
+            if LEGACY_COLUMN not in columns:
+                if verbose:
+                    print u'%s: ip addresses already converted' % table
+                continue
+            converted = self.convert(model, options['batch_size'])
+            if model is models.Vote:
+                # rating keys may not have been migrated yet
+                key_column = 'key' if 'key' in columns else 'key_id'
+                schema.create_index(model, 'ratings_vote_ip_unique',
+                    ('content_type_id', 'object_id', key_column, 'ip', 
+                    'cookie'), unique=True)
+                schema.create_custom_indexes(model)
+            dropped = schema.drop_column(model, LEGACY_COLUMN)
+            if verbose:
+                print u'%s: %d ip addresses converted' % (table, converted)
+                if not dropped:
+                    print (u'%s: run the other upgrade commands and then this '
+                        'command again to remove the %s column' % (
+                        table, LEGACY_COLUMN))
@@ -0,0 +1,101 @@
+from __future__ import with_statement
+
+from django.db import connections, router, transaction
+from django.core.management.base import BaseCommand, make_option
+
+from ratings import models, schema, fields
+
+# the column storing rating key names in previous versions
+LEGACY_COLUMN = 'key'
+
+class Command(BaseCommand):
+    """
+    Move the rating keys stored by previous versions of this app to the
+    *RatingKey* registry table, e.g.::
+
+        ./manage.py migrate_rating_keys -b 5000
+
+    Votes and scores now store the id of their key in the *key_id* column:
+    the command adds the column, registers the keys, converts the rows
+    in batches, creates the related unique indexes and removes the old
+    *key* column (in SQLite, the table is recreated).
+    The command can be interrupted and run again.
+    """
+    option_list = BaseCommand.option_list + (
+        make_option('-b', "--batch-size",
+            action='store', dest='batch_size', default=1000, type='int',
+            help=('The number of rows converted in a transaction.')
+        ),
+    )
+    help = "Move rating keys to the registry table."
+
+    def convert(self, model, batch_size):
+        """
+        Store in the new column of the *model* table the ids of the keys
+        in the legacy column, *batch_size* rows at a time.
+        Return the number of converted rows.
+        """
+        using = router.db_for_write(model)
+        connection = connections[using]
+        qn = connection.ops.quote_name
+        column = model._meta.get_field('key').column
+        select = 'SELECT id, %s FROM %s WHERE %s IS NULL ORDER BY id' % (
+            qn(LEGACY_COLUMN), qn(model._meta.db_table), qn(column))
+        update = 'UPDATE %s SET %s = %%s WHERE id = %%s' % (
+            qn(model._meta.db_table), qn(column))
+        converted = 0
+        while True:
+            with transaction.commit_on_success(using=using):
+                cursor = connection.cursor()
+                cursor.execute('%s LIMIT %d' % (select, batch_size))
+                rows = cursor.fetchall()
+                if not rows:
+                    return converted
+                cursor.executemany(update, 
+                    [(fields.get_key_id(name), pk) for pk, name in rows])
+            converted += len(rows)
+
+    def create_indexes(self, model, columns):
+        """
+        Create the unique and custom indexes of the *model* table using 
+        the key ids.
+        """
+        schema.create_custom_indexes(model)
+        table = model._meta.db_table
+        target = ('content_type_id', 'object_id', 'key_id')
+        if model is models.Score:
+            schema.create_index(model, '%s_key_unique' % table, target,
+                unique=True)
+        elif model in (models.Vote, models.ArchivedVote):
+            schema.create_index(model, '%s_key_user_unique' % table,
+                target + ('user_id',), unique=True)
+            if model is models.Vote:
+                # ip addresses may not have been migrated yet
+                ip_column = 'ip' if 'ip' in columns else 'ip_address'
+                schema.create_index(model, '%s_key_ip_unique' % table,
+                    target + (ip_column, 'cookie'), unique=True)
+            else:
+                schema.create_index(model, '%s_key_cookie_unique' % table,
+                    target + ('cookie',), unique=True)
+
+    def handle(self, **options):
+        verbose = int(options.get('verbosity')) > 0
+        for model in (models.Score, models.Vote, models.BufferedVote,
+            models.ArchivedVote):
+            table = model._meta.db_table
+            columns = schema.get_columns(model)
+            if model._meta.get_field('key').column not in columns:
+                schema.add_column(model, 'key')
+            if LEGACY_COLUMN not in columns:
+                if verbose:
+                    print u'%s: rating keys already migrated' % table
+                continue
+            converted = self.convert(model, options['batch_size'])
+            self.create_indexes(model, columns)
+            dropped = schema.drop_column(model, LEGACY_COLUMN)
+            if verbose:
+                print u'%s: %d rows converted' % (table, converted)
+                if not dropped:
+                    print (u'%s: run the other upgrade commands and then this '
+                        'command again to remove the %s column' % (
+                        table, LEGACY_COLUMN))
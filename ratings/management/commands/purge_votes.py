@@ -0,0 +1,80 @@
+import datetime
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.contenttypes.models import ContentType
+from django.core.management.base import BaseCommand, CommandError, make_option
+
+from ratings import purge
+
+class Command(BaseCommand):
+    """
+    Delete all the votes given by a user, by a network of ip addresses
+    or since a given date (or any combination of those), and recalculate
+    the affected scores, e.g.::
+
+        ./manage.py purge_votes -u spammer
+        ./manage.py purge_votes -n 10.1.0.0/16 -s 2012-05-01 --dry-run
+
+    Use the *dry-run* option to only report the votes that would be deleted.
+    """
+    option_list = BaseCommand.option_list + (
+        make_option('-u', "--user",
+            action='store', dest='username', default=None,
+            help=('Delete the votes given by the user with this username.')
+        ),
+        make_option('-n', "--ip-network",
+            action='store', dest='ip_network', default=None,
+            help=('Delete the votes given from this network, e.g. 10.0.0.0/8.')
+        ),
+        make_option('-s', "--since",
+            action='store', dest='since', default=None,
+            help=('Delete the votes given since this date (YYYY-MM-DD).')
+        ),
+        make_option('-c', "--chunk-size",
+            action='store', dest='chunk_size', default=purge.CHUNK_SIZE,
+            type='int', help=('The number of votes deleted by each query.')
+        ),
+        make_option("--dry-run",
+            action='store_true', dest='dry_run', default=False,
+            help=('Only report the number of votes that would be deleted.')
+        ),
+    )
+    help = "Delete votes in bulk and recalculate the affected scores."
+
+    def get_since(self, value):
+        try:
+            since = datetime.datetime.strptime(value, '%Y-%m-%d')
+        except ValueError:
+            raise CommandError('Invalid date: %s' % value)
+        if getattr(settings, 'USE_TZ', False):
+            from django.utils import timezone
+            since = timezone.make_aware(since,
+                timezone.get_default_timezone())
+        return since
+
+    def handle(self, **options):
+        verbosity = int(options.get('verbosity'))
+        user = since = None
+        if options['username']:
+            try:
+                user = User.objects.get(username=options['username'])
+            except User.DoesNotExist:
+                raise CommandError('User not found: %s' % options['username'])
+        if options['since']:
+            since = self.get_since(options['since'])
+        try:
+            report = purge.purge_votes(user=user,
+                ip_network=options['ip_network'], since=since,
+                dry_run=options['dry_run'], chunk_size=options['chunk_size'])
+        except ValueError, e:
+            raise CommandError(str(e))
+        if verbosity > 1:
+            for content_type_id, object_id, key in sorted(report['targets']):
+                content_type = ContentType.objects.get_for_id(content_type_id)
+                print u'model %s id %s key %s' % (content_type, object_id, key)
+        if verbosity > 0:
+            action = 'to be deleted' if options['dry_run'] else 'deleted'
+            print u'%d votes and %d buffered votes %s, %d scores affected' % (
+                report['votes'], report['buffered_votes'], action,
+                len(report['targets']))
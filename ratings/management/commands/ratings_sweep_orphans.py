@@ -0,0 +1,54 @@
+from django.contrib.contenttypes.models import ContentType
+from django.core.management.base import BaseCommand, make_option
+
+from ratings import settings, models, orphans
+
+class Command(BaseCommand):
+    """
+    Delete votes and scores whose target objects no longer exist, e.g.::
+
+        ./manage.py ratings_sweep_orphans --dry-run
+        ./manage.py ratings_sweep_orphans -c 500 -p 0.5
+
+    Use the *dry-run* option to only report the number of orphans for each
+    content type. The *pause* option sets the number of seconds to wait
+    after each deleted chunk, so that the command can be safely run
+    against a live database.
+    """
+    option_list = BaseCommand.option_list + (
+        make_option('-n', "--dry-run",
+            action='store_true', dest='dry_run', default=False,
+            help=('Only report the number of orphaned votes and scores.')
+        ),
+        make_option('-c', "--chunk-size",
+            action='store', dest='chunk_size', default=orphans.CHUNK_SIZE,
+            type='int', help=('The number of ids scanned by each query.')
+        ),
+        make_option('-p', "--pause",
+            action='store', dest='pause', default=0, type='float',
+            help=('The number of seconds to wait after each deleted chunk.')
+        ),
+    )
+    help = "Delete votes and scores whose target objects no longer exist."
+
+    def handle(self, **options):
+        verbose = int(options.get('verbosity')) > 0
+        dry_run = options['dry_run']
+        swept = [models.Vote, models.Score]
+        if settings.ARCHIVE_VOTES:
+            swept.append(models.ArchivedVote)
+        for model in swept:
+            report = orphans.sweep(model, dry_run=dry_run,
+                chunk_size=options['chunk_size'], pause=options['pause'])
+            if not verbose:
+                continue
+            name = model._meta.verbose_name_plural
+            for content_type_id, count in report.items():
+                try:
+                    label = ContentType.objects.get(pk=content_type_id)
+                except ContentType.DoesNotExist:
+                    label = u'content type %d' % content_type_id
+                if dry_run:
+                    print u'%s: %d orphaned %s' % (label, count, name)
+                else:
+                    print u'%s: %d orphaned %s deleted' % (label, count, name)
@@ -0,0 +1,25 @@
+from django.db import transaction
+from django.core.management.base import BaseCommand
+
+from ratings import models
+
+class Command(BaseCommand):
+    """
+    Recalculate from the scores table the statistics of all the rating
+    keys (see *ratings.models.KeyStats*), e.g.::
+
+        ./manage.py rebuild_key_stats
+
+    Key statistics are updated by the voting process: run this command
+    when upgrading an existing installation, and periodically if scores
+    are maintained by database triggers or changed by other means.
+    """
+    help = "Recalculate the statistics of all the rating keys."
+
+    @transaction.commit_on_success
+    def handle(self, **options):
+        models.rebuild_key_stats()
+        if int(options.get('verbosity')) > 0:
+            for stats in models.KeyStats.objects.all():
+                print u'%s: %d scores, %d votes, average %.2f' % (stats, 
+                    stats.num_scores, stats.num_votes, stats.average)
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from ratings.handlers import ratings
+
+class Command(BaseCommand):
+    """
+    Rebuild from the scores table all the cached leaderboards served by
+    rating handlers (see *RatingHandler.get_top*), e.g.::
+
+        ./manage.py rebuild_leaderboards
+
+    Leaderboards are incrementally updated by the voting process: run this
+    command periodically (e.g. every hour) to also take into account the
+    scores changed by other means, e.g. by database triggers or SQL 
+    updates.
+    """
+    help = "Rebuild the cached leaderboards of all rated models."
+
+    def handle(self, **options):
+        verbose = int(options.get('verbosity')) > 0
+        for model, handler in ratings._registry.items():
+            rebuilt = handler.rebuild_leaderboards()
+            if verbose:
+                print u'%s: %d leaderboards rebuilt' % (
+                    model._meta.verbose_name, rebuilt)
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand, make_option
+
+from ratings.handlers import ratings
+
+class Command(BaseCommand):
+    """
+    Repair the score values denormalized in the fields of rated objects
+    (see *RatingHandler.score_fields*), e.g.::
+
+        ./manage.py rebuild_score_fields -c 500
+
+    Denormalized fields are updated by the voting process: run this command
+    when adding them to a model, and periodically if scores are changed by
+    other means, e.g. by purging votes or by SQL updates.
+    """
+    option_list = BaseCommand.option_list + (
+        make_option('-c', "--chunk-size",
+            action='store', dest='chunk_size', default=1000, type='int',
+            help=('The number of rated objects read by each query.')
+        ),
+    )
+    help = "Repair the score values denormalized in rated objects."
+
+    def handle(self, **options):
+        verbose = int(options.get('verbosity')) > 0
+        for model, handler in ratings._registry.items():
+            if not handler.score_fields:
+                continue
+            repaired = handler.rebuild_score_fields(options['chunk_size'])
+            if verbose:
+                print u'%s: %d objects repaired' % (
+                    model._meta.verbose_name, repaired)
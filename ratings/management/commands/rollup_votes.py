@@ -0,0 +1,55 @@
+import datetime
+
+from django.core.management.base import BaseCommand, make_option
+
+from ratings import models, rollups, schema
+
+class Command(BaseCommand):
+    """
+    Compact old vote rollups into coarser buckets, and optionally rebuild
+    the rollups of recent votes from the votes table, e.g.::
+
+        ./manage.py rollup_votes
+        ./manage.py rollup_votes --rebuild -d 7
+
+    Run the command periodically (e.g. daily) to keep the rollups table
+    small (see *ratings.rollups*). Use the *rebuild* option to count
+    the votes given before rollups were enabled, or votes deleted in bulk:
+    without the *days* option, all the rollups are rebuilt. Rollups are
+    rebuilt one range at a time, and votes given while their range is
+    rebuilt can be counted twice or missed: rebuild when the site is quiet
+    (see *ratings.rollups.rebuild_rollups*).
+    """
+    option_list = BaseCommand.option_list + (
+        make_option('-r', "--rebuild",
+            action='store_true', dest='rebuild', default=False,
+            help=('Rebuild the rollups from the votes table.')
+        ),
+        make_option('-d', "--days",
+            action='store', dest='days', default=0, type='int',
+            help=('Rebuild the rollups of the votes created in this '
+                'number of days (0 = all the votes).')
+        ),
+        make_option('-c', "--chunk-size",
+            action='store', dest='chunk_size', default=rollups.CHUNK_SIZE,
+            type='int', help=('The number of rows read in a transaction.')
+        ),
+    )
+    help = "Compact old vote rollups, optionally rebuilding them."
+
+    def handle(self, **options):
+        verbose = int(options.get('verbosity')) > 0
+        if options['rebuild']:
+            # votes are selected by creation date
+            schema.create_custom_indexes(models.Vote)
+            since = None
+            if options['days']:
+                since = datetime.datetime.now() - datetime.timedelta(
+                    days=options['days'])
+            counted = rollups.rebuild_rollups(since=since,
+                chunk_size=options['chunk_size'])
+            if verbose:
+                print u'%d votes counted' % counted
+        compacted = rollups.compact_rollups(chunk_size=options['chunk_size'])
+        if verbose:
+            print u'%d buckets compacted' % compacted
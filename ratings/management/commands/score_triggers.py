@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand, CommandError, make_option
+from django.db import DEFAULT_DB_ALIAS
+
+from ratings import exceptions, settings, triggers
+
+class Command(BaseCommand):
+    """
+    Install, verify or remove the database triggers maintaining scores
+    (available for SQLite and PostgreSQL), e.g.::
+    
+        ./manage.py score_triggers install -w 5
+        ./manage.py score_triggers verify
+        ./manage.py score_triggers remove
+        
+    When installing triggers, existing scores should be recalculated
+    using the *upsert_scores* command with the same weight.
+    """
+    option_list = BaseCommand.option_list + (
+        make_option('-w', "--weight", 
+            action='store', dest='weight', default=settings.WEIGHT, type='int',
+            help=('The weight used to calculate average score.')
+        ),
+        make_option('-d', "--database", 
+            action='store', dest='database', default=DEFAULT_DB_ALIAS,
+            help=('The database where triggers are managed.')
+        ),
+    )
+    args = 'install|verify|remove'
+    help = "Install, verify or remove the triggers maintaining scores."
+
+    def handle(self, action=None, **options):
+        using = options['database']
+        try:
+            if action == 'install':
+                triggers.install(using, weight=options['weight'])
+            elif action == 'remove':
+                triggers.remove(using)
+            elif action != 'verify':
+                raise CommandError('Usage: score_triggers %s' % self.args)
+            installed, missing = triggers.verify(using)
+        except exceptions.UnsupportedDatabase, e:
+            raise CommandError(e)
+        if int(options.get('verbosity')) > 0:
+            print u'Installed triggers: %s' % (u', '.join(installed) or '-')
+            print u'Missing triggers: %s' % (u', '.join(missing) or '-')
@@ -0,0 +1,66 @@
+from __future__ import with_statement
+
+import datetime
+
+from django.db import transaction
+from django.contrib.contenttypes.models import ContentType
+from django.core.management.base import BaseCommand, make_option
+
+from ratings import models, schema
+from ratings.handlers import ratings
+
+class Command(BaseCommand):
+    """
+    Recalculate the rankings of the scores of all rated models, using
+    the *ranking* of their handlers, e.g.::
+
+        ./manage.py update_rankings -c 500
+
+    Run this command after changing the ranking of a handler, and 
+    periodically for handlers using the *bayesian* ranking, whose prior
+    average changes over time. When upgrading an existing installation,
+    the command also adds the *ranking* column to the scores table.
+    """
+    option_list = BaseCommand.option_list + (
+        make_option('-c', "--chunk-size",
+            action='store', dest='chunk_size', default=1000, type='int',
+            help=('The number of scores updated in a transaction.')
+        ),
+    )
+    help = "Recalculate the rankings of all scores."
+
+    def update(self, handler, chunk_size):
+        """
+        Update the rankings of the scores of the *handler* model,
+        *chunk_size* scores at a time. Return the number of changed scores.
+        """
+        content_type = ContentType.objects.get_for_model(handler.model)
+        scores = models.Score.objects.filter(content_type=content_type
+            ).order_by('id')
+        changed = last_id = 0
+        while True:
+            with transaction.commit_on_success():
+                chunk = list(scores.filter(id__gt=last_id)[:chunk_size])
+                if not chunk:
+                    return changed
+                for score in chunk:
+                    if score.key in handler.counter_keys:
+                        value = score.num_votes
+                    else:
+                        value = handler.get_ranking(score)
+                    if value != score.ranking:
+                        models.Score.objects.filter(pk=score.pk).update(
+                            ranking=value, modified_at=datetime.datetime.now())
+                        changed += 1
+                last_id = chunk[-1].id
+
+    def handle(self, **options):
+        verbose = int(options.get('verbosity')) > 0
+        if 'ranking' not in schema.get_columns(models.Score):
+            schema.add_column(models.Score, 'ranking')
+            schema.create_custom_indexes(models.Score)
+        for model, handler in ratings._registry.items():
+            changed = self.update(handler, options['chunk_size'])
+            if verbose:
+                print u'%s: %d rankings updated' % (
+                    model._meta.verbose_name, changed)
@@ -1,6 +1,10 @@
 from django.core.management.base import BaseCommand, make_option
 
-from ratings import models
+from ratings import models, schema
+
+# the columns added to the scores table by later versions of this app
+NEW_COLUMNS = ('ranking', 'sum_squares', 'min_score', 'max_score', 
+    'trending', 'trending_at', 'trending_rank', 'modified_at')
 
 class Command(BaseCommand):
     """
@@ -9,6 +13,11 @@ class Command(BaseCommand):
     or you want to change the weight of current votes, e.g.::
     
         ./manage.y upsert_scores -w 5
+        
+    When upgrading an existing installation, the command also adds to the
+    scores table the columns introduced by later versions, and creates
+    the indexes of the scores, votes and rollups tables introduced by 
+    later versions (see the *sql* directory).
     """
     option_list = BaseCommand.option_list + (
         make_option('-w', "--weight", 
@@ -19,9 +28,17 @@ class Command(BaseCommand):
     help = "Create or update all scores, based on existing votes."
 
     def handle(self, **options):
-        if int(options.get('verbosity')) > 0:
-            verbose = True
-            counter = 0
+        columns = schema.get_columns(models.Score)
+        for name in NEW_COLUMNS:
+            if name not in columns:
+                schema.add_column(models.Score, name)
+                field = models.Score._meta.get_field(name)
+                if field.has_default():
+                    models.Score.objects.update(**{name: field.get_default()})
+        for model in (models.Score, models.Vote, models.VoteRollup):
+            schema.create_custom_indexes(model)
+        verbose = int(options.get('verbosity')) > 0
+        counter = 0
         buffer = set()
         for vote in models.Vote.objects.all():
             content = (vote.content_type, vote.object_id, vote.key)
@@ -1,3 +1,6 @@
+import datetime
+
+from django.conf import settings
 from django.db import models
 from django.utils.functional import memoize
 from django.contrib.contenttypes.models import ContentType
@@ -11,46 +14,213 @@ get_content_type_for_model = memoize(get_content_type_for_model,
     _get_content_type_for_model_cache, 1)
 
 
+# the number of instances whose content objects are retreived together
+CHUNK_SIZE = 100
+
+# the default number of instances in a page of a feed
+PAGE_SIZE = 20
+
+CURSOR_FORMAT = '%Y%m%d%H%M%S%f'
+
+def get_cursor(instance):
+    """
+    Return a string that can be used as keyset cursor, pointing to the
+    given *instance* (having *modified_at* and *id* fields) in a feed.
+    """
+    modified_at = instance.modified_at
+    if getattr(settings, 'USE_TZ', False):
+        from django.utils import timezone
+        modified_at = timezone.make_naive(modified_at, timezone.utc)
+    return '%s-%d' % (modified_at.strftime(CURSOR_FORMAT), instance.id)
+    
+def parse_cursor(cursor):
+    """
+    Return a sequence *(modified_at, id)* given a keyset *cursor*.
+    Raise a *ValueError* if the cursor is not valid.
+    """
+    modified_at, pk = str(cursor).split('-')
+    modified_at = datetime.datetime.strptime(modified_at, CURSOR_FORMAT)
+    if getattr(settings, 'USE_TZ', False):
+        from django.utils import timezone
+        modified_at = timezone.make_aware(modified_at, timezone.utc)
+    return modified_at, int(pk)
+
+
+class Page(list):
+    """
+    A page of a feed: a list of instances having a *next_cursor* attribute, 
+    i.e. the cursor to use to get the next page (None if there are
+    no other pages).
+    """
+    def __init__(self, objects, next_cursor=None):
+        super(Page, self).__init__(objects)
+        self.next_cursor = next_cursor
+
+def resolve_contents(instances, keep_orphans=False):
+    """
+    Retreive in bulk the content objects of the given *instances* (e.g. votes
+    or scores), performing one query for each content type.
+    
+    Return a list of the instances whose content object exists.
+    If *keep_orphans* is True all the instances are returned, and the 
+    *content_object* of orphaned ones is None.
+    """
+    generics = {}
+    for i in instances:
+        generics.setdefault(i.content_type_id, set()).add(i.object_id)
+    content_types, relations = {}, {}
+    for content_type_id, pk_list in generics.items():
+        content_type = ContentType.objects.get_for_id(content_type_id)
+        content_types[content_type_id] = content_type
+        model = content_type.model_class()
+        if model is None:
+            # the model was removed from the project
+            relations[content_type_id] = {}
+        else:
+            relations[content_type_id] = model._default_manager.in_bulk(
+                list(pk_list))
+    objects = []
+    for i in instances:
+        content_object = relations[i.content_type_id].get(i.object_id)
+        if content_object is None and not keep_orphans:
+            continue
+        setattr(i, '_content_type_cache', content_types[i.content_type_id])
+        setattr(i, '_content_object_cache', content_object)
+        objects.append(i)
+    return objects
+
+
+def get_page(queryset, limit=PAGE_SIZE, before=None):
+    """
+    Return a page of at most *limit* instances in *queryset* (having 
+    *modified_at* and *id* fields), newest first.
+    
+    The optional argument *before* is the cursor returned by the previous 
+    page: pages are selected using a keyset on *(modified_at, id)*, so that 
+    every page costs the same, no matter how deep it is.
+    Raise a *ValueError* if the cursor is not valid.
+    """
+    queryset = queryset.order_by('-modified_at', '-id')
+    if before:
+        modified_at, pk = parse_cursor(before)
+        queryset = queryset.filter(models.Q(modified_at__lt=modified_at) |
+            models.Q(modified_at=modified_at, id__lt=pk))
+    objects = list(queryset[:limit + 1])
+    if len(objects) > limit:
+        objects = objects[:limit]
+        return Page(objects, get_cursor(objects[-1]))
+    return Page(objects)
+
+
 class QuerysetWithContents(object):
     """
-    Queryset wrapper.
+    Queryset wrapper retreiving content objects in bulk.
+    
+    Instances are fetched from the database *chunk_size* at a time, and the
+    content objects are retreived for each chunk, using cached content types.
+    Instances whose content object no longer exists are skipped, unless
+    *keep_orphans* is True (in this case their *content_object* is None).
+    
+    Like Django querysets, evaluated results are cached, so that *len()* and
+    repeated iterations do not hit the database again: use *iterator()* to 
+    walk through big querysets without caching results.
     """
-    def __init__(self, queryset):
+    def __init__(self, queryset, chunk_size=CHUNK_SIZE, keep_orphans=False):
         self.queryset = queryset
+        self.chunk_size = chunk_size
+        self.keep_orphans = keep_orphans
+        self._result_cache = None
+        self._iter = None
         
     def __getattr__(self, name):
         if name in ('get', 'create', 'get_or_create', 'count', 'in_bulk',
-            'iterator', 'latest', 'aggregate', 'exists', 'update', 'delete'):
+            'latest', 'aggregate', 'exists', 'update', 'delete'):
             return getattr(self.queryset, name)
         if hasattr(self.queryset, name):
             attr = getattr(self.queryset, name)
             if callable(attr):
                 def _wrap(*args, **kwargs):
-                    return self.__class__(attr(*args, **kwargs))
+                    return self._clone(attr(*args, **kwargs))
                 return _wrap
             return attr
         raise AttributeError(name)
+        
+    def _clone(self, queryset):
+        return self.__class__(queryset, chunk_size=self.chunk_size,
+            keep_orphans=self.keep_orphans)
+            
+    def _fill_cache(self):
+        """
+        Add the next chunk of results to the cache.
+        """
+        try:
+            for i in xrange(self.chunk_size):
+                self._result_cache.append(self._iter.next())
+        except StopIteration:
+            self._iter = None
             
     def __getitem__(self, key):
-        return self.__class__(self.queryset[key])
+        if self._result_cache is not None and self._iter is None:
+            return self._result_cache[key]
+        if isinstance(key, slice):
+            return self._clone(self.queryset[key])
+        return resolve_contents([self.queryset[key]], keep_orphans=True)[0]
         
+    def iterator(self):
+        """
+        An iterator over the results, retreiving content objects one chunk
+        at a time, and not caching results.
+        """
+        chunk = []
+        for instance in self.queryset.iterator():
+            chunk.append(instance)
+            if len(chunk) == self.chunk_size:
+                for i in resolve_contents(chunk, self.keep_orphans):
+                    yield i
+                chunk = []
+        for i in resolve_contents(chunk, self.keep_orphans):
+            yield i
+            
     def __iter__(self):
-        objects = list(self.queryset)
-        generics = {}
-        for i in objects:
-            generics.setdefault(i.content_type_id, set()).add(i.object_id)
-        content_types = ContentType.objects.in_bulk(generics.keys())
-        relations = {}
-        for content_type_id, pk_list in generics.items():
-            model = content_types[content_type_id].model_class()
-            relations[content_type_id] = model.objects.in_bulk(pk_list)
-        for i in objects:
-            setattr(i, '_content_object_cache', 
-                relations[i.content_type_id][i.object_id])
-        return iter(objects)
+        if self._result_cache is None:
+            self._result_cache = []
+            self._iter = self.iterator()
+        position = 0
+        while True:
+            while position < len(self._result_cache):
+                yield self._result_cache[position]
+                position += 1
+            if self._iter is None:
+                return
+            self._fill_cache()
+        
+    def page(self, limit=PAGE_SIZE, before=None):
+        """
+        Return a page of at most *limit* instances, newest first (the wrapped
+        queryset must be of instances with *modified_at* and *id* fields).
+        Content objects are retreived only for the instances in the page.
+        
+        The optional argument *before* is the cursor returned by the 
+        previous page, e.g.::
+        
+            page = handler.get_votes_by(user).page(20)
+            next_page = handler.get_votes_by(user).page(20, page.next_cursor)
+            
+        See *get_page* for details.
+        """
+        page = get_page(self.queryset, limit, before)
+        return Page(resolve_contents(page, self.keep_orphans), page.next_cursor)
         
     def __len__(self):
-        return len(self.queryset)
+        if self._result_cache is None or self._iter is not None:
+            for i in self:
+                pass
+        return len(self._result_cache)
+        
+    def __nonzero__(self):
+        for i in self:
+            return True
+        return False
                 
 
 class RatingsManager(models.Manager):
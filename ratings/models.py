@@ -1,15 +1,38 @@
+import math
 import string
+import datetime
+import threading
 
-from django.db import models, transaction, IntegrityError
+from django.db import models, connections, transaction, IntegrityError
+from django.db.models.query import EmptyQuerySet
+from django.db.models.sql.datastructures import EmptyResultSet
 from django.contrib.contenttypes.models import ContentType
 from django.contrib.contenttypes import generic
 from django.utils.datastructures import SortedDict
 from django.contrib.auth.models import User
 
-from ratings import managers
+from ratings import managers, settings, fields
 
 # MODELS
 
+class RatingKey(models.Model):
+    """
+    A rating key, e.g. *'main'*.
+    
+    Votes and scores store the small integer id of their key (see
+    *ratings.fields.RatingKeyField*), keeping the largest tables and their
+    indexes narrow. Keys are registered automatically.
+    """
+    name = models.CharField(max_length=16, unique=True)
+    
+    def __unicode__(self):
+        return self.name
+
+
+# the fields of a score changed by votes (see *Score.recalculate*)
+RECALCULATED_FIELDS = ('total', 'num_votes', 'sum_squares', 'min_score',
+    'max_score', 'average', 'ranking')
+
 class Score(models.Model):
     """
     A score for a content object.
@@ -18,11 +41,24 @@ class Score(models.Model):
     object_id = models.PositiveIntegerField()
     content_object = generic.GenericForeignKey('content_type', 'object_id')
     
-    key = models.CharField(max_length=16)
+    key = fields.RatingKeyField(db_column='key_id')
     
     average = models.FloatField(default=0)
     total = models.IntegerField(default=0)
     num_votes = models.PositiveIntegerField(default=0)
+    ranking = models.FloatField(default=0)
+    sum_squares = models.FloatField(default=0)
+    min_score = models.FloatField(null=True)
+    max_score = models.FloatField(null=True)
+    
+    # the trending value when last updated (see *update_trending*)
+    trending = models.FloatField(default=0)
+    trending_at = models.DateTimeField(null=True)
+    trending_rank = models.FloatField(default=0)
+    
+    # the time of the last change, used to refresh score snapshots
+    # (see *ratings.snapshots*)
+    modified_at = models.DateTimeField(auto_now=True, null=True)
     
     # manager
     objects = managers.RatingsManager()
@@ -40,34 +76,184 @@ class Score(models.Model):
         return Vote.objects.filter(content_type=self.content_type,
             object_id=self.object_id, key=self.key)
     
-    def recalculate(self, weight=0, commit=True):
+    def get_archived_votes(self):
+        """
+        Return all the related archived votes (see *ArchivedVote*).
+        """
+        return ArchivedVote.objects.filter(content_type=self.content_type,
+            object_id=self.object_id, key=self.key)
+    
+    def recalculate(self, weight=0, commit=True, counter=False, ranking=None):
         """
         Recalculate the score using all the related votes, and updating
-        average score, total score and number of votes.
+        average score, total score, number of votes, ranking, sum of the
+        squares of the votes and minimum and maximum vote.
         
         The optional argument *weight* is used to calculate the average
         score: an higher value means a lot of votes are needed to increase
         the average score of the target object.
         
+        The optional argument *ranking* is a callable taking the score
+        and returning its ranking (see *ratings.ranking*): by default
+        the ranking is the average score.
+        
+        If the optional argument *counter* is True then only the number
+        of votes is recalculated (average and total scores are not used
+        by counter ratings, e.g. likes), and the ranking is the number 
+        of votes.
+        
         If the optional argument *commit* is False then the object
-        is not saved.
+        is not saved, and key statistics (see *KeyStats*) are not updated.
+        Otherwise the stored score is locked using *SELECT ... FOR UPDATE*
+        where the database supports it, until the transaction ends, and
+        only the recalculated fields are saved: e.g. trending values 
+        (see *update_trending*) are left untouched.
         """
-        data = self.get_votes().aggregate(total=models.Sum('score'), 
-            num_votes=models.Count('id'))
-        # total is None in MySQL if there are no votes
-        self.total = data['total'] or 0
-        self.num_votes = data['num_votes']
+        querysets = [self.get_votes()]
+        if settings.ARCHIVE_VOTES:
+            querysets.append(self.get_archived_votes())
+        old_total, old_num_votes = self.total, self.num_votes
+        if commit and self.pk:
+            # lock the score before reading the votes: concurrent 
+            # recalculations wait and then start from the values saved
+            # here, so that their key statistics changes do not overlap
+            stored = list(Score.objects.select_for_update().filter(
+                pk=self.pk).values_list('total', 'num_votes'))
+            if stored:
+                old_total, old_num_votes = stored[0]
+        if counter:
+            self.num_votes = self.ranking = sum(i.count() for i in querysets)
+            if commit:
+                self._save_fields(['num_votes', 'ranking'])
+                self._update_key_stats(old_total, old_num_votes)
+            return
+        self.total = self.num_votes = self.sum_squares = 0
+        self.min_score = self.max_score = None
+        for queryset in querysets:
+            total, num_votes, sum_squares, min_score, max_score = (
+                _aggregate_votes(queryset))
+            if not num_votes:
+                continue
+            self.total += total
+            self.num_votes += num_votes
+            self.sum_squares += sum_squares
+            self.min_score = min(i for i in (self.min_score, min_score) 
+                if i is not None)
+            self.max_score = max(self.max_score, max_score)
         if self.num_votes:
             self.average = self.total / (self.num_votes + weight)
         else:
             self.average = 0
+        self.ranking = self.average if ranking is None else ranking(self)
         if commit:
+            self._save_fields(RECALCULATED_FIELDS)
+            self._update_key_stats(old_total, old_num_votes)
+            
+    def _save_fields(self, names):
+        """
+        Save only the fields *names* and the modification time, so that
+        the other stored values, e.g. trending values changed concurrently
+        by *update_trending*, are not overwritten.
+        """
+        self.modified_at = datetime.datetime.now()
+        if self.pk is None:
             self.save()
+        else:
+            Score.objects.filter(pk=self.pk).update(**dict((i, 
+                getattr(self, i)) for i in list(names) + ['modified_at']))
+            
+    def _update_key_stats(self, old_total, old_num_votes):
+        """
+        Apply to the key statistics the changes of this score since it
+        had *old_total* and *old_num_votes*.
+        """
+        update_key_stats(self.content_type_id, self.key, 
+            num_scores=bool(self.num_votes) - bool(old_num_votes),
+            num_votes=self.num_votes - old_num_votes,
+            total=self.total - old_total)
+        
+    @property
+    def mean(self):
+        """
+        The mean of the votes (not weighted, see *average*).
+        """
+        if self.num_votes:
+            return float(self.total) / self.num_votes
+        return 0
         
+    @property
+    def variance(self):
+        """
+        The variance of the votes, calculated without reading them.
+        """
+        if not self.num_votes:
+            return 0
+        mean = self.mean
+        # rounding errors could make the variance slightly negative
+        return max(self.sum_squares / self.num_votes - mean * mean, 0)
+        
+    @property
+    def stddev(self):
+        """
+        The standard deviation of the votes, e.g. to find controversial
+        target objects.
+        """
+        return math.sqrt(self.variance)
+        
+    def get_confidence_interval(self, z=1.96):
+        """
+        Return a tuple *(low, high)* containing the confidence interval
+        of the mean of the votes (the default *z* gives a 95% confidence).
+        """
+        if not self.num_votes:
+            return (0, 0)
+        margin = z * self.stddev / math.sqrt(self.num_votes)
+        return (self.mean - margin, self.mean + margin)
+        
+    def get_trending(self, half_life, now=None):
+        """
+        Return the trending value of the score at the datetime *now*
+        (by default, the current time): the stored value decays 
+        exponentially, halving every *half_life* seconds (see 
+        *update_trending*).
+        """
+        if not self.trending or self.trending_at is None:
+            return 0
+        now = now or datetime.datetime.now()
+        return self.trending * _decay(now - self.trending_at, half_life)
+    
     def get_stats(self):
         """
-        Return useful statistics for all the related votes 
-        (same *content_object* and *key*). as a *SortedDict* mapping
+        Return a dict containing the statistics of the related votes
+        (same *content_object* and *key*), calculated from the stored 
+        values without reading the votes, e.g.::
+        
+            {
+                'num_votes': 8,
+                'total': 27.0,
+                'mean': 3.375,
+                'variance': 1.234375,
+                'stddev': 1.111024,
+                'min_score': 1.0,
+                'max_score': 5.0,
+                'confidence_interval': (2.605, 4.145),
+            }
+        """
+        return {
+            'num_votes': self.num_votes,
+            'total': self.total,
+            'mean': self.mean,
+            'variance': self.variance,
+            'stddev': self.stddev,
+            'min_score': self.min_score,
+            'max_score': self.max_score,
+            'confidence_interval': self.get_confidence_interval(),
+        }
+        
+    def get_distribution(self):
+        """
+        Return the distribution of the related votes 
+        (same *content_object* and *key*) as a *SortedDict* mapping
         the single score with stats, e.g.::
     
             1.0: {
@@ -76,8 +262,21 @@ class Score(models.Model):
                 'total_num_votes': 8, 
                 'num_votes': 3
             }
+        
+        The related votes are grouped by score using one query (two if
+        archived votes are used, see *ArchivedVote*).
         """
-        return get_stats_for(self.get_votes(), num_votes=self.num_votes)
+        stats = get_stats_for(self.get_votes(), num_votes=self.num_votes)
+        if settings.ARCHIVE_VOTES:
+            archived = get_stats_for(self.get_archived_votes(), 
+                num_votes=self.num_votes)
+            for score, i in archived.items():
+                if score in stats:
+                    i['num_votes'] += stats[score]['num_votes']
+                    i['percent'] += stats[score]['percent']
+                stats[score] = i
+            stats.keyOrder.sort()
+        return stats
         
         
 class Vote(models.Model):
@@ -88,11 +287,11 @@ class Vote(models.Model):
     object_id = models.PositiveIntegerField()
     content_object = generic.GenericForeignKey('content_type', 'object_id')
     
-    key = models.CharField(max_length=16)
+    key = fields.RatingKeyField(db_column='key_id')
     score = models.FloatField()
 
     user = models.ForeignKey(User, blank=True, null=True, related_name='votes')
-    ip_address = models.IPAddressField(null=True)
+    ip_address = fields.PackedIPAddressField(null=True, db_column='ip')
     cookie = models.CharField(max_length=40, blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
     modified_at = models.DateTimeField(auto_now=True)
@@ -106,6 +305,11 @@ class Vote(models.Model):
             ('content_type', 'object_id', 'key', 'ip_address', 'cookie'),
         )
 
+    def __init__(self, *args, **kwargs):
+        super(Vote, self).__init__(*args, **kwargs)
+        # the score stored in the database, used to detect changes
+        self._stored_score = self.score if self.pk else None
+
     def __unicode__(self):
         return u'Vote %d to %s by %s' % (self.score, self.content_object,
             self.user or self.ip_address)
@@ -129,9 +333,202 @@ class Vote(models.Model):
         """
         return not self.user_id
         
+    def has_changed(self):
+        """
+        Return True if this vote is not yet saved, or if its score
+        differs from the one stored in the database.
+        """
+        return not self.pk or self.score != self._stored_score
+
+
+class BufferedVote(models.Model):
+    """
+    A vote waiting to be written to the *Vote* table.
+
+    Handlers using write-behind voting append votes here, and
+    *ratings.buffer.flush* moves them to the real votes table in batches.
+    A buffered vote with a score of 0 represents a vote deletion.
+    """
+    content_type = models.ForeignKey(ContentType)
+    object_id = models.PositiveIntegerField()
+
+    key = fields.RatingKeyField(db_column='key_id')
+    score = models.FloatField()
+
+    user = models.ForeignKey(User, blank=True, null=True,
+        related_name='buffered_votes')
+    ip_address = fields.PackedIPAddressField(null=True, db_column='ip')
+    cookie = models.CharField(max_length=40, blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __unicode__(self):
+        return u'Buffered vote %d to %s by %s' % (self.score,
+            self.content_type, self.user_id or self.ip_address)
+
+
+class ArchivedVote(models.Model):
+    """
+    A compact copy of an old vote, moved out of the *Vote* table by
+    the *archive_votes* management command (see *ratings.archive*).
+    
+    Archived votes still contribute to scores and score statistics if
+    the *GENERIC_RATINGS_ARCHIVE_VOTES* setting is True. Ip addresses
+    are not archived.
+    """
+    content_type = models.ForeignKey(ContentType)
+    object_id = models.PositiveIntegerField()
+    content_object = generic.GenericForeignKey('content_type', 'object_id')
+    
+    key = fields.RatingKeyField(db_column='key_id')
+    score = models.FloatField()
+
+    user = models.ForeignKey(User, blank=True, null=True, 
+        related_name='archived_votes')
+    cookie = models.CharField(max_length=40, blank=True, null=True)
+    created_at = models.DateTimeField()
+    modified_at = models.DateTimeField()
+    
+    # manager
+    objects = managers.RatingsManager()
+    
+    class Meta:
+        unique_together = (
+            ('content_type', 'object_id', 'key', 'user'),
+            ('content_type', 'object_id', 'key', 'cookie'),
+        )
+
+    def __unicode__(self):
+        return u'Archived vote %d to %s by %s' % (self.score, 
+            self.content_object, self.user or self.cookie)
+        
+    def by_anonymous(self):
+        """
+        Return True if this vote is given by an anonymous user.
+        """
+        return not self.user_id
+
+
+class KeyStats(models.Model):
+    """
+    Statistics of all the scores given to a content type using a key, 
+    e.g. the site average used as prior by Bayesian rankings.
+    
+    Key statistics are updated using atomic deltas each time a score is
+    written or deleted (see *update_key_stats*), so that they are never 
+    calculated scanning the scores table.
+    """
+    content_type = models.ForeignKey(ContentType)
+    key = fields.RatingKeyField(db_column='key_id')
+    
+    num_scores = models.IntegerField(default=0)
+    num_votes = models.IntegerField(default=0)
+    total = models.IntegerField(default=0)
+    
+    class Meta:
+        unique_together = ('content_type', 'key')
+        verbose_name_plural = 'key stats'
+        
+    def __unicode__(self):
+        return u'Stats for %s (%s)' % (self.content_type, self.key)
+        
+    @property
+    def average(self):
+        """
+        The average of all the votes.
+        """
+        if self.num_votes:
+            return float(self.total) / self.num_votes
+        return 0
+    
+    @property
+    def average_votes(self):
+        """
+        The average number of votes of target objects having votes.
+        """
+        if self.num_scores:
+            return float(self.num_votes) / self.num_scores
+        return 0
+
+
+class VoteRollup(models.Model):
+    """
+    The number and the sum of the votes given to a content object using 
+    a key in a time bucket, e.g. an hour, used to calculate trends and 
+    averages over time windows without scanning the votes table
+    (see *ratings.rollups*).
+    
+    Votes are counted in the bucket containing their creation time.
+    Recent buckets are *GENERIC_RATINGS_ROLLUP_BUCKET_SIZE* seconds long,
+    while older ones are compacted into coarser buckets.
+    """
+    content_type = models.ForeignKey(ContentType)
+    object_id = models.PositiveIntegerField()
+    content_object = generic.GenericForeignKey('content_type', 'object_id')
+    
+    key = fields.RatingKeyField(db_column='key_id')
+    
+    bucket_start = models.DateTimeField()
+    bucket_size = models.PositiveIntegerField()
+    num_votes = models.IntegerField(default=0)
+    total = models.FloatField(default=0)
+    
+    class Meta:
+        unique_together = ('content_type', 'object_id', 'key', 
+            'bucket_start', 'bucket_size')
+        
+    def __unicode__(self):
+        return u'Votes to %s from %s' % (self.content_object, 
+            self.bucket_start)
+        
+    @property
+    def average(self):
+        """
+        The average of the votes in the bucket.
+        """
+        if self.num_votes:
+            return self.total / self.num_votes
+        return 0
+
 
 # UTILS
 
+def _aggregate_votes(votes):
+    """
+    Return a tuple *(total, num_votes, sum_squares, min, max)* of the
+    scores of the *votes* queryset, using one query.
+    """
+    sql, params = votes.values_list('score').query.get_compiler(
+        using=votes.db).as_sql()
+    cursor = connections[votes.db].cursor()
+    cursor.execute('SELECT SUM(score), COUNT(*), SUM(score * score), '
+        'MIN(score), MAX(score) FROM (%s) votes' % sql, params)
+    total, num_votes, sum_squares, min_score, max_score = cursor.fetchone()
+    # sums are None if there are no votes
+    return (total or 0, num_votes, sum_squares or 0, min_score, max_score)
+
+def _decay(age, half_life):
+    """
+    Return the factor by which a value decays in the timedelta *age*.
+    """
+    seconds = age.days * 86400 + age.seconds + age.microseconds / 1e6
+    return 0.5 ** (seconds / float(half_life))
+
+# trending ranks are calculated as if values decayed since the epoch
+TRENDING_EPOCH = datetime.datetime(1970, 1, 1)
+
+def _get_trending_rank(value, when, half_life):
+    """
+    Return the base 2 logarithm of the trending *value* at the datetime 
+    *when*, brought back to *TRENDING_EPOCH*. The decay is the same for 
+    all the scores, so that sorting by rank is the same as sorting by 
+    the current trending value, at any time.
+    """
+    if value <= 0:
+        return 0
+    age = when - TRENDING_EPOCH
+    seconds = age.days * 86400 + age.seconds + age.microseconds / 1e6
+    return math.log(value, 2) + seconds / float(half_life)
+
 def _get_content(instance_or_content):
     """
     Given a model instance or a sequence *(content_type, object_id)*
@@ -179,7 +576,8 @@ def get_stats_for(votes, num_votes=None):
         
 # ADDING OR CHANGING SCORES AND VOTES
 
-def upsert_score(instance_or_content, key, weight=0):
+def upsert_score(instance_or_content, key, weight=0, counter=False, 
+    ranking=None):
     """
     Update or create current score values (average score, total score and 
     number of votes) for target object *instance_or_content* and 
@@ -191,24 +589,286 @@ def upsert_score(instance_or_content, key, weight=0):
     You can use the optional argument *weight* to make more difficult
     for a target object to obtain a higher rating.
     
+    If *counter* is True, only the number of votes is updated.
+    
+    The optional argument *ranking* is a callable used to calculate 
+    the ranking of the score (see *Score.recalculate*).
+    
     Return a sequence *score, created*.
     """
     content_type, object_id = _get_content(instance_or_content)
     score, created = Score.objects.get_or_create(content_type=content_type,
         object_id=object_id, key=key)
-    score.recalculate(weight=weight)
+    score.recalculate(weight=weight, counter=counter, ranking=ranking)
     return score, created
 
+def apply_vote(instance_or_content, key, score=None, old_score=None, 
+    weight=0, ranking=None):
+    """
+    Update the score for target object *instance_or_content* and the given
+    *key* after a single vote was saved or deleted, without reading all 
+    the votes: *score* is the new value of the vote (None if the vote was
+    deleted) and *old_score* its previous value (None if the vote was 
+    created).
+    
+    Total score, number of votes and sum of the squares of the votes are 
+    updated adding the vote deltas, and the minimum and maximum vote are
+    widened. Only if the previous value of the vote was the minimum or
+    the maximum one, they are recalculated using one query.
+    Average score and ranking are calculated as in *Score.recalculate*.
+    
+    The stored score is locked using *SELECT ... FOR UPDATE* where the 
+    database supports it, and only the changed fields are saved: e.g.
+    trending values (see *update_trending*) are left untouched.
+    If the score does not exist, it is created using *upsert_score*.
+    
+    Return the score instance.
+    """
+    content_type, object_id = _get_content(instance_or_content)
+    try:
+        instance = Score.objects.select_for_update().get(
+            content_type=content_type, object_id=object_id, key=key)
+    except Score.DoesNotExist:
+        return upsert_score(instance_or_content, key, weight=weight, 
+            ranking=ranking)[0]
+    old_total, old_num_votes = instance.total, instance.num_votes
+    min_score, max_score = instance.min_score, instance.max_score
+    for value, sign in ((old_score, -1), (score, 1)):
+        if value is not None:
+            instance.total += sign * value
+            instance.num_votes += sign
+            instance.sum_squares += sign * value * value
+    if instance.num_votes <= 0:
+        instance.total = instance.num_votes = instance.sum_squares = 0
+        instance.min_score = instance.max_score = None
+    elif old_score is not None and (
+        old_score == min_score and (score is None or score > min_score) or
+        old_score == max_score and (score is None or score < max_score)):
+        # the previous value could be the only vote at the bound
+        instance.min_score = instance.max_score = None
+        querysets = [instance.get_votes()]
+        if settings.ARCHIVE_VOTES:
+            querysets.append(instance.get_archived_votes())
+        for queryset in querysets:
+            bounds = _aggregate_votes(queryset)[3:]
+            if bounds[0] is not None:
+                instance.min_score = min(i for i in (instance.min_score, 
+                    bounds[0]) if i is not None)
+                instance.max_score = max(instance.max_score, bounds[1])
+    elif score is not None:
+        instance.min_score = score if min_score is None else min(
+            min_score, score)
+        instance.max_score = max(max_score, score)
+    if instance.num_votes:
+        instance.average = instance.total / float(
+            instance.num_votes + weight)
+    else:
+        instance.average = 0
+    instance.ranking = (instance.average if ranking is None 
+        else ranking(instance))
+    instance._save_fields(RECALCULATED_FIELDS)
+    instance._update_key_stats(old_total, old_num_votes)
+    return instance
+
+def delete_vote(vote):
+    """
+    Delete the saved *vote* from the database.
+    Return True if the vote was deleted by this call, False if it was
+    already deleted, e.g. by a concurrent request: only the caller that
+    actually deleted the vote must update scores and counters.
+    Like *Model.delete*, the primary key of the vote is set to None.
+    """
+    connection = connections[Vote.objects.db]
+    qn = connection.ops.quote_name
+    cursor = connection.cursor()
+    cursor.execute('DELETE FROM %s WHERE %s = %%s' % (
+        qn(Vote._meta.db_table), qn(Vote._meta.pk.column)), [vote.pk])
+    transaction.commit_unless_managed(using=connection.alias)
+    vote.pk = None
+    return cursor.rowcount > 0
+    
+def increment_score(instance_or_content, key, delta=1):
+    """
+    Atomically add *delta* (that can be negative) to the number of votes
+    of the score for target object *instance_or_content* and the given *key*,
+    creating the score if it does not exist.
+    
+    Average and total scores are left untouched: this is used for counter
+    ratings (e.g. likes), where only the number of votes is meaningful
+    (and it is also used as ranking).
+    
+    The argument *instance_or_content* can be a model instance or 
+    a sequence *(content_type, object_id)*.
+    """
+    content_type, object_id = _get_content(instance_or_content)
+    scores = Score.objects.filter(content_type=content_type, 
+        object_id=object_id, key=key)
+    changes = {
+        'num_votes': models.F('num_votes') + delta,
+        'ranking': models.F('ranking') + delta,
+        'modified_at': datetime.datetime.now(),
+    }
+    if scores.update(**changes):
+        update_key_stats(content_type, key, num_votes=delta)
+        return
+    if delta < 0:
+        return
+    # the score does not exist: create it, unless another thread did it
+    sid = transaction.savepoint()
+    try:
+        Score.objects.create(content_type=content_type, object_id=object_id,
+            key=key, num_votes=delta, ranking=delta)
+    except IntegrityError:
+        transaction.savepoint_rollback(sid)
+        scores.update(**changes)
+        update_key_stats(content_type, key, num_votes=delta)
+    else:
+        transaction.savepoint_commit(sid)
+        update_key_stats(content_type, key, num_scores=1, num_votes=delta)
+
+# the number of times a trending update is retried on concurrent changes
+TRENDING_RETRIES = 5
+
+def update_trending(instance_or_content, key, half_life, delta=1, when=None):
+    """
+    Add *delta* to the trending value of the score for target object 
+    *instance_or_content* and the given *key*, as a vote given at
+    the datetime *when* (by default, now). To remove a deleted vote, pass
+    a negative *delta* and the time the vote was created.
+    
+    Contributions decay exponentially, halving every *half_life* seconds:
+    the stored value is decayed to the current time before adding the
+    contribution, and stored together with the time of the update, so 
+    that the votes are never read. The *trending_rank* field, used to 
+    sort scores by trending value, is updated too.
+    
+    The update is optimistic, and retried if the score is concurrently
+    changed. Return the new trending value, or None if the score does 
+    not exist or it kept changing.
+    """
+    content_type, object_id = _get_content(instance_or_content)
+    now = datetime.datetime.now()
+    when = when or now
+    scores = Score.objects.filter(content_type=content_type, 
+        object_id=object_id, key=key)
+    for i in range(TRENDING_RETRIES):
+        try:
+            trending, trending_at = scores.values_list('trending', 
+                'trending_at').get()
+        except Score.DoesNotExist:
+            return None
+        value = delta * _decay(now - when, half_life)
+        if trending and trending_at is not None:
+            value += trending * _decay(now - trending_at, half_life)
+        # rounding errors could leave a negative value after deletions
+        value = max(value, 0)
+        if scores.filter(trending=trending, trending_at=trending_at).update(
+            trending=value, trending_at=now, 
+            trending_rank=_get_trending_rank(value, now, half_life)):
+            return value
+    return None
+
+def update_key_stats(content_type, key, num_scores=0, num_votes=0, total=0):
+    """
+    Atomically add the given deltas to the statistics of the given
+    *content_type* (a content type instance or id) and *key*, creating 
+    them if they do not exist (see *KeyStats*).
+    """
+    if not (num_scores or num_votes or total):
+        return
+    stats = KeyStats.objects.filter(content_type=content_type, key=key)
+    changes = {
+        'num_scores': models.F('num_scores') + num_scores,
+        'num_votes': models.F('num_votes') + num_votes,
+        'total': models.F('total') + total,
+    }
+    if stats.update(**changes):
+        return
+    if isinstance(content_type, ContentType):
+        content_type = content_type.pk
+    sid = transaction.savepoint()
+    try:
+        KeyStats.objects.create(content_type_id=content_type, 
+            key=fields.get_key_name(key), num_scores=num_scores, 
+            num_votes=num_votes, total=total)
+    except IntegrityError:
+        transaction.savepoint_rollback(sid)
+        stats.update(**changes)
+    else:
+        transaction.savepoint_commit(sid)
+        
+def rebuild_key_stats(content_type=None):
+    """
+    Recalculate from the scores table the statistics of all the keys, or
+    only the ones of the given *content_type*.
+    """
+    scores = Score.objects.filter(num_votes__gt=0)
+    stats = KeyStats.objects.all()
+    if content_type is not None:
+        scores = scores.filter(content_type=content_type)
+        stats = stats.filter(content_type=content_type)
+    rows = scores.order_by().values('content_type', 'key').annotate(
+        count=models.Count('id'), votes=models.Sum('num_votes'),
+        sum=models.Sum('total'))
+    stats.delete()
+    KeyStats.objects.bulk_create([KeyStats(content_type_id=i['content_type'],
+        key=fields.get_key_name(i['key']), num_scores=i['count'], 
+        num_votes=i['votes'], total=i['sum'] or 0) for i in rows])
+
 
 # DELETING SCORES AND VOTES
 
+# set while *delete_scores* runs: its scores are subtracted from key 
+# statistics in bulk, not by *deleting_score*
+_deleting_scores = threading.local()
+
+def delete_scores(queryset):
+    """
+    Delete the scores in *queryset*, subtracting them from the key 
+    statistics (see *KeyStats*).
+    """
+    for i in queryset.filter(num_votes__gt=0).order_by().values(
+        'content_type', 'key').annotate(count=models.Count('id'), 
+        votes=models.Sum('num_votes'), sum=models.Sum('total')):
+        update_key_stats(i['content_type'], i['key'], num_scores=-i['count'],
+            num_votes=-i['votes'], total=-(i['sum'] or 0))
+    _deleting_scores.active = True
+    try:
+        queryset.delete()
+    finally:
+        _deleting_scores.active = False
+
+def deleting_score(sender, instance, **kwargs):
+    """
+    The score *instance* is being deleted by the ORM, e.g. together with
+    its *RatedModel* target object (by the *rating_scores* generic 
+    relation), so we must subtract it from the key statistics.
+    
+    The score is deleted at once, and subtracted only if it was still 
+    there: the target object cleanup may have deleted it already, using 
+    *delete_scores*. This receiver is connected by the ratings registry.
+    """
+    if getattr(_deleting_scores, 'active', False):
+        return
+    connection = connections[Score.objects.db]
+    qn = connection.ops.quote_name
+    cursor = connection.cursor()
+    cursor.execute('DELETE FROM %s WHERE %s = %%s' % (
+        qn(Score._meta.db_table), qn(Score._meta.pk.column)), [instance.pk])
+    transaction.commit_unless_managed(using=connection.alias)
+    if cursor.rowcount > 0 and instance.num_votes:
+        update_key_stats(instance.content_type_id, instance.key, 
+            num_scores=-1, num_votes=-instance.num_votes, 
+            total=-instance.total)
+
 def delete_scores_for(instance_or_content):
     """
     Delete all score objects related to *instance_or_content*, that can be 
     a model instance or a sequence *(content_type, object_id)*.
     """
     content_type, object_id = _get_content(instance_or_content)
-    Score.objects.filter(content_type=content_type, object_id=object_id).delete()
+    delete_scores(Score.objects.filter(content_type=content_type, 
+        object_id=object_id))
     
 def delete_votes_for(instance_or_content):
     """
@@ -217,6 +877,30 @@ def delete_votes_for(instance_or_content):
     """
     content_type, object_id = _get_content(instance_or_content)
     Vote.objects.filter(content_type=content_type, object_id=object_id).delete()
+    if settings.ARCHIVE_VOTES:
+        ArchivedVote.objects.filter(content_type=content_type, 
+            object_id=object_id).delete()
+
+# the maximum number of target objects whose votes are deleted by one query
+DELETE_CHUNK_SIZE = 500
+
+def delete_ratings_for(content_type, object_ids):
+    """
+    Delete all the score and vote objects related to the target objects 
+    of the given *content_type* (a content type instance or id) having 
+    the given *object_ids*, using one query for each table 
+    (ids are split in chunks of *DELETE_CHUNK_SIZE*).
+    """
+    object_ids = list(object_ids)
+    for i in range(0, len(object_ids), DELETE_CHUNK_SIZE):
+        lookups = {
+            'content_type': content_type,
+            'object_id__in': object_ids[i:i + DELETE_CHUNK_SIZE],
+        }
+        Vote.objects.filter(**lookups).delete()
+        delete_scores(Score.objects.filter(**lookups))
+        if settings.ARCHIVE_VOTES:
+            ArchivedVote.objects.filter(**lookups).delete()
 
 # IN BULK SELECT QUERIES
     
@@ -231,7 +915,8 @@ def annotate_scores(queryset_or_model, key, **kwargs):
     In *kwargs* it is possible to specify the values to retreive mapped 
     to field names (it is up to you to avoid name clashes).
     You can annotate the queryset with the number of votes (*num_votes*), 
-    the average score (*average*) and the total sum of all votes (*total*).
+    the average score (*average*), the total sum of all votes (*total*)
+    and the ranking (*ranking*).
     
     For example, the following call::
     
@@ -272,7 +957,7 @@ def annotate_scores(queryset_or_model, key, **kwargs):
         SELECT ${field_name} FROM ${score_table} WHERE 
         ${score_table}.object_id = ${model_table}.${model_pk_name} AND 
         ${score_table}.content_type_id = ${content_type_id} AND
-        ${score_table}.key = %s
+        ${score_table}.key_id = %s
         """
         template = string.Template(template).safe_substitute(mapping)
         # building one query for each requested field
@@ -281,7 +966,7 @@ def annotate_scores(queryset_or_model, key, **kwargs):
                 {'field_name': field_name})
             select[alias] = query
             # and that's why SortedDict are not really needed
-            select_params.append(key) 
+            select_params.append(fields.get_key_id(key, create=False))
         return queryset.extra(select=select, select_params=select_params)
     return queryset
     
@@ -325,17 +1010,78 @@ def annotate_votes(queryset_or_model, key, user, score='score'):
     ${vote_table}.object_id = ${model_table}.${model_pk_name} AND 
     ${vote_table}.content_type_id = ${content_type_id} AND
     ${vote_table}.user_id = %s AND
-    ${vote_table}.key = %s
+    ${vote_table}.key_id = %s
     """
     select = {score: string.Template(template).substitute(mapping)}
-    return queryset.extra(select=select, select_params=[user.pk, key])
+    return queryset.extra(select=select, 
+        select_params=[user.pk, fields.get_key_id(key, create=False)])
+
+def get_facet_counts(queryset, key, thresholds, field='average'):
+    """
+    Return a *SortedDict* mapping each one of the *thresholds* (sorted from
+    the highest) to the number of objects in *queryset* whose score for 
+    the given *key* has a *field* value greater than or equal to the 
+    threshold, e.g. to display "4 stars & up (1203)" filters::
+    
+        get_facet_counts(Article.objects.filter(published=True), 'main', 
+            (4, 3, 2))
+    
+    Counts are calculated using one grouped query, joining the scores 
+    table to *queryset*. Objects without votes are not counted.
+    """
+    thresholds = sorted(thresholds, reverse=True)
+    content_type = managers.get_content_type_for_model(queryset.model)
+    connection = connections[queryset.db]
+    qn = connection.ops.quote_name
+    try:
+        if isinstance(queryset, EmptyQuerySet):
+            raise EmptyResultSet
+        sql, params = queryset.order_by().values_list('pk').query.get_compiler(
+            using=queryset.db).as_sql()
+    except EmptyResultSet:
+        counts = {}
+    else:
+        # each score falls in the bucket of the highest threshold it reaches
+        cases = ' '.join('WHEN scores.%s >= %%s THEN %d' % (qn(field), i) 
+            for i in range(len(thresholds)))
+        cursor = connection.cursor()
+        cursor.execute('SELECT CASE %s ELSE %d END, COUNT(*) '
+            'FROM %s scores INNER JOIN (%s) objects '
+            'ON scores.object_id = objects.%s '
+            'WHERE scores.content_type_id = %%s AND scores.key_id = %%s AND '
+            'scores.num_votes > 0 GROUP BY 1' % (cases, len(thresholds), 
+            qn(Score._meta.db_table), sql, qn(queryset.model._meta.pk.column)),
+            thresholds + list(params) + [content_type.pk, 
+            fields.get_key_id(key, create=False) or 0])
+        counts = dict(cursor.fetchall())
+    facets, count = SortedDict(), 0
+    for i, threshold in enumerate(thresholds):
+        count += counts.get(i, 0)
+        facets[threshold] = count
+    return facets
     
 
 # ABSTRACT MODELS
+
     
 class RatedModel(models.Model):
     """
     Mixin for votable models.
+    
+    Score values can be denormalized in fields of the model, declared by
+    the *score_fields* attribute of its handler, e.g.::
+    
+        class Article(RatedModel):
+            rating_average = models.FloatField(default=0, db_index=True)
+            rating_count = models.PositiveIntegerField(default=0)
+            
+        ratings.register(Article, score_fields={
+            'rating_average': ('main', 'average'),
+            'rating_count': ('main', 'num_votes'),
+        })
+        
+    so that articles can be sorted and filtered by rating without querying
+    the scores table.
     """
     rating_scores = generic.GenericRelation(Score)
     rating_votes = generic.GenericRelation(Vote)
@@ -0,0 +1,136 @@
+"""
+Sweeping orphaned votes and scores.
+
+Votes and scores are deleted together with their target objects by the
+*pre_delete* receiver connected by the ratings registry, but objects
+deleted using raw SQL, removed from other systems or moved to other
+databases leave orphaned votes and scores behind.
+
+The functions in this module find orphans scanning the votes and scores
+tables one content type at a time, in ranges of ids, so that each query
+only touches a small part of the table: if the target model lives in
+the same database and has an integer primary key, a range is checked with
+a single anti-join query, otherwise existing target ids are retreived and
+compared in Python. They are usually called by the *ratings_sweep_orphans*
+management command.
+
+Note that existence is checked at table level: rows hidden by the default
+manager of the target model (e.g. soft-deleted ones) are not orphans.
+"""
+from __future__ import with_statement
+
+import time
+
+from django.db import connections, router, transaction
+from django.db.models import Min, Max
+from django.contrib.contenttypes.models import ContentType
+from django.utils.datastructures import SortedDict
+
+from ratings import models
+
+# the number of ids scanned by each query
+CHUNK_SIZE = 1000
+
+INTEGER_FIELDS = ('AutoField', 'IntegerField', 'PositiveIntegerField',
+    'BigIntegerField', 'SmallIntegerField', 'PositiveSmallIntegerField')
+
+ANTI_JOIN = """
+SELECT r.%(id)s FROM %(table)s r
+LEFT OUTER JOIN %(target_table)s t ON t.%(target_pk)s = r.%(object_id)s
+WHERE r.%(content_type_id)s = %%s AND r.%(id)s >= %%s AND r.%(id)s < %%s
+    AND t.%(target_pk)s IS NULL
+"""
+
+def _get_target_model(content_type_id):
+    """
+    Return the model class of the given content type, or None if the
+    content type or the model no longer exist.
+    """
+    # *get_for_id* fails caching content types of removed models
+    try:
+        content_type = ContentType.objects.get(pk=content_type_id)
+    except ContentType.DoesNotExist:
+        return None
+    return content_type.model_class()
+
+def _can_join(model, target):
+    """
+    Return True if orphans of *model* related to *target* objects can be
+    found using an anti-join.
+    """
+    return (router.db_for_read(model) == router.db_for_read(target) and
+        target._meta.pk.get_internal_type() in INTEGER_FIELDS)
+
+def _find_in_range(model, content_type_id, target, start, stop):
+    """
+    Return the ids, between *start* (included) and *stop* (excluded),
+    of the *model* instances related to objects of the given content type
+    that no longer exist.
+    """
+    queryset = model._default_manager.filter(content_type=content_type_id,
+        id__gte=start, id__lt=stop)
+    if target is None:
+        return list(queryset.values_list('id', flat=True))
+    if _can_join(model, target):
+        connection = connections[router.db_for_read(model)]
+        qn = connection.ops.quote_name
+        sql = ANTI_JOIN % {
+            'table': qn(model._meta.db_table),
+            'target_table': qn(target._meta.db_table),
+            'target_pk': qn(target._meta.pk.column),
+            'id': qn('id'),
+            'object_id': qn('object_id'),
+            'content_type_id': qn('content_type_id'),
+        }
+        cursor = connection.cursor()
+        cursor.execute(sql, [content_type_id, start, stop])
+        return [row[0] for row in cursor.fetchall()]
+    rows = list(queryset.values_list('id', 'object_id'))
+    existing = set(target._base_manager.filter(
+        pk__in=set(i[1] for i in rows)).values_list('pk', flat=True))
+    return [pk for pk, object_id in rows if object_id not in existing]
+
+def find_orphans(model, content_type_id, chunk_size=CHUNK_SIZE):
+    """
+    Yield lists of ids of orphaned *model* instances (votes or scores)
+    related to the given content type, scanning *chunk_size* ids at a time.
+    """
+    target = _get_target_model(content_type_id)
+    bounds = model._default_manager.filter(content_type=content_type_id
+        ).aggregate(start=Min('id'), stop=Max('id'))
+    if bounds['start'] is None:
+        return
+    for start in xrange(bounds['start'], bounds['stop'] + 1, chunk_size):
+        ids = _find_in_range(model, content_type_id, target,
+            start, start + chunk_size)
+        if ids:
+            yield ids
+
+def sweep(model, dry_run=False, chunk_size=CHUNK_SIZE, pause=0):
+    """
+    Delete orphaned *model* instances (votes or scores).
+    Each chunk of orphans is deleted in its own transaction, waiting
+    *pause* seconds after each deletion to limit the load on the database.
+    If *dry_run* is True, orphans are only counted.
+
+    Return a *SortedDict* mapping content type ids to the number of
+    orphans found.
+    """
+    report = SortedDict()
+    using = router.db_for_write(model)
+    content_type_ids = sorted(model._default_manager.order_by(
+        ).values_list('content_type', flat=True).distinct())
+    for content_type_id in content_type_ids:
+        report[content_type_id] = 0
+        for ids in find_orphans(model, content_type_id, chunk_size):
+            report[content_type_id] += len(ids)
+            if not dry_run:
+                with transaction.commit_on_success(using=using):
+                    orphans = model._default_manager.filter(id__in=ids)
+                    if model is models.Score:
+                        models.delete_scores(orphans)
+                    else:
+                        orphans.delete()
+                if pause:
+                    time.sleep(pause)
+    return report
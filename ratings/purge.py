@@ -0,0 +1,146 @@
+"""
+Purging votes in bulk.
+
+Votes given by a banned user, by a range of ip addresses or since a given
+date can be removed using *purge_votes*: votes are deleted in chunks,
+and each chunk is applied in its own transaction, together with the
+recalculation of the scores it touched (using the handler of the target
+model) and the removal of its votes from rollups and trending values.
+If the purge is interrupted, the scores of the deleted votes are
+never left stale.
+"""
+from __future__ import with_statement
+
+from django.db import transaction
+from django.db.models import Q
+from django.contrib.contenttypes.models import ContentType
+
+from ratings import settings, models, fields, rollups
+from ratings.handlers import ratings
+
+# the number of votes deleted by each query
+CHUNK_SIZE = 500
+
+def get_network_lookups(network, field='ip_address'):
+    """
+    Return a *Q* object matching the ip addresses in the given IPv4 or
+    IPv6 *network*, e.g. *'10.0.0.0/8'*, *'2001:db8::/32'* or 
+    *'192.168.1.1'*, using a range lookup on packed addresses.
+    Raise a *ValueError* if the network is not valid.
+    """
+    address, _, prefix = network.partition('/')
+    packed = fields.pack_ip_address(address)
+    # IPv4 networks are mapped to IPv6 ones
+    offset = 0 if ':' in address else 96
+    try:
+        prefix = int(prefix) + offset if prefix else 128
+    except ValueError:
+        raise ValueError('Invalid network prefix: %s' % network)
+    if not offset <= prefix <= 128:
+        raise ValueError('Invalid network prefix: %s' % network)
+    mask = ((1 << prefix) - 1) << (128 - prefix)
+    start = int(packed.encode('hex'), 16) & mask
+    stop = start | (~mask & ((1 << 128) - 1))
+    start, stop = [fields.unpack_ip_address(('%032x' % i).decode('hex'))
+        for i in (start, stop)]
+    return Q(**{field + '__range': (start, stop)})
+
+def _get_lookups(user, ip_network, since, date_field):
+    lookups = Q()
+    if user is not None:
+        lookups &= Q(user=user)
+    if ip_network is not None:
+        lookups &= get_network_lookups(ip_network)
+    if since is not None:
+        lookups &= Q(**{date_field + '__gte': since})
+    return lookups
+
+def _get_targets(rows):
+    """
+    Return the targets *(content_type_id, object_id, key)* in *rows*,
+    replacing key ids with key names.
+    """
+    return set((content_type_id, object_id, fields.get_key_name(key))
+        for content_type_id, object_id, key in rows)
+
+def _purge_chunk(votes):
+    """
+    Delete the given *votes* (or archived votes), recalculate once each
+    affected score and subtract the votes from rollups and trending values,
+    using the handlers of the target models.
+    Return the set of affected targets.
+    """
+    model = type(votes[0])
+    model.objects.filter(id__in=[i.id for i in votes]).delete()
+    targets = _get_targets((i.content_type_id, i.object_id, i.key)
+        for i in votes)
+    # one score recalculation per target object and key
+    for content_type_id, object_id, key in targets:
+        content_type = ContentType.objects.get_for_id(content_type_id)
+        ratings.update_score((content_type, object_id), key)
+    for vote in votes:
+        content_type = ContentType.objects.get_for_id(vote.content_type_id)
+        handler = ratings.get_handler(content_type.model_class())
+        if getattr(handler, 'rollup_votes', False):
+            rollups.record_vote(vote, deleted=True)
+        if hasattr(handler, 'update_trending'):
+            handler.update_trending(vote, deleted=True)
+    return targets
+
+def purge_votes(user=None, ip_network=None, since=None, dry_run=False,
+    chunk_size=CHUNK_SIZE):
+    """
+    Delete all the votes (including buffered and archived ones) given by
+    *user*, from ip addresses in *ip_network* (e.g. *'10.0.0.0/8'*) and 
+    since the given datetime *since*: given conditions are combined, at 
+    least one must be provided. Archived votes have no ip address, so they
+    are not deleted if *ip_network* is given.
+
+    Votes are deleted *chunk_size* at a time: the scores affected by
+    each chunk are recalculated once for each target object and key,
+    and the deleted votes are subtracted from rollups and trending values,
+    in the transaction deleting the chunk.
+    If *dry_run* is True, nothing is deleted.
+
+    Return a dict containing the number of deleted *votes* and
+    *buffered_votes*, and the set of affected *targets*, as sequences
+    *(content_type_id, object_id, key)*.
+    Raise a *ValueError* if no condition is given or the network
+    is not valid.
+    """
+    if user is None and ip_network is None and since is None:
+        raise ValueError('At least one condition must be given.')
+    votes = models.Vote.objects.filter(
+        _get_lookups(user, ip_network, since, 'modified_at'))
+    buffered = models.BufferedVote.objects.filter(
+        _get_lookups(user, ip_network, since, 'created_at'))
+    # ip addresses are not archived
+    archived = models.ArchivedVote.objects.none()
+    if settings.ARCHIVE_VOTES and ip_network is None:
+        archived = models.ArchivedVote.objects.filter(
+            _get_lookups(user, None, since, 'modified_at'))
+    report = {'votes': 0, 'buffered_votes': 0, 'targets': set()}
+    if dry_run:
+        report['votes'] = votes.count()
+        report['buffered_votes'] = buffered.count()
+        report['votes'] += archived.count()
+        for queryset in (votes, archived):
+            report['targets'].update(_get_targets(queryset.order_by(
+                ).values_list('content_type', 'object_id', 'key').distinct()))
+        return report
+    for queryset in (votes, archived):
+        while True:
+            with transaction.commit_on_success():
+                chunk = list(queryset.order_by()[:chunk_size])
+                if not chunk:
+                    break
+                report['targets'].update(_purge_chunk(chunk))
+            report['votes'] += len(chunk)
+    while True:
+        with transaction.commit_on_success():
+            ids = list(buffered.values_list('id', flat=True)[:chunk_size])
+            if not ids:
+                break
+            models.BufferedVote.objects.filter(id__in=ids).delete()
+        report['buffered_votes'] += len(ids)
+    return report
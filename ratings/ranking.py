@@ -0,0 +1,46 @@
+"""
+Ranking functions.
+
+Sorting scores by their average ranks a target object having a single
+top vote above another one having thousands of slightly lower votes.
+Rating handlers store in the *ranking* field of scores a value also
+taking into account the number of votes (see *RatingHandler.ranking*),
+so that scores can be sorted using an index, e.g.::
+
+    Score.objects.filter(key='main').order_by('-ranking')[:10]
+
+Rankings are computed whenever a score is written by the voting process;
+use the *update_rankings* management command after changing the ranking
+of a handler.
+"""
+import math
+
+def bayesian_average(total, num_votes, prior_average, prior_votes):
+    """
+    Return the average of *num_votes* votes summing to *total*, together
+    with *prior_votes* votes equal to *prior_average*.
+    With few votes, the result is close to the prior average.
+    """
+    if not num_votes + prior_votes:
+        return 0
+    return float(total + prior_average * prior_votes) / (
+        num_votes + prior_votes)
+
+def wilson_lower_bound(total, num_votes, score_range, z=1.96):
+    """
+    Return the lower bound of the Wilson score interval of *num_votes* 
+    votes summing to *total*, rescaled to the given *score_range*.
+    Votes are treated as fractions of positive votes, e.g. a 4 in a 1-5 
+    range counts as 0.75 positive votes. The default *z* gives a 95% 
+    confidence.
+    """
+    if not num_votes:
+        return 0
+    min_score, max_score = score_range
+    span = float(max_score - min_score)
+    positive = (float(total) / num_votes - min_score) / span
+    z2 = z * z
+    bound = (positive + z2 / (2 * num_votes) - z * math.sqrt(
+        (positive * (1 - positive) + z2 / (4 * num_votes)) / num_votes)
+        ) / (1 + z2 / num_votes)
+    return min_score + max(bound, 0) * span
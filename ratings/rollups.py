@@ -0,0 +1,363 @@
+"""
+Time-bucketed vote rollups.
+
+Each *VoteRollup* row stores the number and the sum of the votes given
+to a target object using a key in a time bucket, so that trends (e.g.
+votes per hour) and averages over time windows (e.g. the average score
+of this week) are calculated without scanning the votes table.
+
+Rollups are maintained incrementally by handlers having *rollup_votes*
+set to True (see *record_vote*), and can be rebuilt from the votes table
+by *rebuild_rollups*. Votes are counted in the bucket containing their
+creation time: votes deleted in bulk (e.g. swept orphans) are not 
+subtracted from rollups until they are rebuilt, while archived votes
+keep being counted (purged votes are subtracted by *ratings.purge*).
+
+New buckets are *GENERIC_RATINGS_ROLLUP_BUCKET_SIZE* seconds long:
+*compact_rollups* merges old buckets into coarser ones, following the
+*GENERIC_RATINGS_ROLLUP_COMPACTION* schedule, so that the table does
+not grow with the age of the site. Bucket sizes must be multiples of
+each other.
+
+Both rebuild and compaction are usually run by the *rollup_votes*
+management command.
+"""
+from __future__ import with_statement
+
+import datetime
+
+from django.db import models as db_models, transaction, IntegrityError
+from django.contrib.contenttypes.models import ContentType
+from django.utils.datastructures import SortedDict
+
+from ratings import settings, models, managers
+
+# buckets are aligned to the epoch
+EPOCH = datetime.datetime(1970, 1, 1)
+
+# the number of rows read or compacted in a transaction
+CHUNK_SIZE = 1000
+
+def get_bucket_start(when, size=None):
+    """
+    Return the start of the bucket of *size* seconds (by default
+    *GENERIC_RATINGS_ROLLUP_BUCKET_SIZE*) containing the datetime *when*.
+    """
+    size = size or settings.ROLLUP_BUCKET_SIZE
+    delta = when - EPOCH
+    seconds = delta.days * 86400 + delta.seconds
+    return EPOCH + datetime.timedelta(seconds=seconds - seconds % size)
+
+def _get_content_type_id(model_or_content_type):
+    if isinstance(model_or_content_type, (int, long)):
+        return model_or_content_type
+    if isinstance(model_or_content_type, ContentType):
+        return model_or_content_type.pk
+    return managers.get_content_type_for_model(model_or_content_type).pk
+
+def _add(content_type_id, object_id, key, bucket_start, bucket_size,
+    num_votes=0, total=0):
+    """
+    Atomically add the given deltas to a bucket, creating it if it
+    does not exist.
+    """
+    rollups = models.VoteRollup.objects.filter(
+        content_type=content_type_id, object_id=object_id, key=key,
+        bucket_start=bucket_start, bucket_size=bucket_size)
+    changes = {
+        'num_votes': db_models.F('num_votes') + num_votes,
+        'total': db_models.F('total') + total,
+    }
+    if rollups.update(**changes):
+        return
+    sid = transaction.savepoint()
+    try:
+        models.VoteRollup.objects.create(content_type_id=content_type_id,
+            object_id=object_id, key=key, bucket_start=bucket_start,
+            bucket_size=bucket_size, num_votes=num_votes, total=total)
+    except IntegrityError:
+        transaction.savepoint_rollback(sid)
+        rollups.update(**changes)
+    else:
+        transaction.savepoint_commit(sid)
+
+def update_rollup(content_type, object_id, key, when, num_votes=0, total=0):
+    """
+    Atomically add *num_votes* and *total* to the rollup of the target
+    object identified by *content_type* (a content type instance or id)
+    and *object_id*, for the given *key* and the bucket containing the
+    datetime *when*.
+    """
+    if not (num_votes or total):
+        return
+    _add(_get_content_type_id(content_type), object_id, key,
+        get_bucket_start(when), settings.ROLLUP_BUCKET_SIZE,
+        num_votes=num_votes, total=total)
+
+def record_vote(vote, old_score=None, deleted=False):
+    """
+    Update the rollups after the given saved *vote* is created, changed
+    (in this case *old_score* is the previous score) or *deleted*.
+    """
+    if deleted:
+        # the score of a vote deleted by a form is changed to 0
+        score = vote.score
+        if vote._stored_score is not None:
+            score = vote._stored_score
+        num_votes, total = -1, -score
+    elif old_score is None:
+        num_votes, total = 1, vote.score
+    else:
+        num_votes, total = 0, vote.score - old_score
+    update_rollup(vote.content_type_id, vote.object_id, vote.key,
+        vote.created_at, num_votes=num_votes, total=total)
+
+def _get_sizes():
+    """
+    Return the sorted bucket sizes in use.
+    """
+    return sorted(set([settings.ROLLUP_BUCKET_SIZE] +
+        [size for age, size in settings.ROLLUP_COMPACTION]))
+
+def _get_next_range(querysets, since, size):
+    """
+    Return the start of the first range of *size* seconds containing
+    votes created since the datetime *since* (if not None), or None if
+    there are no such votes.
+    """
+    starts = []
+    for queryset in querysets:
+        if since is not None:
+            queryset = queryset.filter(created_at__gte=since)
+        created_at = queryset.aggregate(
+            created_at=db_models.Min('created_at'))['created_at']
+        if created_at is not None:
+            starts.append(created_at)
+    if starts:
+        return get_bucket_start(min(starts), size)
+    return None
+
+def _rebuild_range(querysets, since, until, chunk_size):
+    """
+    Count the votes created in the time range starting at *since* and
+    ending at *until*, and write their buckets.
+    Return the number of counted votes.
+    """
+    buckets, counted = {}, 0
+    for queryset in querysets:
+        queryset = queryset.filter(created_at__gte=since, 
+            created_at__lt=until).order_by('id').values_list('id',
+            'content_type', 'object_id', 'key', 'created_at', 'score')
+        last_id = 0
+        while True:
+            rows = list(queryset.filter(id__gt=last_id)[:chunk_size])
+            if not rows:
+                break
+            for pk, content_type_id, object_id, key, created_at, score in rows:
+                bucket = buckets.setdefault((content_type_id, object_id,
+                    key, get_bucket_start(created_at)), [0, 0])
+                bucket[0] += 1
+                bucket[1] += score
+            last_id = rows[-1][0]
+            counted += len(rows)
+    size = settings.ROLLUP_BUCKET_SIZE
+    sid = transaction.savepoint()
+    try:
+        models.VoteRollup.objects.bulk_create([models.VoteRollup(
+            content_type_id=content_type_id, object_id=object_id,
+            key=key, bucket_start=bucket_start, bucket_size=size,
+            num_votes=num_votes, total=total)
+            for (content_type_id, object_id, key, bucket_start),
+            (num_votes, total) in buckets.iteritems()])
+    except IntegrityError:
+        # a concurrent vote created a bucket: merge into it
+        transaction.savepoint_rollback(sid)
+        for (content_type_id, object_id, key, bucket_start), (num_votes,
+            total) in buckets.iteritems():
+            _add(content_type_id, object_id, key, bucket_start, size,
+                num_votes=num_votes, total=total)
+    else:
+        transaction.savepoint_commit(sid)
+    return counted
+
+def rebuild_rollups(since=None, chunk_size=CHUNK_SIZE):
+    """
+    Recalculate from the votes table (and from the archive, if enabled)
+    the rollups of the votes created since the datetime *since*, or all
+    the rollups. Return the number of counted votes.
+
+    Rollups are rebuilt one range of the coarsest bucket size at a time,
+    each one in its own transaction, so that only the buckets of a range 
+    are kept in memory; ranges without votes are skipped. The rebuild
+    starts at the beginning of the range containing *since*, so that 
+    compacted buckets are rebuilt as a whole: rebuilt rollups use the 
+    finest bucket size, and can be compacted again.
+
+    Rollups are not locked against the increments of concurrent votes
+    (see *record_vote*): a vote given, changed or deleted while the range
+    containing its creation time is being rebuilt can be counted twice
+    or missed. Rebuild when the site is quiet, or rebuild the affected
+    ranges again.
+    """
+    size = _get_sizes()[-1]
+    querysets = [models.Vote.objects.all()]
+    if settings.ARCHIVE_VOTES:
+        querysets.append(models.ArchivedVote.objects.all())
+    if since is not None:
+        since = get_bucket_start(since, size)
+    range_start = _get_next_range(querysets, since, size)
+    with transaction.commit_on_success():
+        # buckets before the first range with votes are stale
+        rollups = models.VoteRollup.objects.all()
+        if since is not None:
+            rollups = rollups.filter(bucket_start__gte=since)
+        if range_start is not None:
+            rollups = rollups.filter(bucket_start__lt=range_start)
+        rollups.delete()
+    counted = 0
+    while range_start is not None:
+        range_end = range_start + datetime.timedelta(seconds=size)
+        next_start = _get_next_range(querysets, range_end, size)
+        with transaction.commit_on_success():
+            # the buckets up to the next range with votes are replaced
+            rollups = models.VoteRollup.objects.filter(
+                bucket_start__gte=range_start)
+            if next_start is not None:
+                rollups = rollups.filter(bucket_start__lt=next_start)
+            rollups.delete()
+            counted += _rebuild_range(querysets, range_start, range_end,
+                chunk_size)
+        range_start = next_start
+    return counted
+
+def _compact_chunk(cutoff, size, chunk_size):
+    """
+    Merge at most *chunk_size* buckets smaller than *size* seconds and
+    starting before *cutoff* into buckets of *size* seconds.
+    Return the number of merged buckets.
+    """
+    with transaction.commit_on_success():
+        rollups = list(models.VoteRollup.objects.filter(
+            bucket_size__lt=size, bucket_start__lt=cutoff
+            ).order_by('id')[:chunk_size])
+        if not rollups:
+            return 0
+        merged = SortedDict()
+        for rollup in rollups:
+            bucket = merged.setdefault((rollup.content_type_id,
+                rollup.object_id, rollup.key,
+                get_bucket_start(rollup.bucket_start, size)), [0, 0])
+            bucket[0] += rollup.num_votes
+            bucket[1] += rollup.total
+        models.VoteRollup.objects.filter(
+            id__in=[i.id for i in rollups]).delete()
+        for (content_type_id, object_id, key, bucket_start), (num_votes,
+            total) in merged.items():
+            _add(content_type_id, object_id, key, bucket_start, size,
+                num_votes=num_votes, total=total)
+    return len(rollups)
+
+def compact_rollups(now=None, chunk_size=CHUNK_SIZE):
+    """
+    Merge old buckets into coarser ones, following the
+    *GENERIC_RATINGS_ROLLUP_COMPACTION* schedule, *chunk_size* buckets
+    at a time. Return the number of merged buckets.
+    """
+    now = now or datetime.datetime.now()
+    compacted = 0
+    for age, size in sorted(settings.ROLLUP_COMPACTION,
+        key=lambda i: i[1]):
+        # only whole coarse buckets are compacted
+        cutoff = get_bucket_start(now - datetime.timedelta(seconds=age),
+            size)
+        while True:
+            count = _compact_chunk(cutoff, size, chunk_size)
+            if not count:
+                break
+            compacted += count
+    return compacted
+
+# QUERIES
+
+def _get_rollups(instance_or_content, key, since, until=None):
+    content_type, object_id = models._get_content(instance_or_content)
+    rollups = models.VoteRollup.objects.filter(content_type=content_type,
+        object_id=object_id, key=key, bucket_start__gte=since)
+    if until is not None:
+        rollups = rollups.filter(bucket_start__lt=until)
+    return rollups
+
+def get_window_stats(instance_or_content, key, since, until=None):
+    """
+    Return a tuple *(num_votes, total)* of the votes given to the target
+    object *instance_or_content* (a model instance or a sequence
+    *(content_type, object_id)*) using *key*, in the time window starting
+    at the datetime *since* and ending at *until* (by default, now).
+
+    Buckets starting in the window are counted as a whole: the precision
+    of the window boundaries is the size of the buckets (coarser for
+    compacted buckets).
+    """
+    stats = _get_rollups(instance_or_content, key, since, until).aggregate(
+        num_votes=db_models.Sum('num_votes'), total=db_models.Sum('total'))
+    return stats['num_votes'] or 0, stats['total'] or 0
+
+def get_window_average(instance_or_content, key, since, until=None):
+    """
+    Return the average of the votes given to the target object
+    *instance_or_content* using *key* in the given time window, e.g.
+    the average of this week (see *get_window_stats*).
+    Return 0 if there are no votes in the window.
+    """
+    num_votes, total = get_window_stats(instance_or_content, key,
+        since, until)
+    if num_votes:
+        return float(total) / num_votes
+    return 0
+
+def get_series(instance_or_content, key, since, until=None, size=None):
+    """
+    Return a *SortedDict* mapping the start of each bucket of *size*
+    seconds (by default *GENERIC_RATINGS_ROLLUP_BUCKET_SIZE*) in the given
+    time window to a tuple *(num_votes, total)* of the votes given to the
+    target object *instance_or_content* using *key*, e.g. to plot the
+    votes per day::
+
+        series = rollups.get_series(article, 'main', last_month,
+            size=60 * 60 * 24)
+
+    Empty buckets are included. Buckets coarser than *size* are reported
+    in the bucket containing their start.
+    """
+    size = size or settings.ROLLUP_BUCKET_SIZE
+    until = until or datetime.datetime.now()
+    series = SortedDict()
+    bucket_start = get_bucket_start(since, size)
+    while bucket_start < until:
+        series[bucket_start] = (0, 0)
+        bucket_start += datetime.timedelta(seconds=size)
+    rollups = _get_rollups(instance_or_content, key, since, until)
+    for bucket_start, num_votes, total in rollups.values_list(
+        'bucket_start', 'num_votes', 'total'):
+        bucket_start = get_bucket_start(bucket_start, size)
+        old_num_votes, old_total = series.get(bucket_start, (0, 0))
+        series[bucket_start] = (old_num_votes + num_votes, old_total + total)
+    return series
+
+def get_window_counts(model_or_content_type, key, since, until=None):
+    """
+    Return a values queryset of dicts containing *object_id*, *num_votes*
+    and *total* of each target object of *model_or_content_type* (a model,
+    a content type instance or id) voted using *key* in the given time
+    window, e.g. the most voted objects of the last day::
+
+        rollups.get_window_counts(Article, 'main', yesterday
+            ).order_by('-num_votes')[:10]
+    """
+    rollups = models.VoteRollup.objects.filter(
+        content_type=_get_content_type_id(model_or_content_type), key=key,
+        bucket_start__gte=since)
+    if until is not None:
+        rollups = rollups.filter(bucket_start__lt=until)
+    return rollups.order_by().values('object_id').annotate(
+        num_votes=db_models.Sum('num_votes'), total=db_models.Sum('total'))
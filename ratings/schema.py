@@ -0,0 +1,157 @@
+"""
+Database schema helpers.
+
+This app does not depend on a migrations framework: management commands
+upgrading the tables of existing installations use these helpers to
+add and remove columns and indexes using plain SQL.
+"""
+import re
+
+from django.db import connections, transaction, router
+from django.core.management.color import no_style
+from django.core.management.sql import custom_sql_for_model
+
+def _get_connection(model):
+    return connections[router.db_for_write(model)]
+
+def get_columns(model):
+    """
+    Return the set of the column names of the *model* table.
+    """
+    connection = _get_connection(model)
+    cursor = connection.cursor()
+    description = connection.introspection.get_table_description(cursor,
+        model._meta.db_table)
+    return set(i[0] for i in description)
+
+def add_column(model, name):
+    """
+    Add to the *model* table the (nullable) column of the field *name*.
+    """
+    connection = _get_connection(model)
+    field = model._meta.get_field(name)
+    qn = connection.ops.quote_name
+    connection.cursor().execute('ALTER TABLE %s ADD COLUMN %s %s NULL' % (
+        qn(model._meta.db_table), qn(field.column),
+        field.db_type(connection=connection)))
+    transaction.commit_unless_managed(using=connection.alias)
+
+def _rebuild_table(model, connection):
+    """
+    Recreate the *model* table using the current model definition,
+    copying the data of the columns that still exist (SQLite cannot drop
+    columns that are part of an index).
+    """
+    qn = connection.ops.quote_name
+    style = no_style()
+    table = model._meta.db_table
+    old_table = '%s_old' % table
+    columns = [i.column for i in model._meta.local_fields 
+        if i.column in get_columns(model)]
+    cursor = connection.cursor()
+    cursor.execute('ALTER TABLE %s RENAME TO %s' % (qn(table), qn(old_table)))
+    for statement in connection.creation.sql_create_model(model, style,
+        known_models=set([model]))[0]:
+        cursor.execute(statement)
+    columns = ', '.join(qn(i) for i in columns)
+    cursor.execute('INSERT INTO %s (%s) SELECT %s FROM %s' % (
+        qn(table), columns, columns, qn(old_table)))
+    cursor.execute('DROP TABLE %s' % qn(old_table))
+    # the indexes of the old table are dropped together with the table
+    for statement in (connection.creation.sql_indexes_for_model(model, style) +
+        custom_sql_for_model(model, style, connection)):
+        cursor.execute(statement)
+
+def _can_rebuild(model, connection, column):
+    """
+    Return True if the *model* table can be recreated without losing data:
+    all the required columns must exist, and columns unknown to the model
+    (except the given *column*) must be empty.
+    """
+    qn = connection.ops.quote_name
+    existing = get_columns(model)
+    for field in model._meta.local_fields:
+        if field.column not in existing and not field.null:
+            return False
+    cursor = connection.cursor()
+    unknown = existing - set(i.column for i in model._meta.local_fields)
+    for name in unknown - set([column]):
+        cursor.execute("SELECT 1 FROM %s WHERE %s IS NOT NULL AND %s != '' "
+            "LIMIT 1" % (qn(model._meta.db_table), qn(name), qn(name)))
+        if cursor.fetchone():
+            return False
+    return True
+
+def drop_column(model, column):
+    """
+    Remove the given *column* from the *model* table, together with
+    the indexes using it.
+    
+    In SQLite, the table is recreated without the column: this is not 
+    possible until the other columns unknown to the model are emptied by
+    their upgrade commands; in this case False is returned.
+    """
+    connection = _get_connection(model)
+    if connection.vendor == 'sqlite':
+        if not _can_rebuild(model, connection, column):
+            return False
+        _rebuild_table(model, connection)
+    else:
+        qn = connection.ops.quote_name
+        connection.cursor().execute('ALTER TABLE %s DROP COLUMN %s' % (
+            qn(model._meta.db_table), qn(column)))
+    transaction.commit_unless_managed(using=connection.alias)
+    return True
+
+INDEX_EXISTS = {
+    'sqlite': "SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = %s",
+    'postgresql': "SELECT 1 FROM pg_indexes WHERE indexname = %s",
+    'mysql': "SELECT 1 FROM information_schema.statistics "
+        "WHERE table_schema = DATABASE() AND index_name = %s",
+}
+
+def create_index(model, name, columns, unique=False):
+    """
+    Create the index *name* on the given *columns* of the *model* table,
+    if the index does not exist.
+    Return True if the index is created.
+    """
+    connection = _get_connection(model)
+    cursor = connection.cursor()
+    if connection.vendor in INDEX_EXISTS:
+        cursor.execute(INDEX_EXISTS[connection.vendor], [name])
+        if cursor.fetchone():
+            return False
+    qn = connection.ops.quote_name
+    cursor.execute('CREATE %sINDEX %s ON %s (%s)' % (
+        'UNIQUE ' if unique else '', qn(name), qn(model._meta.db_table),
+        ', '.join(qn(i) for i in columns)))
+    transaction.commit_unless_managed(using=connection.alias)
+    return True
+
+# the index definitions in the custom SQL files (see the sql directory)
+INDEX_RE = re.compile(r'^\s*CREATE\s+(UNIQUE\s+)?INDEX\s+(\w+)\s+'
+    r'ON\s+(\w+)\s*\(([^)]*)\)', re.IGNORECASE)
+
+def create_custom_indexes(model):
+    """
+    Create the indexes defined in the custom SQL file of the *model*
+    (e.g. *sql/vote.sql*) which do not exist: Django runs the file only
+    when the table is created, so upgraded tables miss the indexes added
+    by later versions. Indexes using columns not added yet (by other
+    upgrade commands) are skipped.
+    Return the number of created indexes.
+    """
+    connection = _get_connection(model)
+    columns = get_columns(model)
+    created = 0
+    for statement in custom_sql_for_model(model, no_style(), connection):
+        match = INDEX_RE.match(statement)
+        if match is None or match.group(3) != model._meta.db_table:
+            continue
+        index_columns = [i.strip() for i in match.group(4).split(',')]
+        if set(index_columns) - columns:
+            continue
+        created += create_index(model, match.group(2), index_columns,
+            unique=bool(match.group(1)))
+    return created
@@ -29,6 +29,39 @@ VOTES_PER_IP_ADDRESS = getattr(settings,
 COOKIE_NAME_PATTERN = getattr(settings, 'GENERIC_RATINGS_COOKIE_NAME_PATTERN', 
     'grvote_%(model)s_%(object_id)s_%(key)s')
 
+# the name of the signed cookie identifying anonymous voters: if set, 
+# a single cookie is used instead of a cookie for each voted object
+# (None = a cookie for each voted object)
+VOTER_COOKIE_NAME = getattr(settings, 'GENERIC_RATINGS_VOTER_COOKIE_NAME', 
+    None)
+
 # the cookie max age (number of seconds) for anonymous votes
 COOKIE_MAX_AGE = getattr(settings, 'GENERIC_RATINGS_COOKIE_MAX_AGE', 
-    60 * 60 * 24 * 365) # one year
\ No newline at end of file
+    60 * 60 * 24 * 365) # one year
+
+# the number of seconds the response to a vote is cached, so that requests
+# retried using the same idempotency token are not processed again
+# (0 = idempotency tokens are ignored)
+IDEMPOTENCY_TIMEOUT = getattr(settings, 
+    'GENERIC_RATINGS_IDEMPOTENCY_TIMEOUT', 60 * 10)
+
+# the number of seconds the ids of the objects voted by a user are cached
+# (0 = voted ids are not cached)
+VOTED_CACHE_TIMEOUT = getattr(settings, 
+    'GENERIC_RATINGS_VOTED_CACHE_TIMEOUT', 0)
+
+# the number of seconds covered by each bucket of vote rollups 
+# (see *ratings.rollups*)
+ROLLUP_BUCKET_SIZE = getattr(settings, 'GENERIC_RATINGS_ROLLUP_BUCKET_SIZE', 
+    60 * 60) # one hour
+
+# a sequence of *(age, bucket_size)* pairs: rollup buckets older than *age* 
+# seconds are compacted into buckets of *bucket_size* seconds
+ROLLUP_COMPACTION = getattr(settings, 'GENERIC_RATINGS_ROLLUP_COMPACTION', (
+    (60 * 60 * 24 * 7, 60 * 60 * 24), # daily buckets after a week
+))
+
+# set to True if old votes are moved to the archive table (see the 
+# *archive_votes* command): archived votes are taken into account when 
+# scores are recalculated
+ARCHIVE_VOTES = getattr(settings, 'GENERIC_RATINGS_ARCHIVE_VOTES', False)
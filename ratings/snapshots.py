@@ -0,0 +1,306 @@
+"""
+In-process columnar score snapshots.
+
+A *ScoreSnapshot* holds the scores given to a content type using a key
+as columns (vectors of object ids, averages, numbers of votes, totals
+and rankings), so that large numbers of target objects are filtered,
+ranked and summarized in process without building model instances, e.g.::
+
+    snapshot = handler.get_snapshot('main')
+    best = snapshot.filter(num_votes__gte=10).top(100)
+    median = snapshot.percentile(50)
+
+Columns are NumPy arrays if NumPy is installed, otherwise *array* module
+vectors: the interface is the same, but only NumPy operations are
+vectorized.
+
+Snapshots are refreshed incrementally: each score stores the time of its
+last change (*Score.modified_at*), and a refresh only reads the scores
+changed since the latest change already loaded (the watermark). Deleted
+scores are only removed by full refreshes.
+"""
+import bisect
+import array
+import datetime
+import heapq
+import operator
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from django.contrib.contenttypes.models import ContentType
+
+from ratings import models
+
+# the score fields stored as columns, and their array typecodes
+COLUMNS = (
+    ('average', 'd'),
+    ('num_votes', 'l'),
+    ('total', 'd'),
+    ('ranking', 'd'),
+)
+
+# changes committed in this number of seconds before the watermark are
+# read again, since concurrent transactions can commit out of order
+OVERLAP = 5
+
+LOOKUPS = {
+    'exact': operator.eq,
+    'gt': operator.gt,
+    'gte': operator.ge,
+    'lt': operator.lt,
+    'lte': operator.le,
+}
+
+def _get_vector(typecode, values=()):
+    vector = array.array(typecode, values)
+    if numpy is None:
+        return vector
+    if not vector:
+        return numpy.zeros(0, dtype=typecode)
+    return numpy.frombuffer(vector, dtype=typecode).copy()
+
+def _copy(vector):
+    if numpy is None:
+        return array.array(vector.typecode, vector)
+    return vector.copy()
+
+def _take(vector, indexes):
+    if numpy is None:
+        return array.array(vector.typecode, (vector[i] for i in indexes))
+    return vector[indexes]
+
+
+class ScoreSnapshot(object):
+    """
+    A columnar snapshot of the scores of the given *content_type*
+    (a content type instance or id) and *key*.
+
+    The snapshot is empty until it is refreshed. Columns are sorted by
+    object id and available as attributes: *object_ids*, *average*,
+    *num_votes*, *total* and *ranking*.
+    """
+    def __init__(self, content_type, key):
+        if isinstance(content_type, ContentType):
+            content_type = content_type.pk
+        self.content_type_id = content_type
+        self.key = key
+        self.watermark = None
+        self.refreshed_at = self.loaded_at = None
+        self._set_columns(_get_vector('L'),
+            [_get_vector(typecode) for name, typecode in COLUMNS])
+
+    def _set_columns(self, object_ids, columns):
+        self.object_ids = object_ids
+        for (name, typecode), column in zip(COLUMNS, columns):
+            setattr(self, name, column)
+
+    def _get_columns(self):
+        return [getattr(self, name) for name, typecode in COLUMNS]
+
+    def __len__(self):
+        return len(self.object_ids)
+
+    def _index(self, object_id):
+        """
+        Return the position of the given *object_id*, or None.
+        """
+        i = bisect.bisect_left(self.object_ids, object_id)
+        if i < len(self.object_ids) and self.object_ids[i] == object_id:
+            return i
+        return None
+
+    def get(self, object_id):
+        """
+        Return a dict of the score values of the given *object_id*, or
+        None if the object has no score.
+        """
+        i = self._index(object_id)
+        if i is None:
+            return None
+        values = dict((name, getattr(self, name)[i:i + 1].tolist()[0])
+            for name, typecode in COLUMNS)
+        values['object_id'] = object_id
+        return values
+
+    # refreshing
+
+    def refresh(self, full=False):
+        """
+        Load the scores changed since the watermark, or all the scores
+        if *full* is True or the snapshot was never refreshed.
+        Return the number of loaded scores.
+        """
+        scores = models.Score.objects.filter(
+            content_type=self.content_type_id, key=self.key)
+        full = full or self.refreshed_at is None
+        if not full:
+            if self.watermark is None:
+                scores = scores.filter(modified_at__isnull=False)
+            else:
+                scores = scores.filter(modified_at__gte=self.watermark -
+                    datetime.timedelta(seconds=OVERLAP))
+        self.refreshed_at = datetime.datetime.now()
+        if full:
+            self.loaded_at = self.refreshed_at
+        rows = scores.order_by('object_id').values_list('object_id',
+            'modified_at', *[name for name, typecode in COLUMNS])
+        if full:
+            self.watermark = None
+            loaded = self._load(rows.iterator())
+        else:
+            loaded = self._merge(list(rows))
+        return loaded
+
+    def _update_watermark(self, modified_at):
+        if modified_at is not None and (self.watermark is None or
+            modified_at > self.watermark):
+            self.watermark = modified_at
+
+    def _load(self, rows):
+        """
+        Replace the columns using the given *rows*, sorted by object id.
+        """
+        object_ids = array.array('L')
+        columns = [array.array(typecode) for name, typecode in COLUMNS]
+        for row in rows:
+            object_ids.append(row[0])
+            self._update_watermark(row[1])
+            for column, value in zip(columns, row[2:]):
+                column.append(value or 0)
+        self._set_columns(_get_vector('L', object_ids),
+            [_get_vector(i.typecode, i) for i in columns])
+        return len(object_ids)
+
+    def _merge(self, rows):
+        """
+        Update the columns using the given changed *rows*: existing scores
+        are changed in place, while new scores are appended and the
+        columns sorted again.
+        """
+        columns = self._get_columns()
+        new_rows = []
+        for row in rows:
+            self._update_watermark(row[1])
+            i = self._index(row[0])
+            if i is None:
+                new_rows.append(row)
+                continue
+            for column, value in zip(columns, row[2:]):
+                column[i] = value or 0
+        if new_rows:
+            # the new columns replace the old ones at once
+            object_ids = self.object_ids.tolist() + [i[0] for i in new_rows]
+            order = sorted(range(len(object_ids)), key=object_ids.__getitem__)
+            values = [column.tolist() + [i[n + 2] or 0 for i in new_rows]
+                for n, column in enumerate(columns)]
+            self._set_columns(_get_vector('L', (object_ids[i] for i in order)),
+                [_get_vector(typecode, (column[i] for i in order))
+                for (name, typecode), column in zip(COLUMNS, values)])
+        return len(rows)
+
+    def _clone(self, object_ids, columns):
+        clone = ScoreSnapshot(self.content_type_id, self.key)
+        clone.watermark, clone.refreshed_at, clone.loaded_at = (
+            self.watermark, self.refreshed_at, self.loaded_at)
+        clone._set_columns(object_ids, columns)
+        return clone
+
+    def copy(self):
+        """
+        Return a copy of the snapshot, which can be refreshed without
+        changing this one.
+        """
+        return self._clone(_copy(self.object_ids),
+            [_copy(i) for i in self._get_columns()])
+
+    # queries
+
+    def _subset(self, indexes):
+        """
+        Return a new snapshot containing the scores at the given *indexes*.
+        """
+        return self._clone(_take(self.object_ids, indexes),
+            [_take(i, indexes) for i in self._get_columns()])
+
+    def filter(self, object_ids=None, **lookups):
+        """
+        Return a new snapshot containing only the scores matching all
+        the given *lookups*, e.g.::
+
+            snapshot.filter(num_votes__gte=10, average__lt=2)
+
+        Lookups are score columns, optionally followed by *__gt*, *__gte*,
+        *__lt* or *__lte*. If *object_ids* is not None, only the scores of
+        the given objects are kept (e.g. search results).
+        """
+        conditions = []
+        for lookup, value in lookups.items():
+            name, _, operation = lookup.partition('__')
+            if name not in dict(COLUMNS) or operation and (
+                operation not in LOOKUPS):
+                raise ValueError('Invalid lookup: %r' % lookup)
+            conditions.append((getattr(self, name),
+                LOOKUPS[operation or 'exact'], value))
+        if numpy is not None:
+            mask = numpy.ones(len(self), dtype=bool)
+            if object_ids is not None:
+                mask &= numpy.in1d(self.object_ids,
+                    numpy.fromiter(object_ids, dtype='L'))
+            for column, operation, value in conditions:
+                mask &= operation(column, value)
+            return self._subset(numpy.nonzero(mask)[0])
+        if object_ids is not None:
+            object_ids = set(object_ids)
+        indexes = [i for i, object_id in enumerate(self.object_ids)
+            if (object_ids is None or object_id in object_ids) and
+            all(operation(column[i], value)
+            for column, operation, value in conditions)]
+        return self._subset(indexes)
+
+    def _get_column(self, order):
+        if order not in dict(COLUMNS):
+            raise ValueError('Invalid score column: %r' % order)
+        return getattr(self, order)
+
+    def top(self, n=10, order='average'):
+        """
+        Return a list of the object ids of the *n* scores with the highest
+        *order* value, sorted as leaderboards (see
+        *RatingHandler.get_top*): ties are sorted by number of votes, and
+        then by object id.
+        """
+        values = self._get_column(order)
+        n = min(n, len(self))
+        if not n:
+            return []
+        if numpy is not None:
+            # the candidates are all the scores reaching the nth value
+            nth = numpy.partition(values, len(values) - n)[len(values) - n]
+            indexes = numpy.nonzero(values >= nth)[0]
+            sort = numpy.lexsort((self.object_ids[indexes],
+                -self.num_votes[indexes], -values[indexes]))
+            return self.object_ids[indexes[sort[:n]]].tolist()
+        num_votes, object_ids = self.num_votes, self.object_ids
+        indexes = heapq.nsmallest(n, range(len(values)),
+            key=lambda i: (-values[i], -num_votes[i], object_ids[i]))
+        return [object_ids[i] for i in indexes]
+
+    def percentile(self, q, order='average'):
+        """
+        Return the *q*-th percentile (from 0 to 100) of the *order* values,
+        using linear interpolation, e.g. the median average score is
+        *snapshot.percentile(50)*. Return None if the snapshot is empty.
+        """
+        values = self._get_column(order)
+        if not len(values):
+            return None
+        if numpy is not None:
+            return float(numpy.percentile(values, q))
+        values = sorted(values)
+        position = (len(values) - 1) * q / 100.0
+        low = int(position)
+        high = min(low + 1, len(values) - 1)
+        return values[low] + (values[high] - values[low]) * (position - low)
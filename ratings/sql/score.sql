@@ -0,0 +1,11 @@
+-- index used to sort scores by average and number of votes (e.g. in the
+-- admin changelist)
+CREATE INDEX ratings_score_average ON ratings_score (average, num_votes, id);
+-- index used to build the leaderboards of a content type and key
+CREATE INDEX ratings_score_top ON ratings_score (content_type_id, key_id, average, num_votes);
+-- index used to sort the scores of a content type and key by ranking
+CREATE INDEX ratings_score_by_ranking ON ratings_score (content_type_id, key_id, ranking);
+-- index used to sort the scores of a content type and key by trending value
+CREATE INDEX ratings_score_by_trending ON ratings_score (content_type_id, key_id, trending_rank);
+-- index used to refresh score snapshots (see ratings.snapshots)
+CREATE INDEX ratings_score_modified ON ratings_score (content_type_id, key_id, modified_at);
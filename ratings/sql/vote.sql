@@ -0,0 +1,9 @@
+-- indexes used by feeds of latest votes given to an object or by a user
+CREATE INDEX ratings_vote_object_feed ON ratings_vote (content_type_id, object_id, modified_at, id);
+CREATE INDEX ratings_vote_user_feed ON ratings_vote (user_id, modified_at, id);
+-- index used to sort and filter votes by date (e.g. in the admin changelist)
+CREATE INDEX ratings_vote_modified ON ratings_vote (modified_at, id);
+-- index used to select votes by ip address or network
+CREATE INDEX ratings_vote_ip ON ratings_vote (ip);
+-- index used to select votes by creation date (e.g. to rebuild rollups)
+CREATE INDEX ratings_vote_created ON ratings_vote (created_at, id);
@@ -0,0 +1,2 @@
+-- index used to aggregate the rollups of all the objects in a time window
+CREATE INDEX ratings_voterollup_window ON ratings_voterollup (content_type_id, key_id, bucket_start);
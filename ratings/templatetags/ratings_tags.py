@@ -2,7 +2,7 @@ import re
 
 from django import template
 
-from ratings import handlers
+from ratings import handlers, managers
 
 register = template.Library()
 
@@ -453,6 +453,8 @@ GET_LATEST_VOTES_FOR_PATTERN = r"""
     ^ # begin of line
     (?P<target_object>[\w.]+) # target object
     (\s+using\s+(?P<key>[\w'"]+))? # key
+    (\s+limit\s+(?P<limit>[\w.]+))? # page size
+    (\s+before\s+(?P<before>[\w.'"-]+))? # cursor
     \s+as\s+(?P<varname>\w+) # varname
     $ # end of line
 """
@@ -469,7 +471,7 @@ def get_latest_votes_for(parser, token):
     
     .. code-block:: html+django
     
-        {% get_latest_votes_for *target object* [using *key*] as *var name* %}
+        {% get_latest_votes_for *target object* [using *key*] [limit *size*] [before *cursor*] as *var name* %}
         
     Usage example:
     
@@ -492,6 +494,21 @@ def get_latest_votes_for(parser, token):
         
     If you do not specify the key, then all the votes are taken regardless 
     what key they have.
+    
+    Objects with a lot of votes should be displayed using pages: if *limit* 
+    (the page size) or *before* (the cursor of the page) are given, then 
+    the template variable is a list of at most *limit* votes, newest first,
+    and its *next_cursor* attribute can be used to link the next page, e.g.:
+    
+    .. code-block:: html+django
+    
+        {% get_latest_votes_for object limit 20 before request.GET.before as latest_votes %}
+        {% for vote in latest_votes %}
+            Vote by {{ vote.user }}: {{ vote.score }}
+        {% endfor %}
+        {% if latest_votes.next_cursor %}
+            <a href="?before={{ latest_votes.next_cursor }}">Older votes</a>
+        {% endif %}
     """
     return _get_latest_vote(parser, token, GET_LATEST_VOTES_FOR_EXPRESSION)
 
@@ -500,6 +517,8 @@ GET_LATEST_VOTES_BY_PATTERN = r"""
     ^ # begin of line
     (?P<user>[\w.]+) # user
     (\s+using\s+(?P<key>[\w'"]+))? # key
+    (\s+limit\s+(?P<limit>[\w.]+))? # page size
+    (\s+before\s+(?P<before>[\w.'"-]+))? # cursor
     \s+as\s+(?P<varname>\w+) # varname
     $ # end of line
 """
@@ -516,7 +535,7 @@ def get_latest_votes_by(parser, token):
     
     .. code-block:: html+django
     
-        {% get_latest_votes_by *user* [using *key*] as *var name* %}
+        {% get_latest_votes_by *user* [using *key*] [limit *size*] [before *cursor*] as *var name* %}
         
     Usage example:
     
@@ -539,6 +558,13 @@ def get_latest_votes_by(parser, token):
         
     If you do not specify the key, then all the votes are taken regardless 
     what key they have.
+    
+    As in *get_latest_votes_for*, the optional arguments *limit* and 
+    *before* can be used to display votes in pages, newest first, e.g.:
+    
+    .. code-block:: html+django
+    
+        {% get_latest_votes_by user limit 20 before request.GET.before as latest_votes %}
     """
     return _get_latest_vote(parser, token, GET_LATEST_VOTES_BY_EXPRESSION)
 
@@ -562,7 +588,8 @@ def _get_latest_vote(parser, token, expression):
     return LatestVotesNode(**match.groupdict())
     
 class LatestVotesNode(template.Node):
-    def __init__(self, key, varname, target_object=None, user=None):
+    def __init__(self, key, varname, target_object=None, user=None,
+        limit=None, before=None):
         assertion = 'This node must be called with either target_object or user'
         assert target_object or user, assertion
         # target object
@@ -581,9 +608,31 @@ class LatestVotesNode(template.Node):
             self.key = key[1:-1]
         else:
             self.key_variable = template.Variable(key)
+        # pagination
+        self.limit = template.Variable(limit) if limit else None
+        self.before = template.Variable(before) if before else None
         # varname
         self.varname = varname
         
+    def _get_latest(self, votes, context):
+        if self.limit is None and self.before is None:
+            return votes.order_by('modified_at')
+        # a page of votes, newest first
+        limit = managers.PAGE_SIZE
+        if self.limit is not None:
+            limit = int(self.limit.resolve(context))
+        before = None
+        if self.before is not None:
+            try:
+                before = self.before.resolve(context)
+            except template.VariableDoesNotExist:
+                pass
+        try:
+            return votes.page(limit, before)
+        except ValueError:
+            # invalid cursor: return the first page
+            return votes.page(limit)
+        
     def _get_key_lookup(self, context):
         lookups = {}
         if self.key_variable:
@@ -601,11 +650,11 @@ class LatestVotesNode(template.Node):
             if handler:
                 # getting the latest votes
                 latest_votes = handler.get_votes_for(target_object, **lookups)
-                context[self.varname] = latest_votes.order_by('modified_at')
+                context[self.varname] = self._get_latest(latest_votes, context)
         else:
             user = self.user.resolve(context)
             latest_votes = handlers.ratings.get_votes_by(user, **lookups)
-            context[self.varname] = latest_votes.order_by('modified_at')
+            context[self.varname] = self._get_latest(latest_votes, context)
         return u''
 
 
@@ -1,3 +0,0 @@
-__test__ = {"doctest": """
-
-"""}
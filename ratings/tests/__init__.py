@@ -0,0 +1,26 @@
+from ratings.tests.triggers import TriggersTest
+from ratings.tests.migrations import MigrationsTest
+from ratings.tests.buffer import BufferTest
+from ratings.tests.counters import CounterKeysTest
+from ratings.tests.idempotency import IdempotencyTest
+from ratings.tests.contents import QuerysetWithContentsTest
+from ratings.tests.feeds import FeedsTest
+from ratings.tests.views import VotedByViewTest
+from ratings.tests.admin import AdminTest
+from ratings.tests.cleanup import CleanupTest
+from ratings.tests.orphans import OrphansTest
+from ratings.tests.purge import PurgeTest
+from ratings.tests.archive import ArchiveTest
+from ratings.tests.ipaddresses import IPAddressTest
+from ratings.tests.keys import RatingKeyTest
+from ratings.tests.voters import VoterCookieTest
+from ratings.tests.voted import HasVotedManyTest
+from ratings.tests.leaderboards import LeaderboardsTest
+from ratings.tests.rankings import RankingTest
+from ratings.tests.keystats import KeyStatsTest
+from ratings.tests.variance import ScoreStatsTest
+from ratings.tests.rollups import RollupsTest
+from ratings.tests.trending import TrendingTest
+from ratings.tests.scorefields import ScoreFieldsTest
+from ratings.tests.facets import FacetsTest
+from ratings.tests.snapshots import SnapshotsTest
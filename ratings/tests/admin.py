@@ -0,0 +1,97 @@
+from django.contrib.admin.views.main import ChangeList
+from django.contrib.admin.sites import AdminSite
+from django.contrib.auth.models import User
+from django.contrib.contenttypes.models import ContentType
+from django.test.client import RequestFactory
+
+from ratings import models
+from ratings.admin import ScoreAdmin, VoteAdmin
+from ratings.tests.base import RatingsTestCase
+from testapp.models import Film, Book
+
+class AdminTest(RatingsTestCase):
+    def setUp(self):
+        super(AdminTest, self).setUp()
+        self.handler = self.register(Film)
+        self.register(Book)
+        self.films = [Film.objects.create(title='Film %d' % i) 
+            for i in range(3)]
+        self.books = [Book.objects.create(title='Book %d' % i) 
+            for i in range(3)]
+        for i, instance in enumerate(self.films + self.books):
+            self.handler.vote(None, self.make_vote(instance, i + 1, 
+                user=self.user))
+        self.messages = []
+        self.request = RequestFactory().get('/admin/')
+        self.request.user = self.user
+
+    def get_admin(self, admin_class, model):
+        model_admin = admin_class(model, AdminSite())
+        model_admin.message_user = lambda request, message: (
+            self.messages.append(unicode(message)))
+        return model_admin
+
+    def get_changelist(self, admin_class, model):
+        model_admin = self.get_admin(admin_class, model)
+        request = self.request
+        return model_admin.get_changelist(request)(request, model,
+            model_admin.list_display, model_admin.list_display_links,
+            model_admin.list_filter, model_admin.date_hierarchy,
+            model_admin.search_fields, model_admin.list_select_related,
+            model_admin.list_per_page, model_admin.list_max_show_all,
+            model_admin.list_editable, model_admin)
+
+    def test_score_changelist(self):
+        # key filter choices, count, page and one query for each 
+        # content type
+        with self.assertNumQueries(5):
+            changelist = self.get_changelist(ScoreAdmin, models.Score)
+            results = changelist.result_list
+            self.assertEqual([i.content_object for i in results], 
+                self.books[::-1] + self.films[::-1])
+            self.assertEqual([i.content_type for i in results],
+                [ContentType.objects.get_for_model(Book)] * 3 + 
+                [ContentType.objects.get_for_model(Film)] * 3)
+
+    def test_vote_changelist(self):
+        with self.assertNumQueries(5):
+            changelist = self.get_changelist(VoteAdmin, models.Vote)
+            results = changelist.result_list
+            self.assertEqual(set(i.content_object for i in results), 
+                set(self.films + self.books))
+            self.assertEqual(set(i.user for i in results), set([self.user]))
+
+    def test_recalculate_scores(self):
+        models.Score.objects.update(average=0, total=0)
+        model_admin = self.get_admin(ScoreAdmin, models.Score)
+        model_admin.recalculate_scores(self.request,
+            models.Score.objects.filter(object_id=self.films[2].pk))
+        # both the film and the book scores are recalculated
+        self.assertScore('main', 3, 1, 3, instance=self.films[2])
+        self.assertScore('main', 6, 1, 6, instance=self.books[2])
+        self.assertScore('main', 0, 1, 0, instance=self.films[1])
+        self.assertEqual(self.messages, [u'2 scores were recalculated.'])
+
+    def test_purge_scores(self):
+        model_admin = self.get_admin(ScoreAdmin, models.Score)
+        model_admin.purge_scores(self.request,
+            models.Score.objects.filter(object_id__in=[i.pk for i in 
+                self.films[:2]], content_type=ContentType.objects.get_for_model(Film)))
+        self.assertEqual(set(models.Score.objects.values_list(
+            'object_id', flat=True)), set([self.films[2].pk] + 
+                [i.pk for i in self.books]))
+        self.assertEqual(models.Vote.objects.count(), 4)
+        self.assertEqual(self.messages, 
+            [u'2 scores and their votes were deleted.'])
+
+    def test_purge_votes(self):
+        other = User.objects.create_user('other', 'other@example.com', 
+            'secret')
+        self.handler.vote(None, self.make_vote(self.films[0], 5, user=other))
+        model_admin = self.get_admin(VoteAdmin, models.Vote)
+        model_admin.purge_votes(self.request, 
+            models.Vote.objects.filter(user=self.user, 
+                content_type=ContentType.objects.get_for_model(Film)))
+        self.assertScore('main', 5, 1, 5, instance=self.films[0])
+        self.assertScore('main', 0, 0, 0, instance=self.films[1])
+        self.assertEqual(self.messages, [u'3 votes were deleted.'])
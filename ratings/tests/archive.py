@@ -0,0 +1,73 @@
+import datetime
+
+from django.contrib.auth.models import User
+
+from ratings import models, settings, archive, exceptions
+from ratings.tests.base import RatingsTestCase
+from testapp.models import Film
+
+class ArchiveTest(RatingsTestCase):
+    def setUp(self):
+        super(ArchiveTest, self).setUp()
+        self.addCleanup(setattr, settings, 'ARCHIVE_VOTES', 
+            settings.ARCHIVE_VOTES)
+        settings.ARCHIVE_VOTES = True
+        self.handler = self.register(Film, archive_fallback=True)
+        self.film = Film.objects.create(title='Film')
+        self.other = User.objects.create_user('other', 'other@example.com',
+            'secret')
+        self.give_vote(self.user, 2)
+        self.give_vote(self.other, 4)
+        self.cutoff = datetime.datetime.now() - datetime.timedelta(days=30)
+        self.age(self.user)
+
+    def give_vote(self, user, score):
+        self.handler.vote(None, self.make_vote(self.film, score, user=user))
+
+    def age(self, user):
+        models.Vote.objects.filter(user=user).update(
+            modified_at=self.cutoff - datetime.timedelta(days=1))
+
+    def test_disabled(self):
+        settings.ARCHIVE_VOTES = False
+        self.assertRaises(exceptions.ArchiveDisabled, archive.archive_votes, 
+            self.cutoff)
+        self.assertEqual(models.Vote.objects.count(), 2)
+
+    def test_archive(self):
+        self.age(self.other)
+        self.assertEqual(archive.archive_votes(self.cutoff, chunk_size=1), 2)
+        self.assertEqual(models.Vote.objects.count(), 0)
+        self.assertEqual(sorted(models.ArchivedVote.objects.values_list(
+            'user', 'score')), [(self.user.pk, 2), (self.other.pk, 4)])
+        # archived votes are still counted by scores
+        self.handler.update_score(self.film, 'main')
+        self.assertScore('main', 6, 2, 3, instance=self.film)
+
+    def test_fallback(self):
+        archive.archive_votes(self.cutoff)
+        self.assertTrue(self.handler.has_voted(self.film, 'main', self.user))
+        vote = self.handler.get_vote(self.film, 'main', self.user)
+        self.assertTrue(isinstance(vote, models.ArchivedVote))
+        self.assertEqual(vote.score, 2)
+        self.handler.archive_fallback = False
+        self.assertFalse(self.handler.has_voted(self.film, 'main', self.user))
+
+    def test_vote_again(self):
+        archive.archive_votes(self.cutoff)
+        # the new vote replaces the archived one
+        self.give_vote(self.user, 5)
+        self.assertEqual(models.ArchivedVote.objects.count(), 0)
+        self.assertScore('main', 9, 2, 4.5, instance=self.film)
+
+    def test_archive_again(self):
+        archive.archive_votes(self.cutoff)
+        # a vote saved bypassing the handler, next to the archived one
+        self.make_vote(self.film, 5, user=self.user).save()
+        self.age(self.user)
+        archive.archive_votes(self.cutoff)
+        # the older archived vote is replaced
+        self.assertEqual(list(models.ArchivedVote.objects.values_list(
+            'user', 'score')), [(self.user.pk, 5)])
+        self.handler.update_score(self.film, 'main')
+        self.assertScore('main', 9, 2, 4.5, instance=self.film)
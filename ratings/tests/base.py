@@ -0,0 +1,53 @@
+from django.test import TransactionTestCase
+from django.core.cache import cache
+from django.contrib.auth.models import User
+from django.contrib.contenttypes.models import ContentType
+from django.db.models.signals import pre_delete
+
+from ratings import models, fields, managers
+from ratings.handlers import ratings
+
+class RatingsTestCase(TransactionTestCase):
+    def setUp(self):
+        # tables are flushed between tests: forget the cached ids
+        fields._key_ids.clear()
+        fields._key_names.clear()
+        ContentType.objects.clear_cache()
+        managers._get_content_type_for_model_cache.clear()
+        cache.clear()
+        self.user = User.objects.create_user('voter', 'voter@example.com',
+            'secret')
+        self.content_type = ContentType.objects.get_for_model(User)
+
+    def register(self, model, **options):
+        """
+        Register *model* for the duration of the test, using the given
+        handler *options*. Return the handler.
+        """
+        ratings.register(model, **options)
+        handler = ratings.get_handler(model)
+        self.addCleanup(ratings.unregister, model)
+        # unregistering leaves the cleanup receiver connected
+        self.addCleanup(pre_delete.disconnect, handler.deleting_target_object,
+            sender=model)
+        return handler
+
+    def make_vote(self, instance, score, key='main', **kwargs):
+        """
+        Return an unsaved vote given to *instance*.
+        """
+        return models.Vote(
+            content_type=ContentType.objects.get_for_model(instance),
+            object_id=instance.pk, key=key, score=score, **kwargs)
+
+    def vote(self, score, key='main', **kwargs):
+        return models.Vote.objects.create(content_type=self.content_type,
+            object_id=self.user.pk, key=key, score=score, **kwargs)
+
+    def assertScore(self, key, total, num_votes, average, instance=None):
+        instance = instance or self.user
+        score = models.Score.objects.get(
+            content_type=ContentType.objects.get_for_model(instance),
+            object_id=instance.pk, key=key)
+        self.assertEqual((score.total, score.num_votes, score.average),
+            (total, num_votes, average))
@@ -0,0 +1,83 @@
+import datetime
+
+from django.contrib.auth.models import User
+
+from ratings import models, buffer
+from ratings.tests.base import RatingsTestCase
+from testapp.models import Film
+
+class BufferTest(RatingsTestCase):
+    def setUp(self):
+        super(BufferTest, self).setUp()
+        self.handler = self.register(Film, buffer_votes=True)
+        self.film = Film.objects.create(title='Film')
+        self.other = User.objects.create_user('other', 'other@example.com',
+            'secret')
+
+    def test_vote_is_buffered(self):
+        vote = self.make_vote(self.film, 4, user=self.user)
+        self.assertTrue(self.handler.vote(None, vote))
+        self.assertEqual(models.Vote.objects.count(), 0)
+        self.assertEqual(models.BufferedVote.objects.count(), 1)
+        # the optimistic score and the voter's vote reflect the buffer
+        score = vote.get_score()
+        self.assertEqual((score.total, score.num_votes), (4, 1))
+        self.assertEqual(self.handler.get_vote(self.film, 'main',
+            self.user).score, 4)
+        self.assertTrue(self.handler.has_voted(self.film, 'main', self.user))
+
+    def test_flush(self):
+        self.handler.vote(None, self.make_vote(self.film, 4, user=self.user))
+        self.handler.vote(None, self.make_vote(self.film, 2, 
+            user=self.other))
+        # votes flushed late keep the time they were given
+        given_at = datetime.datetime(2010, 1, 1, 12, 0)
+        models.BufferedVote.objects.update(created_at=given_at)
+        self.assertEqual(buffer.flush(), 2)
+        self.assertEqual(models.BufferedVote.objects.count(), 0)
+        votes = models.Vote.objects.all()
+        self.assertEqual(sorted(i.score for i in votes), [2, 4])
+        self.assertEqual(set(i.created_at for i in votes), set([given_at]))
+        self.assertEqual(set(i.modified_at for i in votes), set([given_at]))
+        self.assertScore('main', 6, 2, 3, instance=self.film)
+
+    def test_duplicates_collapse(self):
+        for score in (1, 3, 5):
+            vote = self.handler.get_vote(self.film, 'main', self.user
+                ) or self.make_vote(self.film, score, user=self.user)
+            vote.score = score
+            self.handler.vote(None, vote)
+        self.assertEqual(models.BufferedVote.objects.count(), 3)
+        buffer.flush()
+        self.assertEqual(list(models.Vote.objects.values_list('score',
+            flat=True)), [5])
+        self.assertScore('main', 5, 1, 5, instance=self.film)
+
+    def test_unchanged_vote_is_skipped(self):
+        self.handler.vote(None, self.make_vote(self.film, 3, user=self.user))
+        vote = self.handler.get_vote(self.film, 'main', self.user)
+        self.assertFalse(self.handler.vote(None, vote))
+        self.assertEqual(models.BufferedVote.objects.count(), 1)
+
+    def test_buffered_deletion(self):
+        self.handler.vote(None, self.make_vote(self.film, 3, user=self.user))
+        buffer.flush()
+        self.handler.delete(None, self.handler.get_vote(self.film, 'main',
+            self.user))
+        self.assertEqual(self.handler.get_vote(self.film, 'main', 
+            self.user), None)
+        self.assertEqual(models.Vote.objects.count(), 1)
+        buffer.flush()
+        self.assertEqual(models.Vote.objects.count(), 0)
+        self.assertScore('main', 0, 0, 0, instance=self.film)
+
+    def test_replay(self):
+        self.handler.vote(None, self.make_vote(self.film, 4, user=self.user))
+        entries = list(models.BufferedVote.objects.all())
+        buffer.flush()
+        # a batch processed again, e.g. after a crash of the flusher
+        for entry in entries:
+            entry.save(force_insert=True)
+        buffer.flush()
+        self.assertEqual(models.Vote.objects.count(), 1)
+        self.assertScore('main', 4, 1, 4, instance=self.film)
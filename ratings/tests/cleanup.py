@@ -0,0 +1,70 @@
+from django.contrib.contenttypes.models import ContentType
+
+from ratings import models
+from ratings.handlers import ratings
+from ratings.tests.base import RatingsTestCase
+from testapp.models import Book
+
+class CleanupTest(RatingsTestCase):
+    def setUp(self):
+        super(CleanupTest, self).setUp()
+        self.scheduled = []
+        self.handler = self.register(Book)
+        self.handler.schedule_cleanup = lambda content_type, object_ids: (
+            self.scheduled.append((content_type, set(object_ids))))
+        self.books = [Book.objects.create(title='Book %d' % i) 
+            for i in range(3)]
+        for book in self.books:
+            self.handler.vote(None, self.make_vote(book, 3, user=self.user))
+
+    def get_object_ids(self, model):
+        return set(model.objects.values_list('object_id', flat=True))
+
+    def test_cleanup(self):
+        self.books[0].delete()
+        remaining = set(i.pk for i in self.books[1:])
+        self.assertEqual(self.get_object_ids(models.Vote), remaining)
+        self.assertEqual(self.get_object_ids(models.Score), remaining)
+
+    def test_bulk_cleanup(self):
+        with ratings.bulk_cleanup():
+            with ratings.bulk_cleanup():
+                Book.objects.filter(pk=self.books[0].pk).delete()
+            Book.objects.filter(pk=self.books[1].pk).delete()
+            # nothing is deleted until the outermost block ends
+            self.assertEqual(models.Vote.objects.count(), 3)
+            self.assertEqual(models.Score.objects.count(), 3)
+        remaining = set([self.books[2].pk])
+        self.assertEqual(self.get_object_ids(models.Vote), remaining)
+        self.assertEqual(self.get_object_ids(models.Score), remaining)
+
+    def test_bulk_cleanup_queries(self):
+        # books: select, delete; votes: select, delete; scores: key 
+        # statistics (aggregate, update), select, delete
+        with self.assertNumQueries(8):
+            with ratings.bulk_cleanup():
+                Book.objects.all().delete()
+        self.assertEqual(models.Vote.objects.count(), 0)
+        self.assertEqual(models.Score.objects.count(), 0)
+
+    def test_bulk_cleanup_error(self):
+        def delete():
+            with ratings.bulk_cleanup():
+                Book.objects.all().delete()
+                raise ValueError
+        self.assertRaises(ValueError, delete)
+        self.assertEqual(models.Vote.objects.count(), 3)
+        self.assertEqual(models.Score.objects.count(), 3)
+
+    def test_defer_cleanup(self):
+        self.handler.defer_cleanup = True
+        with ratings.bulk_cleanup():
+            Book.objects.filter(pk__in=[i.pk for i in self.books[:2]]
+                ).delete()
+        self.assertEqual(self.scheduled, [(
+            ContentType.objects.get_for_model(Book), 
+            set(i.pk for i in self.books[:2]))])
+        self.assertEqual(models.Vote.objects.count(), 3)
+        models.delete_ratings_for(*self.scheduled[0])
+        self.assertEqual(self.get_object_ids(models.Vote), 
+            set([self.books[2].pk]))
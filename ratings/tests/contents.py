@@ -0,0 +1,57 @@
+from ratings import models, managers
+from ratings.tests.base import RatingsTestCase
+from testapp.models import Film, Book
+
+class QuerysetWithContentsTest(RatingsTestCase):
+    def setUp(self):
+        super(QuerysetWithContentsTest, self).setUp()
+        self.films = [Film.objects.create(title='Film %d' % i)
+            for i in range(5)]
+        self.book = Book.objects.create(title='Book')
+        for instance in self.films + [self.book]:
+            models.Vote.objects.create(content_type=self.content_type_for(
+                instance), object_id=instance.pk, key='main', score=3,
+                user=self.user)
+        self.votes = models.Vote.objects.order_by('id')
+        # warm the content types cache
+        for instance in (self.films[0], self.book):
+            self.content_type_for(instance)
+
+    def content_type_for(self, instance):
+        return managers.get_content_type_for_model(type(instance))
+
+    def test_contents_in_chunks(self):
+        queryset = managers.QuerysetWithContents(self.votes, chunk_size=2)
+        # one query for the votes, and one for each content type of the
+        # three chunks (the last one contains a film and a book)
+        with self.assertNumQueries(5):
+            contents = [i.content_object for i in queryset]
+        self.assertEqual(contents, self.films + [self.book])
+        # results are cached
+        with self.assertNumQueries(0):
+            self.assertEqual(len(queryset), 6)
+            self.assertEqual(queryset[5].content_object, self.book)
+
+    def test_iterator(self):
+        queryset = managers.QuerysetWithContents(self.votes, chunk_size=4)
+        self.assertEqual([i.content_object for i in queryset.iterator()],
+            self.films + [self.book])
+        self.assertEqual(queryset._result_cache, None)
+
+    def test_orphans(self):
+        Book.objects.filter(pk=self.book.pk).delete()
+        queryset = managers.QuerysetWithContents(self.votes)
+        self.assertEqual([i.content_object for i in queryset], self.films)
+        queryset = managers.QuerysetWithContents(self.votes, 
+            keep_orphans=True)
+        self.assertEqual([i.content_object for i in queryset], 
+            self.films + [None])
+
+    def test_queryset_methods(self):
+        queryset = managers.QuerysetWithContents(self.votes)
+        filtered = queryset.filter(
+            object_id__in=[self.films[1].pk, self.films[2].pk])
+        self.assertTrue(isinstance(filtered, managers.QuerysetWithContents))
+        self.assertEqual(filtered.count(), 2)
+        self.assertEqual([i.content_object for i in queryset[1:3]],
+            self.films[1:3])
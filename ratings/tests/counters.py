@@ -0,0 +1,66 @@
+from django.contrib.auth.models import User
+
+from ratings import models
+from ratings.tests.base import RatingsTestCase
+from testapp.models import Film
+
+class CounterKeysTest(RatingsTestCase):
+    def setUp(self):
+        super(CounterKeysTest, self).setUp()
+        self.handler = self.register(Film, counter_keys=('like',))
+        self.film = Film.objects.create(title='Film')
+        self.other = User.objects.create_user('other', 'other@example.com',
+            'secret')
+
+    def like(self, user):
+        vote = self.make_vote(self.film, 1, key='like', user=user)
+        self.handler.vote(None, vote)
+        return vote
+
+    def get_score(self):
+        return self.handler.get_score(self.film, 'like')
+
+    def test_votes_are_counted(self):
+        self.like(self.user)
+        self.like(self.other)
+        score = self.get_score()
+        self.assertEqual((score.num_votes, score.ranking), (2, 2))
+        # average and total scores are not calculated
+        self.assertEqual((score.total, score.average), (0, 0))
+
+    def test_changed_vote_is_not_counted(self):
+        vote = self.like(self.user)
+        vote.score = 2
+        self.assertFalse(self.handler.vote(None, vote))
+        self.assertEqual(self.get_score().num_votes, 1)
+
+    def test_delete(self):
+        vote = self.like(self.user)
+        self.like(self.other)
+        self.handler.delete(None, vote)
+        self.assertEqual(vote.pk, None)
+        self.assertEqual(self.get_score().num_votes, 1)
+
+    def test_concurrent_delete(self):
+        vote = self.like(self.user)
+        self.like(self.other)
+        # two requests deleting the same vote
+        stale = models.Vote.objects.get(pk=vote.pk)
+        self.handler.delete(None, vote)
+        self.handler.delete(None, stale)
+        self.assertEqual(self.get_score().num_votes, 1)
+        self.assertFalse(models.delete_vote(models.Vote(pk=stale.pk)))
+
+    def test_recalculation_recounts(self):
+        self.like(self.user)
+        models.Score.objects.update(num_votes=10)
+        score = self.handler.update_score(self.film, 'like')
+        self.assertEqual((score.num_votes, score.ranking), (1, 1))
+
+    def test_has_liked(self):
+        other_film = Film.objects.create(title='Other')
+        self.like(self.user)
+        self.assertEqual(self.handler.has_liked([self.film, other_film],
+            'like', self.user), set([self.film.pk]))
+        self.assertEqual(self.handler.has_liked([], 'like', self.user), 
+            set())
@@ -0,0 +1,69 @@
+from django.contrib.auth.models import User
+
+from ratings import models
+from ratings.tests.base import RatingsTestCase
+from testapp.models import Film
+
+class FacetsTest(RatingsTestCase):
+    def setUp(self):
+        super(FacetsTest, self).setUp()
+        self.handler = self.register(Film)
+        self.other = User.objects.create_user('other', 'other@example.com',
+            'secret')
+        self.films = [Film.objects.create(title='Film %d' % i) 
+            for i in range(5)]
+        # averages: 5, 4.5, 3, 1.5, no votes
+        for film, scores in zip(self.films, [(5,), (4, 5), (3,), (1, 2)]):
+            for user, score in zip((self.user, self.other), scores):
+                self.give_vote(film, score, user)
+    
+    def give_vote(self, film, score, user):
+        vote = self.make_vote(film, score, user=user)
+        self.handler.vote(None, vote)
+        return vote
+        
+    def test_default_buckets(self):
+        facets = self.handler.facet_counts(Film.objects.all(), 'main')
+        self.assertEqual(facets.items(), [(5, 1), (4, 2), (3, 3), (2, 3),
+            (1, 4)])
+        
+    def test_buckets(self):
+        queryset = Film.objects.exclude(pk=self.films[0].pk)
+        facets = self.handler.facet_counts(queryset, 'main', 
+            buckets=(2, 4))
+        self.assertEqual(facets.items(), [(4, 1), (2, 2)])
+        facets = self.handler.facet_counts(queryset, 'main', 
+            buckets=(2,), field='num_votes')
+        self.assertEqual(facets.items(), [(2, 2)])
+        
+    def test_empty(self):
+        facets = self.handler.facet_counts(Film.objects.none(), 'main', 
+            buckets=(3,))
+        self.assertEqual(facets.items(), [(3, 0)])
+        facets = self.handler.facet_counts(Film.objects.all(), 'unknown', 
+            buckets=(3,))
+        self.assertEqual(facets.items(), [(3, 0)])
+        
+    def test_invalid_field(self):
+        self.assertRaises(ValueError, self.handler.facet_counts, 
+            Film.objects.all(), 'main', field='title')
+        
+    def test_cache(self):
+        queryset = Film.objects.all()
+        self.handler.facet_counts(queryset, 'main', buckets=(4,))
+        # scores changed by other means are not seen until the cache expires
+        models.Score.objects.update(average=5)
+        facets = self.handler.facet_counts(queryset, 'main', buckets=(4,))
+        self.assertEqual(facets.items(), [(4, 2)])
+        # the voting process invalidates cached counts
+        self.give_vote(self.films[4], 3, self.user)
+        facets = self.handler.facet_counts(queryset, 'main', buckets=(4,))
+        self.assertEqual(facets.items(), [(4, 4)])
+        
+    def test_no_cache(self):
+        self.handler.facet_counts_timeout = 0
+        queryset = Film.objects.all()
+        self.handler.facet_counts(queryset, 'main', buckets=(4,))
+        models.Score.objects.update(average=5)
+        facets = self.handler.facet_counts(queryset, 'main', buckets=(4,))
+        self.assertEqual(facets.items(), [(4, 4)])
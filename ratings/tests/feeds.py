@@ -0,0 +1,57 @@
+import datetime
+
+from django import template
+
+from ratings import models, managers
+from ratings.handlers import ratings
+from ratings.tests.base import RatingsTestCase
+from testapp.models import Film
+
+class FeedsTest(RatingsTestCase):
+    def setUp(self):
+        super(FeedsTest, self).setUp()
+        self.handler = self.register(Film)
+        self.films = [Film.objects.create(title='Film %d' % i)
+            for i in range(5)]
+        for film in self.films:
+            self.handler.vote(None, self.make_vote(film, 3, user=self.user))
+        # votes modified at the same time are sorted by id
+        when = datetime.datetime(2010, 1, 1)
+        models.Vote.objects.filter(object_id__in=[i.pk for i in 
+            self.films[1:3]]).update(modified_at=when)
+        models.Vote.objects.filter(object_id=self.films[0].pk).update(
+            modified_at=when - datetime.timedelta(days=1))
+        self.newest_first = [self.films[i] for i in (4, 3, 2, 1, 0)]
+
+    def test_pages(self):
+        contents, before = [], None
+        while True:
+            page = ratings.get_votes_by(self.user).page(2, before)
+            self.assertTrue(len(page) <= 2)
+            contents.extend(i.content_object for i in page)
+            before = page.next_cursor
+            if before is None:
+                break
+        self.assertEqual(contents, self.newest_first)
+
+    def test_get_page(self):
+        page = managers.get_page(models.Vote.objects.all(), limit=5)
+        self.assertEqual(len(page), 5)
+        self.assertEqual(page.next_cursor, None)
+        self.assertRaises(ValueError, managers.get_page, 
+            models.Vote.objects.all(), before='invalid')
+
+    def test_cursor(self):
+        vote = models.Vote.objects.get(object_id=self.films[1].pk)
+        self.assertEqual(managers.parse_cursor(managers.get_cursor(vote)),
+            (vote.modified_at, vote.id))
+
+    def test_template_tag(self):
+        source = ('{% load ratings_tags %}{% get_latest_votes_by user limit 3 '
+            'before cursor as votes %}{% for vote in votes %}'
+            '{{ vote.content_object.title }},{% endfor %}'
+            '{{ votes.next_cursor|yesno:"more," }}')
+        context = template.Context({'user': self.user, 'cursor': 'invalid'})
+        # an invalid cursor shows the first page
+        self.assertEqual(template.Template(source).render(context),
+            'Film 4,Film 3,Film 2,more')
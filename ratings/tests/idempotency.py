@@ -0,0 +1,74 @@
+from django.utils import simplejson as json
+from django.test.client import RequestFactory
+from django.contrib.auth.models import AnonymousUser
+
+from ratings import models, signals, views
+from ratings.forms import VoteForm
+from ratings.tests.base import RatingsTestCase
+from testapp.models import Film
+
+class IdempotencyTest(RatingsTestCase):
+    def setUp(self):
+        super(IdempotencyTest, self).setUp()
+        self.handler = self.register(Film, allow_anonymous=True)
+        self.film = Film.objects.create(title='Film')
+        self.saved = []
+        signals.vote_was_saved.connect(self.vote_was_saved)
+        self.addCleanup(signals.vote_was_saved.disconnect, 
+            self.vote_was_saved)
+
+    def vote_was_saved(self, vote, **kwargs):
+        self.saved.append(vote.score)
+
+    def post(self, score, token=None, instance=None, user=None, cookies=None):
+        """
+        Post a vote to the voting view, returning the response.
+        """
+        data = dict(VoteForm(instance or self.film, 'main').initial, 
+            score=score)
+        if token is not None:
+            data['idempotency_token'] = token
+        request = RequestFactory().post('/vote/', data,
+            HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        request.user = user or self.user
+        request.COOKIES.update(cookies or {})
+        return views.vote(request)
+
+    def test_unchanged_vote_is_skipped(self):
+        self.post(3)
+        response = self.post(3)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content)['vote_score'], 3)
+        self.assertEqual(self.saved, [3])
+        self.post(4)
+        self.assertEqual(self.saved, [3, 4])
+        self.assertScore('main', 4, 1, 4, instance=self.film)
+
+    def test_retried_request(self):
+        first = self.post(4, token='token')
+        retried = self.post(5, token='token')
+        self.assertEqual(retried.content, first.content)
+        self.assertEqual(self.saved, [4])
+        self.assertScore('main', 4, 1, 4, instance=self.film)
+        # another token is a new request
+        self.post(5, token='other')
+        self.assertScore('main', 5, 1, 5, instance=self.film)
+
+    def test_token_is_bound_to_target(self):
+        other = Film.objects.create(title='Other')
+        self.post(4, token='token')
+        self.post(2, token='token', instance=other)
+        self.assertEqual(models.Vote.objects.count(), 2)
+
+    def test_anonymous_token_is_bound_to_voter(self):
+        anonymous = AnonymousUser()
+        first = self.post(4, token='token', user=anonymous)
+        self.assertTrue(first.cookies)
+        # the retried response does not set the voter's cookies again
+        retried = self.post(4, token='token', user=anonymous)
+        self.assertEqual(retried.content, first.content)
+        self.assertFalse(retried.cookies)
+        # another voter using the same token votes
+        cookies = dict((k, 'a' * 40) for k in first.cookies)
+        self.post(2, token='token', user=anonymous, cookies=cookies)
+        self.assertEqual(models.Vote.objects.count(), 2)
@@ -0,0 +1,46 @@
+from django.core import exceptions
+
+from ratings import models, fields, purge
+from ratings.tests.base import RatingsTestCase
+
+class IPAddressTest(RatingsTestCase):
+    addresses = ('10.0.0.1', '192.168.255.255', '2001:db8::1', '::1')
+
+    def test_pack(self):
+        for address in self.addresses:
+            packed = fields.pack_ip_address(address)
+            self.assertEqual(len(packed), 16)
+            self.assertEqual(fields.unpack_ip_address(packed), address)
+        # IPv4 addresses are mapped to IPv6 ones
+        self.assertEqual(fields.pack_ip_address('10.0.0.1'),
+            fields.pack_ip_address('::ffff:10.0.0.1'))
+        for address in ('10.0.0.256', 'invalid', '2001:db8:::1', None):
+            self.assertRaises(ValueError, fields.pack_ip_address, address)
+
+    def test_field(self):
+        for address in self.addresses:
+            self.vote(3, ip_address=address, cookie=address)
+        # values_list returns packed buffers: use the model instances
+        self.assertEqual(sorted(i.ip_address 
+            for i in models.Vote.objects.all()), sorted(self.addresses))
+        self.assertEqual(models.Vote.objects.get(
+            ip_address='2001:db8::1').cookie, '2001:db8::1')
+        field = models.Vote._meta.get_field('ip_address')
+        self.assertRaises(exceptions.ValidationError, field.to_python, 
+            'invalid')
+
+    def test_networks(self):
+        for address in self.addresses + ('10.255.255.255', '11.0.0.0'):
+            self.vote(3, ip_address=address, cookie=address)
+        def get_addresses(network):
+            return sorted(i.ip_address for i in models.Vote.objects.filter(
+                purge.get_network_lookups(network)))
+        self.assertEqual(get_addresses('10.0.0.0/8'), 
+            ['10.0.0.1', '10.255.255.255'])
+        self.assertEqual(get_addresses('192.168.255.255'), 
+            ['192.168.255.255'])
+        self.assertEqual(get_addresses('2001:db8::/32'), ['2001:db8::1'])
+        # all the IPv4 addresses
+        self.assertEqual(len(get_addresses('0.0.0.0/0')), 4)
+        for network in ('10.0.0.0/33', '10.0.0.0/x', '2001:db8::/129'):
+            self.assertRaises(ValueError, purge.get_network_lookups, network)
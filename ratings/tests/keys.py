@@ -0,0 +1,46 @@
+from django.db import transaction
+
+from ratings import models, fields
+from ratings.tests.base import RatingsTestCase
+
+class RatingKeyTest(RatingsTestCase):
+    def test_registration(self):
+        self.vote(3, key='main')
+        self.vote(4, key='other', cookie='a')
+        key = models.RatingKey.objects.get(name='main')
+        # keys are stored as ids and cached
+        self.assertEqual(models.Vote.objects.filter(key=key.pk).count(), 1)
+        with self.assertNumQueries(0):
+            self.assertEqual(fields.get_key_id('main'), key.pk)
+            self.assertEqual(fields.get_key_name(key.pk), 'main')
+            self.assertEqual(fields.get_key_name('main'), 'main')
+        self.assertEqual(models.Vote.objects.get(key='other').score, 4)
+
+    def test_lookups(self):
+        self.vote(3, key='main')
+        self.vote(4, key='other', cookie='a')
+        self.assertEqual(models.Vote.objects.filter(
+            key__in=['main', 'other', 'unknown']).count(), 2)
+        self.assertEqual(models.Vote.objects.filter(
+            key__isnull=True).count(), 0)
+        # unknown keys are not registered by lookups
+        self.assertEqual(models.Vote.objects.filter(key='unknown').count(), 0)
+        self.assertFalse(models.RatingKey.objects.filter(
+            name='unknown').exists())
+        self.assertRaises(TypeError, models.Vote.objects.filter, 
+            key__startswith='m')
+
+    def test_rollback(self):
+        with transaction.commit_manually():
+            self.vote(3, key='rolled')
+            # the key is visible in its transaction, but not cached
+            self.assertEqual(models.Vote.objects.get(key='rolled').score, 3)
+            self.assertFalse('rolled' in fields._key_ids)
+            transaction.rollback()
+        self.assertFalse(models.RatingKey.objects.filter(
+            name='rolled').exists())
+        # the key is registered again, with a valid id
+        self.vote(4, key='rolled')
+        key = models.RatingKey.objects.get(name='rolled')
+        self.assertEqual(fields.get_key_id('rolled'), key.pk)
+        self.assertEqual(models.Vote.objects.get(key='rolled').score, 4)
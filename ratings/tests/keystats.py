@@ -0,0 +1,70 @@
+from django.contrib.auth.models import User
+
+from ratings import models
+from ratings.handlers import ratings
+from ratings.tests.base import RatingsTestCase
+from testapp.models import Film, Book
+
+class KeyStatsTest(RatingsTestCase):
+    def setUp(self):
+        super(KeyStatsTest, self).setUp()
+        self.handler = self.register(Film, counter_keys=('like',), 
+            key_stats_timeout=0)
+        self.other = User.objects.create_user('other', 'other@example.com',
+            'secret')
+        self.films = [Film.objects.create(title='Film %d' % i) 
+            for i in range(3)]
+        for film, scores in zip(self.films, [(2, 4), (5,), (3, 1)]):
+            for user, score in zip((self.user, self.other), scores):
+                self.give_vote(film, score, user)
+
+    def give_vote(self, film, score, user, key='main'):
+        vote = self.make_vote(film, score, key=key, user=user)
+        self.handler.vote(None, vote)
+        return vote
+
+    def assertStats(self, num_scores, num_votes, total, key='main'):
+        stats = self.handler.get_key_stats(key)
+        self.assertEqual((stats.num_scores, stats.num_votes, stats.total),
+            (num_scores, num_votes, total))
+
+    def test_voting(self):
+        self.assertStats(3, 5, 15)
+        stats = self.handler.get_key_stats('main')
+        self.assertEqual((stats.average, stats.average_votes), (3, 5 / 3.0))
+        vote = self.handler.get_vote(self.films[1], 'main', self.user)
+        self.handler.delete(None, vote)
+        # the score has no votes
+        self.assertStats(2, 4, 10)
+        self.give_vote(self.films[0], 1, self.user, key='like')
+        self.assertStats(1, 1, 0, key='like')
+
+    def test_rebuild(self):
+        models.KeyStats.objects.all().delete()
+        models.rebuild_key_stats()
+        self.assertStats(3, 5, 15)
+
+    def test_delete_scores(self):
+        models.delete_scores(models.Score.objects.filter(
+            object_id=self.films[0].pk))
+        self.assertStats(2, 3, 9)
+
+    def test_delete_target(self):
+        # scores are deleted by both the cleanup and the cascade
+        self.films[0].delete()
+        self.assertStats(2, 3, 9)
+        Film.objects.all().delete()
+        self.assertStats(0, 0, 0)
+
+    def test_bulk_cleanup(self):
+        with ratings.bulk_cleanup():
+            Film.objects.filter(pk__in=[i.pk for i in self.films[:2]]
+                ).delete()
+        self.assertStats(1, 2, 4)
+
+    def test_defer_cleanup(self):
+        self.handler.defer_cleanup = True
+        Film.objects.filter(pk=self.films[2].pk).delete()
+        self.assertStats(2, 3, 11)
+        self.films[0].delete()
+        self.assertStats(1, 1, 5)
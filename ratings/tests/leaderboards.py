@@ -0,0 +1,66 @@
+from django.contrib.auth.models import User
+
+from ratings.tests.base import RatingsTestCase
+from testapp.models import Film
+
+class LeaderboardsTest(RatingsTestCase):
+    def setUp(self):
+        super(LeaderboardsTest, self).setUp()
+        self.handler = self.register(Film, leaderboard_size=3)
+        self.voters = [User.objects.create_user('user%d' % i, 
+            'user%d@example.com' % i, 'secret') for i in range(6)]
+        self.films = [Film.objects.create(title='Film %d' % i) 
+            for i in range(5)]
+        for film, scores in zip(self.films, [(3, 3), (5,), (4, 4), (2,), 
+            (1, 2, 3)]):
+            self.give_votes(film, *scores)
+
+    def give_votes(self, film, *scores, **kwargs):
+        voters = self.voters[kwargs.get('start', 0):]
+        for voter, score in zip(voters, scores):
+            self.handler.vote(None, self.make_vote(film, score, user=voter))
+
+    def get_top(self, n=3, **kwargs):
+        return [self.films.index(i.content_object) 
+            for i in self.handler.get_top('main', n, **kwargs)]
+
+    def get_leaderboard(self, *args, **kwargs):
+        return [(value, num_votes, self.films.index(Film(pk=object_id))) 
+            for value, num_votes, object_id in 
+            self.handler.get_leaderboard('main', *args, **kwargs)]
+
+    def test_get_top(self):
+        self.assertEqual(self.get_top(), [1, 2, 0])
+        self.assertEqual(self.get_top(2, min_votes=2), [2, 0])
+        self.assertEqual(self.get_top(2, order='num_votes'), [4, 0])
+        # more scores than the leaderboard size are read from the database
+        self.assertEqual(self.get_top(5), [1, 2, 0, 4, 3])
+        self.assertRaises(ValueError, self.get_top, order='modified_at')
+
+    def test_incremental_updates(self):
+        self.assertEqual(self.get_top(), [1, 2, 0])
+        self.give_votes(self.films[3], 5, 5, start=3)
+        # the leaderboard is updated in place
+        with self.assertNumQueries(0):
+            self.assertEqual(self.get_leaderboard(), 
+                [(5, 1, 1), (4, 3, 3), (4, 2, 2)])
+        self.assertEqual(self.get_top(), [1, 3, 2])
+
+    def test_invalidation(self):
+        self.assertEqual(self.get_top(), [1, 2, 0])
+        # the last score drops: another score could take its place
+        self.give_votes(self.films[0], 1, 1, 1, start=3)
+        self.assertEqual(self.get_top(), [1, 2, 4])
+
+    def test_deleted_targets(self):
+        self.assertEqual(self.get_top(2), [1, 2])
+        # scores of deleted objects are skipped
+        self.films[1].delete()
+        self.assertEqual(self.get_top(2), [2, 0])
+
+    def test_rebuild(self):
+        self.get_top()
+        self.get_top(min_votes=2)
+        self.assertEqual(self.handler.rebuild_leaderboards(), 2)
+        self.assertEqual(self.get_leaderboard(min_votes=2), 
+            [(4, 2, 2), (3, 2, 0), (2, 3, 4)])
@@ -0,0 +1,114 @@
+from django.db import connection
+from django.core.management import call_command
+from django.core.management.color import no_style
+from django.core.management.sql import custom_sql_for_model
+
+from ratings import models, schema
+from ratings.tests.base import RatingsTestCase
+
+# the votes and scores tables as created by the first versions of this app
+BASELINE_TABLES = {
+    models.Score: """
+        CREATE TABLE "ratings_score" (
+            "id" integer NOT NULL PRIMARY KEY,
+            "content_type_id" integer NOT NULL,
+            "object_id" integer unsigned NOT NULL,
+            "key" varchar(16) NOT NULL,
+            "average" real NOT NULL,
+            "total" integer NOT NULL,
+            "num_votes" integer unsigned NOT NULL,
+            UNIQUE ("content_type_id", "object_id", "key")
+        )""",
+    models.Vote: """
+        CREATE TABLE "ratings_vote" (
+            "id" integer NOT NULL PRIMARY KEY,
+            "content_type_id" integer NOT NULL,
+            "object_id" integer unsigned NOT NULL,
+            "key" varchar(16) NOT NULL,
+            "score" real NOT NULL,
+            "user_id" integer NULL,
+            "ip_address" char(15) NULL,
+            "cookie" varchar(40) NULL,
+            "created_at" datetime NOT NULL,
+            "modified_at" datetime NOT NULL,
+            UNIQUE ("content_type_id", "object_id", "key", "user_id"),
+            UNIQUE ("content_type_id", "object_id", "key", "ip_address",
+                "cookie")
+        )""",
+}
+
+class MigrationsTest(RatingsTestCase):
+    def setUp(self):
+        super(MigrationsTest, self).setUp()
+        self.rebuild_tables(baseline=True)
+        cursor = connection.cursor()
+        cursor.executemany('INSERT INTO "ratings_vote" ("content_type_id", '
+            '"object_id", "key", "score", "user_id", "ip_address", "cookie", '
+            '"created_at", "modified_at") VALUES (%s, %s, %s, %s, %s, %s, '
+            '%s, %s, %s)', [
+            (self.content_type.pk, self.user.pk, 'main', 3, self.user.pk,
+                '10.0.0.1', None, '2010-01-01', '2010-01-01'),
+            (self.content_type.pk, self.user.pk, 'main', 5, None,
+                '10.0.0.2', 'abc', '2010-01-01', '2010-01-01'),
+            (self.content_type.pk, self.user.pk, 'other', 4, None,
+                'invalid', 'abc', '2010-01-01', '2010-01-01'),
+        ])
+        cursor.executemany('INSERT INTO "ratings_score" ("content_type_id", '
+            '"object_id", "key", "average", "total", "num_votes") '
+            'VALUES (%s, %s, %s, %s, %s, %s)', [
+            (self.content_type.pk, self.user.pk, 'main', 4, 8, 2),
+            (self.content_type.pk, self.user.pk, 'other', 4, 4, 1),
+        ])
+
+    def tearDown(self):
+        self.rebuild_tables()
+
+    def rebuild_tables(self, baseline=False):
+        """
+        Recreate the votes and scores tables, using the baseline schema
+        or the current model definitions.
+        """
+        style = no_style()
+        cursor = connection.cursor()
+        for model in (models.Score, models.Vote):
+            table = model._meta.db_table
+            cursor.execute('DROP TABLE %s' % connection.ops.quote_name(table))
+            if baseline:
+                statements = [BASELINE_TABLES[model]]
+            else:
+                statements = (connection.creation.sql_create_model(model,
+                    style, known_models=set([model]))[0] +
+                    connection.creation.sql_indexes_for_model(model, style) +
+                    custom_sql_for_model(model, style, connection))
+            for statement in statements:
+                cursor.execute(statement)
+
+    def test_migrations(self):
+        call_command('migrate_rating_keys', verbosity=0)
+        call_command('migrate_ip_addresses', verbosity=0)
+        call_command('upsert_scores', verbosity=0)
+        # legacy columns still used by unique indexes are dropped last
+        call_command('migrate_rating_keys', verbosity=0)
+        for model in (models.Score, models.Vote):
+            columns = schema.get_columns(model)
+            self.assertEqual(columns,
+                set(i.column for i in model._meta.local_fields))
+        self.assertEqual(sorted(models.RatingKey.objects.values_list(
+            'name', flat=True)), [u'main', u'other'])
+        # keys and ip addresses are converted by the model fields
+        self.assertEqual(sorted((i.key, i.score, i.ip_address, i.cookie)
+            for i in models.Vote.objects.all()), [
+            (u'main', 3, '10.0.0.1', None),
+            (u'main', 5, '10.0.0.2', u'abc'),
+            (u'other', 4, None, u'abc'),
+        ])
+        self.assertScore('main', 8, 2, 4)
+        self.assertScore('other', 4, 1, 4)
+        self.assertEqual(models.Vote.objects.filter(
+            ip_address__range=('10.0.0.0', '10.0.0.255')).count(), 2)
+        # running the commands again is harmless
+        call_command('migrate_rating_keys', verbosity=0)
+        call_command('migrate_ip_addresses', verbosity=0)
+        self.assertEqual(models.Vote.objects.count(), 3)
+        self.vote(1, key='main', cookie='def')
+        self.assertEqual(models.Vote.objects.filter(key='main').count(), 3)
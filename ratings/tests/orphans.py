@@ -0,0 +1,71 @@
+from django.db import connection, transaction
+from django.contrib.contenttypes.models import ContentType
+
+from ratings import models, orphans
+from ratings.tests.base import RatingsTestCase
+from testapp.models import Film, Book
+
+class OrphansTest(RatingsTestCase):
+    def setUp(self):
+        super(OrphansTest, self).setUp()
+        self.handler = self.register(Film)
+        self.register(Book)
+        self.films = [Film.objects.create(title='Film %d' % i) 
+            for i in range(5)]
+        self.books = [Book.objects.create(title='Book %d' % i) 
+            for i in range(2)]
+        for instance in self.films + self.books:
+            self.handler.vote(None, self.make_vote(instance, 4, 
+                user=self.user))
+        # raw deletes do not send pre_delete
+        self.raw_delete(Film, [i.pk for i in self.films[1:4]])
+        self.film_type = ContentType.objects.get_for_model(Film)
+        self.book_type = ContentType.objects.get_for_model(Book)
+
+    def raw_delete(self, model, ids):
+        connection.cursor().execute('DELETE FROM %s WHERE id IN (%s)' % (
+            model._meta.db_table, ', '.join(str(i) for i in ids)))
+        transaction.commit_unless_managed()
+
+    def get_object_ids(self, model, content_type):
+        return set(model.objects.filter(content_type=content_type
+            ).values_list('object_id', flat=True))
+
+    def test_dry_run(self):
+        report = orphans.sweep(models.Vote, dry_run=True, chunk_size=2)
+        self.assertEqual(dict(report), 
+            {self.film_type.id: 3, self.book_type.id: 0})
+        self.assertEqual(models.Vote.objects.count(), 7)
+
+    def test_sweep(self):
+        for model in (models.Vote, models.Score):
+            report = orphans.sweep(model, chunk_size=2)
+            self.assertEqual(report[self.film_type.id], 3)
+            self.assertEqual(self.get_object_ids(model, self.film_type),
+                set([self.films[0].pk, self.films[4].pk]))
+            self.assertEqual(self.get_object_ids(model, self.book_type),
+                set(i.pk for i in self.books))
+        # swept scores are subtracted from the key statistics
+        stats = models.KeyStats.objects.get(content_type=self.film_type)
+        self.assertEqual((stats.num_scores, stats.num_votes, stats.total), 
+            (2, 2, 8))
+
+    def test_sweep_without_join(self):
+        can_join = orphans._can_join
+        orphans._can_join = lambda model, target: False
+        self.addCleanup(setattr, orphans, '_can_join', can_join)
+        self.raw_delete(Book, [self.books[0].pk])
+        report = orphans.sweep(models.Vote, chunk_size=3)
+        self.assertEqual(dict(report), 
+            {self.film_type.id: 3, self.book_type.id: 1})
+        self.assertEqual(self.get_object_ids(models.Vote, self.book_type),
+            set([self.books[1].pk]))
+
+    def test_removed_content_type(self):
+        removed = ContentType.objects.create(name='removed', 
+            app_label='testapp', model='removed')
+        models.Vote.objects.filter(content_type=self.book_type).update(
+            content_type=removed)
+        report = orphans.sweep(models.Vote)
+        self.assertEqual(report[removed.id], 2)
+        self.assertEqual(self.get_object_ids(models.Vote, removed), set())
@@ -0,0 +1,80 @@
+import datetime
+
+from django.contrib.auth.models import User
+
+from ratings import models, purge, rollups
+from ratings.tests.base import RatingsTestCase
+from testapp.models import Film
+
+class PurgeTest(RatingsTestCase):
+    def setUp(self):
+        super(PurgeTest, self).setUp()
+        self.handler = self.register(Film, rollup_votes=True, 
+            trending_half_life=3600)
+        self.films = [Film.objects.create(title='Film %d' % i) 
+            for i in range(3)]
+        self.spammer = User.objects.create_user('spammer', 
+            'spammer@example.com', 'secret')
+        for film in self.films:
+            self.give_vote(film, 2, self.user, '192.168.0.1')
+            self.give_vote(film, 5, self.spammer, '10.1.2.3')
+        self.since = datetime.datetime.now() - datetime.timedelta(hours=1)
+
+    def give_vote(self, film, score, user, ip_address):
+        self.handler.vote(None, self.make_vote(film, score, user=user, 
+            ip_address=ip_address))
+
+    def assertPurged(self):
+        for film in self.films:
+            self.assertScore('main', 2, 1, 2, instance=film)
+            self.assertEqual(rollups.get_window_stats(film, 'main', 
+                self.since), (1, 2))
+            score = self.handler.get_score(film, 'main')
+            self.assertAlmostEqual(self.handler.get_trending(score), 1, 3)
+
+    def test_purge_user(self):
+        report = purge.purge_votes(user=self.spammer, chunk_size=2)
+        self.assertEqual(report['votes'], 3)
+        self.assertEqual(report['targets'], 
+            set((i.content_type_id, i.object_id, 'main') 
+                for i in models.Score.objects.all()))
+        self.assertEqual(models.Vote.objects.filter(user=self.spammer
+            ).count(), 0)
+        self.assertPurged()
+
+    def test_purge_network(self):
+        report = purge.purge_votes(ip_network='10.0.0.0/8')
+        self.assertEqual(report['votes'], 3)
+        self.assertPurged()
+        self.assertRaises(ValueError, purge.purge_votes, 
+            ip_network='10.0.0.0/33')
+        self.assertRaises(ValueError, purge.purge_votes)
+
+    def test_dry_run(self):
+        report = purge.purge_votes(user=self.spammer, dry_run=True)
+        self.assertEqual((report['votes'], len(report['targets'])), (3, 3))
+        self.assertEqual(models.Vote.objects.count(), 6)
+        self.assertScore('main', 7, 2, 3.5, instance=self.films[0])
+
+    def test_interrupted(self):
+        # the second chunk fails: the first one is applied as a whole
+        update_trending = self.handler.update_trending
+        calls = []
+        def fail(vote, deleted=False):
+            calls.append(vote)
+            if len(calls) > 1:
+                raise ValueError
+            update_trending(vote, deleted=deleted)
+        self.handler.update_trending = fail
+        self.assertRaises(ValueError, purge.purge_votes, user=self.spammer,
+            chunk_size=1)
+        purged = calls[0].object_id
+        for film in self.films:
+            if film.pk == purged:
+                self.assertScore('main', 2, 1, 2, instance=film)
+            else:
+                self.assertScore('main', 7, 2, 3.5, instance=film)
+        self.assertEqual(models.Vote.objects.count(), 5)
+        del self.handler.update_trending
+        purge.purge_votes(user=self.spammer)
+        self.assertPurged()
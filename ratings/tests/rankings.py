@@ -0,0 +1,77 @@
+from django.core.management import call_command
+from django.contrib.auth.models import User
+
+from ratings import models, ranking
+from ratings.tests.base import RatingsTestCase
+from testapp.models import Film
+
+class RankingTest(RatingsTestCase):
+    def setUp(self):
+        super(RankingTest, self).setUp()
+        self.handler = self.register(Film)
+        self.voters = [User.objects.create_user('user%d' % i, 
+            'user%d@example.com' % i, 'secret') for i in range(10)]
+        self.films = [Film.objects.create(title='Film %d' % i) 
+            for i in range(2)]
+
+    def give_votes(self):
+        # a single top vote, and many slightly lower votes
+        self.handler.vote(None, self.make_vote(self.films[0], 5, 
+            user=self.voters[0]))
+        for voter in self.voters:
+            self.handler.vote(None, self.make_vote(self.films[1], 4, 
+                user=voter))
+
+    def get_rankings(self):
+        return [self.handler.get_score(i, 'main').ranking for i in self.films]
+
+    def test_functions(self):
+        self.assertEqual(ranking.bayesian_average(0, 0, 3, 0), 0)
+        self.assertEqual(ranking.bayesian_average(5, 1, 3, 1), 4)
+        self.assertEqual(ranking.bayesian_average(40, 10, 3, 10), 3.5)
+        self.assertEqual(ranking.wilson_lower_bound(0, 0, (1, 5)), 0)
+        self.assertTrue(1 < ranking.wilson_lower_bound(5, 1, (1, 5)) < 
+            ranking.wilson_lower_bound(40, 10, (1, 5)) < 4)
+        self.assertAlmostEqual(ranking.wilson_lower_bound(5, 1, (1, 5)),
+            1.826, 3)
+
+    def test_average(self):
+        self.give_votes()
+        self.assertEqual(self.get_rankings(), [5, 4])
+
+    def test_bayesian(self):
+        self.handler.ranking = 'bayesian'
+        self.handler.ranking_prior_votes = 2
+        self.handler.key_stats_timeout = 0
+        self.give_votes()
+        call_command('update_rankings', verbosity=0)
+        # the prior is the average of all the votes
+        prior = (5 + 40) / 11.0
+        for ranking, (total, num_votes) in zip(self.get_rankings(), 
+            [(5, 1), (40, 10)]):
+            self.assertAlmostEqual(ranking, 
+                (total + 2 * prior) / (num_votes + 2))
+
+    def test_wilson(self):
+        self.handler.ranking = 'wilson'
+        self.give_votes()
+        first, second = self.get_rankings()
+        self.assertAlmostEqual(first, 1.826, 3)
+        self.assertTrue(first < second < 4)
+
+    def test_callable(self):
+        self.handler.ranking = lambda score: score.total
+        self.give_votes()
+        self.assertEqual(self.get_rankings(), [5, 40])
+        self.handler.ranking = 'invalid'
+        self.assertRaises(ValueError, self.handler.get_ranking, 
+            self.handler.get_score(self.films[0], 'main'))
+
+    def test_update_rankings(self):
+        self.give_votes()
+        self.handler.ranking = lambda score: -score.num_votes
+        call_command('update_rankings', verbosity=0)
+        self.assertEqual(self.get_rankings(), [-1, -10])
+        self.assertEqual(list(models.Score.objects.order_by(
+            '-ranking').values_list('object_id', flat=True)), 
+            [i.pk for i in self.films])
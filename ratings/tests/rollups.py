@@ -0,0 +1,89 @@
+import datetime
+
+from django.contrib.auth.models import User
+
+from ratings import models, rollups
+from ratings.tests.base import RatingsTestCase
+from testapp.models import Film
+
+class RollupsTest(RatingsTestCase):
+    def setUp(self):
+        super(RollupsTest, self).setUp()
+        self.handler = self.register(Film, rollup_votes=True)
+        self.film = Film.objects.create(title='Film')
+        self.users = [User.objects.create_user('user%d' % i, 
+            'user%d@example.com' % i, 'secret') for i in range(4)]
+        self.votes = [self.give_vote(user, score) 
+            for user, score in zip(self.users, (2, 4, 3, 5))]
+        self.now = datetime.datetime.now()
+        self.since = self.now - datetime.timedelta(days=1)
+    
+    def give_vote(self, user, score):
+        vote = self.make_vote(self.film, score, user=user)
+        self.handler.vote(None, vote)
+        return vote
+        
+    def age(self, vote, days):
+        models.Vote.objects.filter(pk=vote.pk).update(
+            created_at=self.now - datetime.timedelta(days=days))
+        
+    def get_rollups(self):
+        return sorted(models.VoteRollup.objects.values_list('bucket_size',
+            'num_votes', 'total'))
+        
+    def test_voting(self):
+        self.assertEqual(rollups.get_window_stats(self.film, 'main', 
+            self.since), (4, 14))
+        vote = self.votes[0]
+        vote.score = 1
+        self.handler.vote(None, vote)
+        self.handler.delete(None, self.votes[1])
+        self.assertEqual(rollups.get_window_stats(self.film, 'main', 
+            self.since), (3, 9))
+        
+    def test_deleting_vote_changed_by_form(self):
+        # the vote form changes the score to 0 before deleting the vote
+        vote = models.Vote.objects.get(pk=self.votes[3].pk)
+        vote.score = 0
+        self.handler.delete(None, vote)
+        self.assertEqual(rollups.get_window_stats(self.film, 'main', 
+            self.since), (3, 9))
+        
+    def test_rebuild(self):
+        self.age(self.votes[0], 3)
+        self.age(self.votes[1], 10)
+        models.Vote.objects.filter(pk=self.votes[2].pk).delete()
+        # ranges are rebuilt one at a time
+        self.assertEqual(rollups.rebuild_rollups(chunk_size=1), 3)
+        self.assertEqual(self.get_rollups(), [(3600, 1, 2), (3600, 1, 4),
+            (3600, 1, 5)])
+        self.assertEqual(rollups.get_window_stats(self.film, 'main', 
+            self.since), (1, 5))
+        week = self.now - datetime.timedelta(days=7)
+        self.assertEqual(rollups.get_window_stats(self.film, 'main', week),
+            (2, 7))
+        
+    def test_rebuild_since(self):
+        self.age(self.votes[0], 10)
+        models.VoteRollup.objects.all().delete()
+        rollups.rebuild_rollups(chunk_size=1)
+        self.handler.delete(None, self.votes[1])
+        # votes deleted in bulk are not subtracted
+        models.Vote.objects.filter(pk=self.votes[2].pk).delete()
+        self.assertEqual(rollups.rebuild_rollups(since=self.since), 1)
+        self.assertEqual(self.get_rollups(), [(3600, 1, 2), (3600, 1, 5)])
+        
+    def test_rebuild_removes_stale_buckets(self):
+        models.Vote.objects.all().delete()
+        self.assertEqual(rollups.rebuild_rollups(), 0)
+        self.assertEqual(self.get_rollups(), [])
+        
+    def test_compact(self):
+        self.age(self.votes[0], 10)
+        self.age(self.votes[1], 10)
+        rollups.rebuild_rollups()
+        self.assertEqual(rollups.compact_rollups(now=self.now), 1)
+        self.assertEqual(self.get_rollups(), [(3600, 2, 8), (86400, 2, 6)])
+        # compacted buckets are rebuilt as a whole
+        rollups.rebuild_rollups(since=self.now - datetime.timedelta(days=10))
+        self.assertEqual(self.get_rollups(), [(3600, 2, 6), (3600, 2, 8)])
@@ -0,0 +1,67 @@
+from django.core.management import call_command
+from django.contrib.auth.models import User
+
+from ratings import models
+from ratings.tests.base import RatingsTestCase
+from testapp.models import Album
+
+class ScoreFieldsTest(RatingsTestCase):
+    def setUp(self):
+        super(ScoreFieldsTest, self).setUp()
+        self.handler = self.register(Album, counter_keys=('like',), 
+            score_fields={
+                'rating_average': ('main', 'average'),
+                'rating_count': ('like', 'num_votes'),
+            })
+        self.albums = [Album.objects.create(title='Album %d' % i) 
+            for i in range(3)]
+        self.other = User.objects.create_user('other', 'other@example.com',
+            'secret')
+    
+    def give_vote(self, album, score, user, key='main'):
+        vote = self.make_vote(album, score, key=key, user=user)
+        self.handler.vote(None, vote)
+        return vote
+        
+    def get_fields(self):
+        return list(Album.objects.order_by('pk').values_list(
+            'rating_average', 'rating_count'))
+        
+    def test_voting(self):
+        album = self.albums[0]
+        self.give_vote(album, 2, self.user)
+        vote = self.give_vote(album, 4, self.other)
+        self.give_vote(album, 1, self.user, key='like')
+        self.assertEqual(self.get_fields()[0], (3, 1))
+        vote.score = 5
+        self.handler.vote(None, vote)
+        self.assertEqual(self.get_fields()[0], (3.5, 1))
+        self.handler.delete(None, vote)
+        self.assertEqual(self.get_fields()[0], (2, 1))
+        
+    def test_deleting_last_vote(self):
+        # missing scores are stored as default values
+        vote = self.give_vote(self.albums[0], 3, self.user)
+        self.handler.delete(None, vote)
+        self.assertEqual(self.get_fields()[0], (0, 0))
+        
+    def test_update_instance(self):
+        album = self.albums[1]
+        self.give_vote(album, 4, self.user)
+        self.handler.update_score_fields(album, 'main')
+        self.assertEqual(album.rating_average, 4)
+        
+    def test_rebuild(self):
+        self.give_vote(self.albums[0], 2, self.user)
+        self.give_vote(self.albums[1], 1, self.user, key='like')
+        Album.objects.update(rating_average=5, rating_count=0)
+        self.assertEqual(self.handler.rebuild_score_fields(chunk_size=2), 3)
+        self.assertEqual(self.get_fields(), [(2, 0), (0, 1), (0, 0)])
+        # fields in sync are not repaired
+        self.assertEqual(self.handler.rebuild_score_fields(), 0)
+        
+    def test_command(self):
+        self.give_vote(self.albums[2], 3, self.user)
+        models.Score.objects.update(average=4)
+        call_command('rebuild_score_fields', verbosity=0)
+        self.assertEqual(self.get_fields()[2], (4, 0))
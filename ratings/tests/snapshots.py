@@ -0,0 +1,100 @@
+import datetime
+
+from django.contrib.auth.models import User
+from django.contrib.contenttypes.models import ContentType
+
+from ratings import models, snapshots
+from ratings.tests.base import RatingsTestCase
+from testapp.models import Film
+
+class SnapshotsTest(RatingsTestCase):
+    def setUp(self):
+        super(SnapshotsTest, self).setUp()
+        self.handler = self.register(Film)
+        self.other = User.objects.create_user('other', 'other@example.com',
+            'secret')
+        self.films = [Film.objects.create(title='Film %d' % i) 
+            for i in range(5)]
+        # averages: 4, 4.5, 4, 1.5, no votes
+        for film, scores in zip(self.films, [(4,), (4, 5), (3, 5), (1, 2)]):
+            for user, score in zip((self.user, self.other), scores):
+                self.give_vote(film, score, user)
+        self.ids = [i.pk for i in self.films]
+        self.snapshot = self.get_snapshot()
+    
+    def give_vote(self, film, score, user):
+        vote = self.make_vote(film, score, user=user)
+        self.handler.vote(None, vote)
+        return vote
+        
+    def get_snapshot(self):
+        snapshot = snapshots.ScoreSnapshot(
+            ContentType.objects.get_for_model(Film), 'main')
+        snapshot.refresh()
+        return snapshot
+        
+    def test_refresh(self):
+        self.assertEqual(len(self.snapshot), 4)
+        self.assertEqual(self.snapshot.object_ids.tolist(), self.ids[:4])
+        self.assertEqual(self.snapshot.average.tolist(), [4, 4.5, 4, 1.5])
+        self.assertEqual(self.snapshot.get(self.ids[1]), {
+            'object_id': self.ids[1], 'average': 4.5, 'num_votes': 2, 
+            'total': 9, 'ranking': 4.5})
+        self.assertEqual(self.snapshot.get(self.ids[4]), None)
+        
+    def test_incremental_refresh(self):
+        # only the scores changed since the watermark are read
+        now = datetime.datetime.now()
+        models.Score.objects.update(modified_at=now - 
+            datetime.timedelta(hours=1))
+        snapshot = self.get_snapshot()
+        models.Score.objects.update(modified_at=now - 
+            datetime.timedelta(hours=2))
+        self.give_vote(self.films[4], 3, self.user)
+        self.assertEqual(snapshot.refresh(), 1)
+        self.assertEqual(snapshot.object_ids.tolist(), self.ids)
+        self.give_vote(self.films[0], 1, self.other)
+        copy = snapshot.copy()
+        copy.refresh()
+        self.assertEqual(copy.get(self.ids[0])['average'], 2.5)
+        # the copied snapshot is not changed
+        self.assertEqual(snapshot.get(self.ids[0])['average'], 4)
+        
+    def test_filter(self):
+        snapshot = self.snapshot.filter(num_votes__gte=2, average__gt=2)
+        self.assertEqual(snapshot.object_ids.tolist(), self.ids[1:3])
+        snapshot = self.snapshot.filter(object_ids=self.ids[2:], 
+            average=4)
+        self.assertEqual(snapshot.object_ids.tolist(), [self.ids[2]])
+        self.assertRaises(ValueError, self.snapshot.filter, title='Film')
+        self.assertRaises(ValueError, self.snapshot.filter, 
+            average__in=[4])
+        
+    def test_top(self):
+        # ties are sorted by number of votes, then by object id
+        self.assertEqual(self.snapshot.top(3), [self.ids[1], self.ids[2],
+            self.ids[0]])
+        self.assertEqual(self.snapshot.top(2, order='total'), 
+            [self.ids[1], self.ids[2]])
+        self.assertEqual(self.snapshot.filter(average__gt=5).top(), [])
+        self.assertRaises(ValueError, self.snapshot.top, order='title')
+        
+    def test_percentile(self):
+        self.assertEqual(self.snapshot.percentile(50), 4)
+        self.assertEqual(self.snapshot.percentile(0), 1.5)
+        self.assertEqual(self.snapshot.percentile(100, order='num_votes'), 
+            2)
+        self.assertEqual(self.snapshot.filter(average__gt=5).percentile(50),
+            None)
+        
+    def test_handler(self):
+        snapshot = self.handler.get_snapshot('main')
+        self.assertEqual(len(snapshot), 4)
+        self.give_vote(self.films[4], 3, self.user)
+        # the snapshot is refreshed every *snapshot_refresh_interval*
+        self.assertTrue(self.handler.get_snapshot('main') is snapshot)
+        self.handler.snapshot_refresh_interval = 0
+        refreshed = self.handler.get_snapshot('main')
+        self.assertEqual(len(refreshed), 5)
+        # returned snapshots never change
+        self.assertEqual(len(snapshot), 4)
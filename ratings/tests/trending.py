@@ -0,0 +1,75 @@
+import datetime
+
+from django.db.models import F
+from django.contrib.auth.models import User
+
+from ratings import models
+from ratings.tests.base import RatingsTestCase
+from testapp.models import Film
+
+class TrendingTest(RatingsTestCase):
+    def setUp(self):
+        super(TrendingTest, self).setUp()
+        # one hour half life
+        self.handler = self.register(Film, trending_half_life=3600,
+            leaderboard_size=0)
+        self.films = [Film.objects.create(title='Film %d' % i) 
+            for i in range(2)]
+        self.users = [User.objects.create_user('user%d' % i, 
+            'user%d@example.com' % i, 'secret') for i in range(3)]
+    
+    def give_vote(self, film, user, score=3):
+        vote = self.make_vote(film, score, user=user)
+        self.handler.vote(None, vote)
+        return vote
+        
+    def get_score(self, film):
+        return models.Score.objects.get(object_id=film.pk)
+        
+    def test_voting(self):
+        for user in self.users:
+            self.give_vote(self.films[0], user)
+        score = self.get_score(self.films[0])
+        self.assertAlmostEqual(self.handler.get_trending(score), 3, places=2)
+        later = score.trending_at + datetime.timedelta(hours=2)
+        self.assertAlmostEqual(score.get_trending(3600, now=later), 0.75,
+            places=2)
+        
+    def test_changing_vote(self):
+        vote = self.give_vote(self.films[0], self.users[0])
+        trending = self.get_score(self.films[0]).trending
+        vote.score = 5
+        self.handler.vote(None, vote)
+        self.assertEqual(self.get_score(self.films[0]).trending, trending)
+        
+    def test_deleting_vote(self):
+        votes = [self.give_vote(self.films[0], user) for user in self.users]
+        self.handler.delete(None, votes[0])
+        score = self.get_score(self.films[0])
+        self.assertAlmostEqual(self.handler.get_trending(score), 2, places=2)
+        
+    def test_ordering(self):
+        for user in self.users:
+            self.give_vote(self.films[0], user)
+        self.give_vote(self.films[1], self.users[0])
+        # the votes were given three hours ago: 3 * 0.125 < 1
+        models.Score.objects.filter(object_id=self.films[0].pk).update(
+            trending_rank=F('trending_rank') - 3)
+        scores = self.handler.get_top('main', n=2, order='trending_rank')
+        self.assertEqual([i.object_id for i in scores], 
+            [self.films[1].pk, self.films[0].pk])
+        
+    def test_recalculate(self):
+        self.give_vote(self.films[0], self.users[0])
+        score = self.get_score(self.films[0])
+        # the trending value changes after the score is read
+        models.update_trending(self.films[0], 'main', 3600)
+        score.recalculate()
+        stored = self.get_score(self.films[0])
+        self.assertAlmostEqual(stored.trending, 2, places=2)
+        self.assertNotEqual(stored.trending_at, score.trending_at)
+        self.assertEqual((stored.total, stored.num_votes), (3, 1))
+        # the score is recalculated leaving trending values untouched
+        models.upsert_score(self.films[0], 'main')
+        self.assertEqual(self.get_score(self.films[0]).trending, 
+            stored.trending)
@@ -0,0 +1,35 @@
+from ratings import triggers
+from ratings.tests.base import RatingsTestCase
+
+class TriggersTest(RatingsTestCase):
+    def setUp(self):
+        super(TriggersTest, self).setUp()
+        triggers.install()
+
+    def tearDown(self):
+        triggers.remove()
+
+    def test_install_remove(self):
+        self.assertTrue(triggers.is_installed())
+        installed, missing = triggers.verify()
+        self.assertTrue(installed)
+        self.assertFalse(missing)
+        triggers.remove()
+        self.assertFalse(triggers.is_installed())
+        installed, missing = triggers.verify()
+        self.assertFalse(installed)
+        # installing again replaces existing triggers
+        triggers.install()
+        triggers.install()
+        self.assertEqual(triggers.verify()[1], [])
+
+    def test_scores(self):
+        vote = self.vote(4, user=self.user)
+        self.assertScore('main', 4, 1, 4)
+        self.vote(2, cookie='abc')
+        self.assertScore('main', 6, 2, 3)
+        vote.score = 1
+        vote.save()
+        self.assertScore('main', 3, 2, 1.5)
+        vote.delete()
+        self.assertScore('main', 2, 1, 2)
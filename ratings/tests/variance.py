@@ -0,0 +1,96 @@
+from django.contrib.auth.models import User
+
+from ratings import models
+from ratings.tests.base import RatingsTestCase
+from testapp.models import Film
+
+class ScoreStatsTest(RatingsTestCase):
+    def setUp(self):
+        super(ScoreStatsTest, self).setUp()
+        self.handler = self.register(Film)
+        self.film = Film.objects.create(title='Film')
+        self.users = [User.objects.create_user('user%d' % i, 
+            'user%d@example.com' % i, 'secret') for i in range(4)]
+        self.votes = [self.give_vote(user, score) 
+            for user, score in zip(self.users, (2, 4, 4, 5))]
+    
+    def give_vote(self, user, score):
+        vote = self.make_vote(self.film, score, user=user)
+        self.handler.vote(None, vote)
+        return vote
+        
+    def get_score(self):
+        return models.Score.objects.get(object_id=self.film.pk)
+        
+    def assertRecalculated(self):
+        # deltas give the same values as a full recalculation
+        score = self.get_score()
+        fields = ('total', 'num_votes', 'sum_squares', 'min_score', 
+            'max_score', 'average')
+        values = [getattr(score, i) for i in fields]
+        score.recalculate(commit=False)
+        self.assertEqual(values, [getattr(score, i) for i in fields])
+        
+    def test_voting(self):
+        score = self.get_score()
+        self.assertEqual((score.total, score.num_votes, score.sum_squares,
+            score.min_score, score.max_score), (15, 4, 61, 2, 5))
+        self.assertRecalculated()
+        
+    def test_changing_vote(self):
+        vote = self.votes[1]
+        vote.score = 1
+        self.handler.vote(None, vote)
+        score = self.get_score()
+        self.assertEqual((score.total, score.sum_squares, score.min_score),
+            (12, 46, 1))
+        self.assertRecalculated()
+        # the maximum vote is lowered: bounds are recalculated
+        vote = self.votes[3]
+        vote.score = 3
+        self.handler.vote(None, vote)
+        self.assertEqual(self.get_score().max_score, 4)
+        self.assertRecalculated()
+        
+    def test_deleting_votes(self):
+        # the deleted vote is the only minimum one
+        self.handler.delete(None, self.votes[0])
+        score = self.get_score()
+        self.assertEqual((score.total, score.num_votes, score.sum_squares,
+            score.min_score, score.max_score), (13, 3, 57, 4, 5))
+        self.assertRecalculated()
+        # another vote has the same score
+        self.handler.delete(None, self.votes[1])
+        self.assertEqual(self.get_score().min_score, 4)
+        self.assertRecalculated()
+        for vote in self.votes[2:]:
+            self.handler.delete(None, vote)
+        score = self.get_score()
+        self.assertEqual((score.total, score.num_votes, score.sum_squares,
+            score.min_score, score.max_score, score.average), 
+            (0, 0, 0, None, None, 0))
+        
+    def test_deleting_vote_changed_by_form(self):
+        # the vote form changes the score to 0 before deleting the vote
+        vote = models.Vote.objects.get(pk=self.votes[3].pk)
+        vote.score = 0
+        self.handler.delete(None, vote)
+        score = self.get_score()
+        self.assertEqual((score.total, score.max_score), (10, 4))
+        self.assertRecalculated()
+        
+    def test_get_stats(self):
+        stats = self.get_score().get_stats()
+        self.assertEqual((stats['num_votes'], stats['total'], 
+            stats['mean'], stats['variance'], stats['min_score'], 
+            stats['max_score']), (4, 15, 3.75, 1.1875, 2, 5))
+        self.assertAlmostEqual(stats['stddev'], 1.0897, places=4)
+        low, high = stats['confidence_interval']
+        self.assertAlmostEqual(low, 2.682, places=3)
+        self.assertAlmostEqual(high, 4.818, places=3)
+        
+    def test_get_distribution(self):
+        distribution = self.get_score().get_distribution()
+        self.assertEqual(distribution.keys(), [2, 4, 5])
+        self.assertEqual(distribution[4]['num_votes'], 2)
+        self.assertEqual(distribution[4]['percent'], 50)
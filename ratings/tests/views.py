@@ -0,0 +1,81 @@
+from django import http
+from django.utils import simplejson as json
+from django.test.client import RequestFactory
+from django.contrib.auth.models import User
+
+from ratings.views.generic import VotedByView, VotesExportView
+from ratings.tests.base import RatingsTestCase
+from testapp.models import Film
+
+class ContextView(VotedByView):
+    def render_to_response(self, context):
+        self.context = context
+        return http.HttpResponse('')
+
+
+class VotedByViewTest(RatingsTestCase):
+    def setUp(self):
+        super(VotedByViewTest, self).setUp()
+        self.handler = self.register(Film)
+        self.film = Film.objects.create(title='Film')
+        self.voters = [User.objects.create_user('user%d' % i, 
+            'user%d@example.com' % i, 'secret') for i in range(5)]
+        for i, user in enumerate(self.voters):
+            self.handler.vote(None, self.make_vote(self.film, i + 1, 
+                user=user))
+        self.user.is_staff = True
+
+    def get(self, view_class=ContextView, data=None, **options):
+        request = RequestFactory().get('/votes/', data or {})
+        request.user = self.user
+        view = view_class(queryset=Film.objects.all(), **options)
+        response = view.dispatch(request, pk=self.film.pk)
+        return getattr(view, 'context', None), response
+
+    def test_all_votes(self):
+        context, response = self.get()
+        # content objects are not retrieved from the database
+        with self.assertNumQueries(1):
+            votes = list(context['votes'])
+            self.assertEqual([i.content_object for i in votes], 
+                [self.film] * 5)
+            self.assertEqual([i.user for i in votes], self.voters)
+
+    def test_pages(self):
+        context, response = self.get(paginate_by=2, data={'page': 3})
+        self.assertTrue(context['is_paginated'])
+        self.assertEqual([i.user for i in context['votes']], 
+            [self.voters[0]])
+        self.assertEqual(context['votes'][0].content_object, self.film)
+        self.assertRaises(http.Http404, self.get, paginate_by=2, 
+            data={'page': 4})
+
+    def test_keyset_pages(self):
+        context, response = self.get(paginate_by=3, keyset_pagination=True)
+        votes = context['votes']
+        self.assertEqual([i.user for i in votes], self.voters[:1:-1])
+        context, response = self.get(paginate_by=3, keyset_pagination=True,
+            data={'before': votes.next_cursor})
+        self.assertEqual([i.user for i in context['votes']], 
+            self.voters[1::-1])
+        self.assertEqual(context['votes'].next_cursor, None)
+        self.assertRaises(http.Http404, self.get, paginate_by=3, 
+            keyset_pagination=True, data={'before': 'invalid'})
+
+    def test_export_csv(self):
+        context, response = self.get(VotesExportView)
+        rows = ''.join(response).splitlines()
+        self.assertEqual(rows[0].split(','), list(VotesExportView.fields))
+        self.assertEqual([row.split(',')[4] for row in rows[1:]],
+            [i.username for i in self.voters])
+
+    def test_export_json(self):
+        context, response = self.get(VotesExportView, format='json')
+        votes = json.loads(''.join(response))
+        self.assertEqual([(i['username'], i['score']) for i in votes],
+            [(user.username, i + 1) for i, user in enumerate(self.voters)])
+
+    def test_export_permission(self):
+        self.user.is_staff = False
+        context, response = self.get(VotesExportView)
+        self.assertEqual(response.status_code, 403)
@@ -0,0 +1,68 @@
+from django.contrib.auth.models import User
+
+from ratings import cookies
+from ratings.tests.base import RatingsTestCase
+from testapp.models import Film
+
+class HasVotedManyTest(RatingsTestCase):
+    def setUp(self):
+        super(HasVotedManyTest, self).setUp()
+        self.handler = self.register(Film, allow_anonymous=True)
+        self.films = [Film.objects.create(title='Film %d' % i) 
+            for i in range(4)]
+        self.other = User.objects.create_user('other', 'other@example.com',
+            'secret')
+        self.give_vote(self.films[0], user=self.user)
+        self.give_vote(self.films[2], user=self.user)
+        self.give_vote(self.films[1], user=self.other)
+        self.give_vote(self.films[3], key='other', user=self.user)
+
+    def give_vote(self, film, key='main', **kwargs):
+        vote = self.make_vote(film, 3, key=key, **kwargs)
+        self.handler.vote(None, vote)
+        return vote
+
+    def test_user(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(self.handler.has_voted_many(self.films, 'main',
+                self.user), set([self.films[0].pk, self.films[2].pk]))
+        self.assertEqual(self.handler.has_voted_many(self.films, 'other',
+            self.user), set([self.films[3].pk]))
+        self.assertEqual(self.handler.has_voted_many([], 'main', self.user),
+            set())
+
+    def test_cookies(self):
+        votes = [self.give_vote(film, cookie=str(i) * 40) 
+            for i, film in enumerate(self.films[:2])]
+        # the cookie of the second film is given to the first one
+        voter_cookies = {
+            cookies.get_name(self.films[0], 'main'): votes[0].cookie,
+            cookies.get_name(self.films[2], 'main'): votes[1].cookie,
+        }
+        with self.assertNumQueries(1):
+            self.assertEqual(self.handler.has_voted_many(self.films, 'main',
+                voter_cookies), set([self.films[0].pk]))
+        self.assertEqual(self.handler.has_voted_many(self.films, 'main', 
+            {}), set())
+
+    def test_voted_cache(self):
+        self.handler.voted_cache_timeout = 60
+        self.assertEqual(self.handler.has_voted_many(self.films, 'main',
+            self.user), set([self.films[0].pk, self.films[2].pk]))
+        with self.assertNumQueries(0):
+            self.assertTrue(self.handler.has_voted(self.films[0], 'main', 
+                self.user))
+            self.assertFalse(self.handler.has_voted(self.films[1], 'main', 
+                self.user))
+        # the cached ids are updated when voting
+        self.give_vote(self.films[1], user=self.user)
+        vote = self.handler.get_vote(self.films[0], 'main', self.user)
+        self.handler.delete(None, vote)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.handler.has_voted_many(self.films, 'main',
+                self.user), set([self.films[1].pk, self.films[2].pk]))
+        # other users and keys are cached separately
+        self.assertEqual(self.handler.has_voted_many(self.films, 'main',
+            self.other), set([self.films[1].pk]))
+        self.assertEqual(list(self.handler.get_voted_ids('other', 
+            self.user)), [self.films[3].pk])
@@ -0,0 +1,75 @@
+from django.test.client import RequestFactory
+from django.contrib.auth.models import AnonymousUser
+
+from ratings import models, views, cookies
+from ratings.forms import VoteForm
+from ratings.tests.base import RatingsTestCase
+from testapp.models import Film
+
+class VoterCookieTest(RatingsTestCase):
+    def setUp(self):
+        super(VoterCookieTest, self).setUp()
+        self.handler = self.register(Film, allow_anonymous=True,
+            voter_cookie_name='voter')
+        self.films = [Film.objects.create(title='Film %d' % i) 
+            for i in range(2)]
+
+    def post(self, score, instance, cookies=None):
+        """
+        Post an anonymous vote to the voting view, returning the response.
+        """
+        data = dict(VoteForm(instance, 'main').initial, score=score)
+        request = RequestFactory().post('/vote/', data,
+            HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        request.user = AnonymousUser()
+        request.COOKIES.update(cookies or {})
+        return views.vote(request)
+
+    def get_cookies(self, response):
+        return dict((name, morsel.value) 
+            for name, morsel in response.cookies.items())
+
+    def test_signed_value(self):
+        value = cookies.get_voter_value('abc')
+        self.assertEqual(cookies.get_voter({'voter': value}, 'voter'), 'abc')
+        for tampered in ('abc', 'abd:' + value.split(':')[1], 'abc:x'):
+            self.assertEqual(cookies.get_voter({'voter': tampered}, 'voter'),
+                None)
+        self.assertEqual(cookies.get_voter({}, 'voter'), None)
+
+    def test_shared_cookie(self):
+        response = self.post(3, self.films[0])
+        voter_cookies = self.get_cookies(response)
+        # no cookie is set for the voted object
+        self.assertEqual(voter_cookies.keys(), ['voter'])
+        voter = cookies.get_voter(voter_cookies, 'voter')
+        self.post(4, self.films[1], voter_cookies)
+        self.post(5, self.films[0], voter_cookies)
+        # the votes of the voter share the cookie
+        self.assertEqual(sorted(models.Vote.objects.values_list(
+            'object_id', 'cookie', 'score')), [
+                (self.films[0].pk, voter, 5), (self.films[1].pk, voter, 4)])
+        for film in self.films:
+            self.assertTrue(self.handler.has_voted(film, 'main', 
+                voter_cookies))
+        self.assertEqual(self.handler.get_vote(self.films[0], 'main', 
+            voter_cookies).score, 5)
+
+    def test_tampered_cookie(self):
+        voter_cookies = self.get_cookies(self.post(3, self.films[0]))
+        tampered = {'voter': 'x' + voter_cookies['voter']}
+        self.assertFalse(self.handler.has_voted(self.films[0], 'main', 
+            tampered))
+        self.post(4, self.films[0], tampered)
+        self.assertEqual(models.Vote.objects.count(), 2)
+
+    def test_object_cookie(self):
+        # votes given before the voter cookie keep their own cookie
+        cookie_name = cookies.get_name(self.films[0], 'main')
+        vote = self.make_vote(self.films[0], 3, cookie='a' * 40)
+        vote.save()
+        response = self.post(5, self.films[0], {cookie_name: vote.cookie})
+        self.assertEqual(self.get_cookies(response), 
+            {cookie_name: vote.cookie})
+        self.assertEqual(list(models.Vote.objects.values_list(
+            'cookie', 'score')), [(vote.cookie, 5)])
@@ -0,0 +1,249 @@
+"""
+Database triggers maintaining scores.
+
+When the triggers are installed, each INSERT, UPDATE or DELETE on the votes
+table updates the related score row in the database itself: this way
+scores are kept in sync even if other systems write votes directly to the
+votes table, and rating handlers do not recalculate scores after voting.
+
+Triggers are available for SQLite and PostgreSQL databases, and can be
+installed, verified and removed using the *score_triggers* management
+command. Note that the weight used by triggers to calculate the average
+score is the one given when the triggers are installed, and that triggers
+store the average score as ranking: handlers using other rankings update
+them after voting. Triggers update the sum of the squares of the votes,
+while the minimum and maximum votes are only widened: they are exact again
+after the score is recalculated. Key statistics (see 
+*ratings.models.KeyStats*) are not updated by triggers: rebuild them
+periodically using the *rebuild_key_stats* command.
+"""
+import string
+
+from django.db import connections, transaction, DEFAULT_DB_ALIAS
+
+from ratings import settings, models, exceptions
+
+TRIGGER_NAMES = {
+    'sqlite': ('ratings_vote_insert', 'ratings_vote_update',
+        'ratings_vote_delete'),
+    'postgresql': ('ratings_vote_score',),
+}
+
+# score changes, shared by all the dialects
+
+ADD_VOTE = """
+UPDATE ${score_table} SET
+    ${total} = ${total} + NEW.${score},
+    ${num_votes} = ${num_votes} + 1,
+    ${average} = (${total} + NEW.${score}) / (${num_votes} + 1 + ${weight}),
+    ${ranking} = (${total} + NEW.${score}) / (${num_votes} + 1 + ${weight}),
+    ${sum_squares} = ${sum_squares} + NEW.${score} * NEW.${score},
+    ${min_score} = CASE WHEN ${min_score} IS NULL OR NEW.${score} < ${min_score}
+        THEN NEW.${score} ELSE ${min_score} END,
+    ${max_score} = CASE WHEN ${max_score} IS NULL OR NEW.${score} > ${max_score}
+        THEN NEW.${score} ELSE ${max_score} END,
+    ${modified_at} = ${now}
+WHERE ${content_type_id} = NEW.${content_type_id} AND
+    ${object_id} = NEW.${object_id} AND ${key} = NEW.${key};
+"""
+
+REMOVE_VOTE = """
+UPDATE ${score_table} SET
+    ${total} = ${total} - OLD.${score},
+    ${num_votes} = ${num_votes} - 1,
+    ${average} = CASE WHEN ${num_votes} > 1
+        THEN (${total} - OLD.${score}) / (${num_votes} - 1 + ${weight})
+        ELSE 0 END,
+    ${ranking} = CASE WHEN ${num_votes} > 1
+        THEN (${total} - OLD.${score}) / (${num_votes} - 1 + ${weight})
+        ELSE 0 END,
+    ${sum_squares} = CASE WHEN ${num_votes} > 1
+        THEN ${sum_squares} - OLD.${score} * OLD.${score} ELSE 0 END,
+    ${min_score} = CASE WHEN ${num_votes} > 1 THEN ${min_score} ELSE NULL END,
+    ${max_score} = CASE WHEN ${num_votes} > 1 THEN ${max_score} ELSE NULL END,
+    ${modified_at} = ${now}
+WHERE ${content_type_id} = OLD.${content_type_id} AND
+    ${object_id} = OLD.${object_id} AND ${key} = OLD.${key};
+"""
+
+# SQLite
+
+SQLITE_CREATE_SCORE = """
+INSERT OR IGNORE INTO ${score_table}
+    (${content_type_id}, ${object_id}, ${key}, ${average}, ${total}, ${num_votes},
+    ${ranking}, ${sum_squares}, ${trending}, ${trending_rank})
+VALUES (NEW.${content_type_id}, NEW.${object_id}, NEW.${key}, 0, 0, 0, 0, 0, 0, 0);
+"""
+
+SQLITE_INSTALL = (
+    """
+    CREATE TRIGGER ratings_vote_insert AFTER INSERT ON ${vote_table}
+    FOR EACH ROW BEGIN %s %s END;
+    """ % (SQLITE_CREATE_SCORE, ADD_VOTE),
+    """
+    CREATE TRIGGER ratings_vote_update
+    AFTER UPDATE OF ${score}, ${content_type_id}, ${object_id}, ${key}
+    ON ${vote_table}
+    FOR EACH ROW BEGIN %s %s %s END;
+    """ % (REMOVE_VOTE, SQLITE_CREATE_SCORE, ADD_VOTE),
+    """
+    CREATE TRIGGER ratings_vote_delete AFTER DELETE ON ${vote_table}
+    FOR EACH ROW BEGIN %s END;
+    """ % REMOVE_VOTE,
+)
+
+SQLITE_REMOVE = (
+    "DROP TRIGGER IF EXISTS ratings_vote_insert;",
+    "DROP TRIGGER IF EXISTS ratings_vote_update;",
+    "DROP TRIGGER IF EXISTS ratings_vote_delete;",
+)
+
+SQLITE_VERIFY = """
+SELECT name FROM sqlite_master WHERE type = 'trigger' AND tbl_name = '${table}'
+"""
+
+# PostgreSQL
+
+POSTGRESQL_INSTALL = (
+    """
+    CREATE OR REPLACE FUNCTION ratings_vote_score() RETURNS trigger AS $$$$
+    BEGIN
+        IF TG_OP IN ('UPDATE', 'DELETE') THEN
+            %s
+        END IF;
+        IF TG_OP IN ('INSERT', 'UPDATE') THEN
+            INSERT INTO ${score_table}
+                (${content_type_id}, ${object_id}, ${key},
+                ${average}, ${total}, ${num_votes}, ${ranking}, ${sum_squares},
+                ${trending}, ${trending_rank})
+            VALUES (NEW.${content_type_id}, NEW.${object_id}, NEW.${key},
+                0, 0, 0, 0, 0, 0, 0)
+            ON CONFLICT DO NOTHING;
+            %s
+        END IF;
+        RETURN NULL;
+    END;
+    $$$$ LANGUAGE plpgsql;
+    """ % (REMOVE_VOTE, ADD_VOTE),
+    """
+    CREATE TRIGGER ratings_vote_score
+    AFTER INSERT OR DELETE OR
+        UPDATE OF ${score}, ${content_type_id}, ${object_id}, ${key}
+    ON ${vote_table}
+    FOR EACH ROW EXECUTE PROCEDURE ratings_vote_score();
+    """,
+)
+
+POSTGRESQL_REMOVE = (
+    "DROP TRIGGER IF EXISTS ratings_vote_score ON ${vote_table};",
+    "DROP FUNCTION IF EXISTS ratings_vote_score();",
+)
+
+POSTGRESQL_VERIFY = """
+SELECT tgname FROM pg_trigger
+WHERE tgrelid = '${table}'::regclass AND NOT tgisinternal
+"""
+
+# the current local time, in the format used by Django (percent signs are
+# doubled, since statements go through the query formatting of Django)
+NOW = {
+    'sqlite': "strftime('%%Y-%%m-%%d %%H:%%M:%%f', 'now', 'localtime')",
+    'postgresql': 'LOCALTIMESTAMP',
+}
+
+STATEMENTS = {
+    'sqlite': (SQLITE_INSTALL, SQLITE_REMOVE, SQLITE_VERIFY),
+    'postgresql': (POSTGRESQL_INSTALL, POSTGRESQL_REMOVE, POSTGRESQL_VERIFY),
+}
+
+_installed_cache = {}
+
+def _get_statements(connection):
+    """
+    Return a sequence *(install, remove, verify)* of the statements
+    for the dialect of the given *connection*.
+    """
+    try:
+        return STATEMENTS[connection.vendor]
+    except KeyError:
+        raise exceptions.UnsupportedDatabase(
+            'Score triggers are not available for %s' % connection.vendor)
+
+def _get_mapping(connection, weight):
+    """
+    Return the mapping used to substitute table and column names
+    in trigger statements.
+    """
+    qn = connection.ops.quote_name
+    mapping = {
+        'score_table': qn(models.Score._meta.db_table),
+        'vote_table': qn(models.Vote._meta.db_table),
+        'table': models.Vote._meta.db_table,
+        'weight': repr(float(weight)),
+        'now': NOW.get(connection.vendor),
+    }
+    for name in ('content_type_id', 'object_id', 'score',
+        'average', 'total', 'num_votes', 'ranking', 'sum_squares', 
+        'min_score', 'max_score', 'trending', 'trending_rank', 'modified_at'):
+        mapping[name] = qn(name)
+    mapping['key'] = qn(models.Vote._meta.get_field('key').column)
+    return mapping
+
+def install(using=DEFAULT_DB_ALIAS, weight=settings.WEIGHT):
+    """
+    Install the triggers maintaining scores in the database *using*.
+    The given *weight* is used to calculate the average score.
+    Existing triggers are replaced.
+    """
+    remove(using)
+    connection = connections[using]
+    statements = _get_statements(connection)[0]
+    mapping = _get_mapping(connection, weight)
+    cursor = connection.cursor()
+    for statement in statements:
+        cursor.execute(string.Template(statement).substitute(mapping))
+    transaction.commit_unless_managed(using=using)
+    _installed_cache[using] = True
+
+def remove(using=DEFAULT_DB_ALIAS):
+    """
+    Remove the triggers maintaining scores from the database *using*.
+    """
+    connection = connections[using]
+    statements = _get_statements(connection)[1]
+    mapping = _get_mapping(connection, 0)
+    cursor = connection.cursor()
+    for statement in statements:
+        cursor.execute(string.Template(statement).substitute(mapping))
+    transaction.commit_unless_managed(using=using)
+    _installed_cache[using] = False
+
+def verify(using=DEFAULT_DB_ALIAS):
+    """
+    Return a sequence *(installed, missing)* of the names of the triggers
+    present and missing in the database *using*.
+    """
+    connection = connections[using]
+    statement = _get_statements(connection)[2]
+    mapping = _get_mapping(connection, 0)
+    cursor = connection.cursor()
+    cursor.execute(string.Template(statement).substitute(mapping))
+    existing = set(row[0] for row in cursor.fetchall())
+    names = TRIGGER_NAMES[connection.vendor]
+    installed = [i for i in names if i in existing]
+    missing = [i for i in names if i not in existing]
+    return installed, missing
+
+def is_installed(using=DEFAULT_DB_ALIAS):
+    """
+    Return True if scores are maintained by triggers in the database *using*.
+    The result is cached: running processes do not notice triggers
+    installed or removed by other processes.
+    """
+    if using not in _installed_cache:
+        try:
+            installed, missing = verify(using)
+        except exceptions.UnsupportedDatabase:
+            missing = True
+        _installed_cache[using] = not missing
+    return _installed_cache[using]
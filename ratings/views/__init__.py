@@ -30,6 +30,11 @@ def vote(request, extra_context=None, form_class=None, using=None):
         except model.DoesNotExist:
             return http.HttpResponseBadRequest('Invalid target object.')
         
+        # a retried request gets the response already given
+        response = handler.get_cached_response(request, target_object, key)
+        if response is not None:
+            return response
+        
         # validating the rating key
         if not handler.allow_key(request, target_object, key):
             return http.HttpResponseBadRequest('Invalid key.')
@@ -75,6 +80,10 @@ def vote(request, extra_context=None, form_class=None, using=None):
                 signals.vote_was_deleted.send(sender=vote.__class__, 
                     vote=vote, request=request)
             
+            elif not (handler.has_changed(vote) or handler.signal_unchanged_votes):
+                # the same vote was submitted again: nothing to do
+                pass
+            
             else:
                                 
                 # pre-vote signal: receivers can stop the vote process
@@ -100,7 +109,9 @@ def vote(request, extra_context=None, form_class=None, using=None):
                     vote=vote, request=request, created=created)
         
             # vote is saved or deleted: redirect
-            return handler.success_response(request, vote, created, deleted)
+            response = handler.success_response(request, vote, created, deleted)
+            handler.cache_response(request, target_object, key, response)
+            return response
         
         # form is not valid: must handle errors
         return handler.failure_response(request, form.errors)
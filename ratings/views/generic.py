@@ -2,62 +2,226 @@
 Class based generic views.
 These views are only available if you are using Django >= 1.3.
 """
+import csv
+from cStringIO import StringIO
+
+from django import http
+from django.core.paginator import Paginator, InvalidPage
+from django.utils import simplejson as json
 from django.views.generic.detail import DetailView
 
+from ratings import managers, models
 from ratings.handlers import ratings
 
+class VotesWithObject(managers.QuerysetWithContents):
+    """
+    Wrapper of a queryset of the votes given to *content_object*, setting
+    it as the content object of each vote without querying the database.
+    """
+    def __init__(self, queryset, content_object, **kwargs):
+        super(VotesWithObject, self).__init__(queryset, **kwargs)
+        self.content_object = content_object
+
+    def _clone(self, queryset):
+        return self.__class__(queryset, self.content_object,
+            chunk_size=self.chunk_size, keep_orphans=self.keep_orphans)
+
+    def __getitem__(self, key):
+        if isinstance(key, slice) or (self._result_cache is not None and
+            self._iter is None):
+            return super(VotesWithObject, self).__getitem__(key)
+        vote = self.queryset[key]
+        vote._content_object_cache = self.content_object
+        return vote
+
+    def iterator(self):
+        for vote in self.queryset.iterator():
+            vote._content_object_cache = self.content_object
+            yield vote
+
 class VotedByView(DetailView):
     """
     Can be used to render a list of users that voted a given object.
 
     For example, you can add in your *urls.py* a view displaying all
     users that voted a single active article::
-    
+
         from ratings.views.generic import VotedByView
-        
+
         urlpatterns = patterns('',
             url(r'^(?P<slug>[-\w]+)/votes/$', VotedByView.as_view(
                 queryset=Article.objects.filter(is_active=True)),
                 name="article_voted_by"),
         )
-        
+
     Two context variables will be present in the template:
         - *object*: the voted article
         - *votes*: all the Vote instances for that article
-        
+
     The default template suffix is ``'_voted_by'``, and so the template
     used in our example is ``article_voted_by.html``.
+
+    Objects with a lot of votes should be displayed using pages:
+    set *paginate_by* to the number of votes in a page, e.g.::
+
+        VotedByView.as_view(queryset=Article.objects.all(), paginate_by=50)
+
+    By default the page number is taken from the *page* querystring key,
+    and the usual *paginator*, *page_obj* and *is_paginated* variables
+    are added to the context.
+    If *keyset_pagination* is True, votes are displayed newest first and
+    the page is selected by the cursor in the *before* querystring key:
+    this way deep pages are as fast as the first one. In this case *votes*
+    has a *next_cursor* attribute, the cursor of the next page.
     """
     select_related = 'user'
     context_votes_name = 'votes'
     template_name_suffix = '_voted_by'
-    
+    paginate_by = None
+    keyset_pagination = False
+    page_kwarg = 'page'
+    cursor_kwarg = 'before'
+
     def get_context_votes_name(self, obj):
         """
         Get the name to use for the votes.
         """
         return self.context_votes_name
-        
+
     def get_votes(self, obj, request):
         """
         Return a queryset of votes given to *obj*.
+        The content object of the votes is not retreived from the database,
+        since it is *obj* itself.
         """
-        queryset = self.handler.get_votes_for(obj)
+        queryset = models.Vote.objects.filter_for(obj)
         if self.select_related:
             queryset = queryset.select_related(self.select_related)
         return queryset
-        
+
+    def paginate_votes(self, votes, request):
+        """
+        Return a sequence *(votes, context)*, where *votes* are the votes
+        in the current page, and *context* is a dict of pagination
+        related context variables.
+        Raise *Http404* if the page does not exist.
+        """
+        if self.keyset_pagination:
+            try:
+                page = managers.get_page(votes, self.paginate_by,
+                    request.GET.get(self.cursor_kwarg))
+            except ValueError:
+                raise http.Http404('Invalid cursor.')
+            return page, {}
+        if not votes.ordered:
+            votes = votes.order_by('-modified_at', '-id')
+        paginator = Paginator(votes, self.paginate_by)
+        try:
+            page = paginator.page(request.GET.get(self.page_kwarg, 1))
+        except InvalidPage:
+            raise http.Http404('Invalid page.')
+        context = {
+            'paginator': paginator,
+            'page_obj': page,
+            'is_paginated': page.has_other_pages(),
+        }
+        return page.object_list, context
+
     def get(self, request, **kwargs):
         self.object = self.get_object()
         self.handler = ratings.get_handler(self.object)
         self.votes = self.get_votes(self.object, request)
-        kwargs = {
+        kwargs = {}
+        if self.paginate_by:
+            self.votes, kwargs = self.paginate_votes(self.votes, request)
+            for vote in self.votes:
+                vote._content_object_cache = self.object
+        else:
+            self.votes = VotesWithObject(self.votes, self.object)
+        kwargs.update({
             'object': self.object,
             self.get_context_votes_name(self.object): self.votes,
-        }
+        })
         context = self.get_context_data(**kwargs)
         response = self.render_to_response(context)
         # FIXME: try to avoid this workaround
         if hasattr(response, 'render') and callable(response.render):
             response.render()
         return response
+
+
+class VotesExportView(VotedByView):
+    """
+    Stream all the votes given to an object as CSV or JSON, e.g.::
+
+        from ratings.views.generic import VotesExportView
+
+        urlpatterns = patterns('',
+            url(r'^(?P<slug>[-\w]+)/votes.csv$', VotesExportView.as_view(
+                queryset=Article.objects.all()),
+                name="article_votes_export"),
+            url(r'^(?P<slug>[-\w]+)/votes.json$', VotesExportView.as_view(
+                queryset=Article.objects.all(), format='json'),
+                name="article_votes_export_json"),
+        )
+
+    Votes are read from the database and sent to the client in chunks,
+    so that objects with a lot of votes can be exported without loading
+    all the votes in memory.
+
+    By default, only staff members can export votes: override
+    *has_permission* to change this behaviour.
+    """
+    format = 'csv'
+    fields = ('id', 'key', 'score', 'user_id', 'username', 'ip_address',
+        'created_at', 'modified_at')
+
+    def has_permission(self, request):
+        """
+        Return True if the current user can export votes.
+        """
+        return request.user.is_staff
+
+    def get_values(self, vote):
+        """
+        Return a sequence of the values of *vote* to export
+        (see *fields*).
+        """
+        username = vote.user.username if vote.user_id else None
+        return (vote.id, vote.key, vote.score, vote.user_id, username,
+            vote.ip_address, vote.created_at.isoformat(),
+            vote.modified_at.isoformat())
+
+    def get_csv(self, votes):
+        buffer = StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(self.fields)
+        for vote in votes:
+            writer.writerow([unicode(i).encode('utf-8') if i is not None
+                else '' for i in self.get_values(vote)])
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+        yield buffer.getvalue()
+
+    def get_json(self, votes):
+        yield '['
+        separator = ''
+        for vote in votes:
+            yield separator + json.dumps(dict(zip(self.fields,
+                self.get_values(vote))))
+            separator = ','
+        yield ']'
+
+    def get(self, request, **kwargs):
+        if not self.has_permission(request):
+            return http.HttpResponseForbidden('Forbidden.')
+        self.object = self.get_object()
+        votes = self.get_votes(self.object, request).order_by('id').iterator()
+        if self.format == 'json':
+            return http.HttpResponse(self.get_json(votes),
+                content_type='application/json')
+        response = http.HttpResponse(self.get_csv(votes),
+            content_type='text/csv')
+        response['Content-Disposition'] = 'attachment; filename=votes.csv'
+        return response
@@ -6,10 +6,11 @@ sys.path.append('..')
 backup = os.environ.get('DJANGO_SETTINGS_MODULE', '')
 os.environ['DJANGO_SETTINGS_MODULE'] = 'settings'
 
-from django.test.simple import run_tests
+from django.test.simple import DjangoTestSuiteRunner
 
 if __name__ == "__main__":
-    failures = run_tests(['ratings',], verbosity=1)
+    failures = DjangoTestSuiteRunner(verbosity=1,
+        failfast=False).run_tests(['ratings',])
     if failures:
         sys.exit(failures)
     os.environ['DJANGO_SETTINGS_MODULE'] = backup
@@ -1,6 +1,15 @@
-DATABASE_ENGINE = 'sqlite3'
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': 'ratings.db',
+    }
+}
 ROOT_URLCONF = ''
 SITE_ID = 1
+SECRET_KEY = 'ratings-tests'
 INSTALLED_APPS = (
+    'django.contrib.contenttypes',
+    'django.contrib.auth',
     'ratings',
+    'testapp',
 )
@@ -0,0 +1,16 @@
+from django.db import models
+
+from ratings.models import RatedModel
+
+class Film(RatedModel):
+    title = models.CharField(max_length=32)
+
+
+class Book(models.Model):
+    title = models.CharField(max_length=32)
+
+
+class Album(models.Model):
+    title = models.CharField(max_length=32)
+    rating_average = models.FloatField(default=0)
+    rating_count = models.PositiveIntegerField(default=0)